@@ -0,0 +1,198 @@
+"""
+Microbenchmarks del hot path CPU del webhook (sin red): payload WS22, envelope SOAP,
+parseo de respuestas, búsqueda por localname, contenido de la guía y codec JSON de Odoo.
+
+    python benchmarks/bench_hotpath.py                  # compara contra benchmarks/baseline.json
+    python benchmarks/bench_hotpath.py --save-baseline  # guarda la corrida como baseline
+    python benchmarks/bench_hotpath.py --filter envelope --threshold 0.10
+
+Sale con código 1 si algún caso es más lento que el baseline por encima del umbral y con
+código 2 si no hay baseline. benchmarks/baseline.json está versionado (referencia del repo);
+como los tiempos dependen de la máquina, para comparar en otro equipo se guarda uno propio
+con BENCH_BASELINE=/ruta/baseline.json o --baseline.
+"""
+import os
+import sys
+import json
+import time
+import timeit
+import logging
+import argparse
+import platform
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+AQUI = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.dirname(AQUI))
+
+# El webhook se importa sin hilos de fondo ni escrituras a disco
+os.environ.setdefault("SERVI_URL_QA", "http://127.0.0.1:9/ws22")
+os.environ["WARMUP_ENABLED"] = "false"
+os.environ["SETTINGS_WATCH_INTERVAL"] = "0"
+os.environ["SOAP_ARCHIVE_ENABLED"] = "false"
+os.environ["LABEL_CACHE_WARMUP"] = "0"
+os.environ["QUOTE_PRECOMPUTE_TOP"] = "0"
+os.environ["PROFILE_DIR"] = ""
+
+import fixtures  # noqa: E402
+import json_codec  # noqa: E402
+import servientrega_ws22  # noqa: E402
+import webhook_servientrega_ws22 as webhook  # noqa: E402
+
+BASELINE = os.getenv("BENCH_BASELINE") or os.path.join(AQUI, "baseline.json")
+BENCH_THRESHOLD = float(os.getenv("BENCH_THRESHOLD", "0.15"))
+CONTENIDO = "Camiseta Algodón, Pantalón Drill, Zapato Deportivo"
+
+
+def casos() -> List[Tuple[str, Callable[[], Any]]]:
+    """(nombre, función sin argumentos). Los datos se arman antes de medir."""
+    out: List[Tuple[str, Callable[[], Any]]] = []
+    ws22 = servientrega_ws22.Ws22Client(
+        "http://127.0.0.1:9/ws22", "usuario", "clave", "SER123456", name="bench"
+    )
+
+    for n in (1, 10, 100, 500):
+        picking, partner = fixtures.picking(n), fixtures.partner(n)
+        paquetes = fixtures.paquetes(n)
+        out.append(
+            (
+                f"payload/paquetes-{n}",
+                lambda p=picking, r=partner, k=paquetes: webhook.construir_payload_ws22(
+                    p, r, valor_real=250000, contenido=CONTENIDO, paquetes_info=k
+                ),
+            )
+        )
+        envio = webhook.construir_payload_ws22(
+            picking, partner, valor_real=250000, contenido=CONTENIDO, paquetes_info=paquetes
+        )["envios"][0]
+        out.append((f"envelope/paquetes-{n}", lambda e=envio: webhook.construir_envelope_ws22(e, ws22)))
+
+    for n in (5, 50, 500):
+        moves = fixtures.moves(n)
+        out.append((f"contenido/moves-{n}", lambda m=moves: webhook.derivar_contenido(m)))
+
+    ok_xml = fixtures.respuesta_ok()
+    out.append(("parse/ok", lambda x=ok_xml: webhook.parsear_respuesta_ws22_xml(x)))
+    for n in (50, 2000):
+        err_xml = fixtures.respuesta_errores(n)
+        out.append((f"parse/errores-{n}", lambda x=err_xml: webhook.parsear_respuesta_ws22_xml(x)))
+        # Peor caso de la búsqueda: recorre todo el árbol sin encontrar la guía
+        root = servientrega_ws22._parse_xml(err_xml)
+        out.append(
+            (
+                f"localname/sin-guia-{n}",
+                lambda r=root: servientrega_ws22._find_first_text_by_localname(
+                    r, ["Num_Guia_Inexistente", "NumeroGuia"]
+                ),
+            )
+        )
+
+    for mb in (1, 8):
+        sticker = fixtures.respuesta_sticker(mb)
+        out.append(
+            (
+                f"localname/sticker-{mb}mb",
+                lambda x=sticker: servientrega_ws22._find_first_text_by_localname(
+                    servientrega_ws22._parse_xml(x), ["bytesReport"]
+                ),
+            )
+        )
+    # Cada codec disponible (stdlib siempre; orjson si está instalado) sobre los mismos datos
+    read, adjunto = fixtures.rpc_read(), fixtures.rpc_adjunto(4)
+    masivo = fixtures.respuesta_search_read(500)
+    for nombre, codec in json_codec.disponibles().items():
+        adjunto_bytes, masivo_bytes = codec.dumps(adjunto), codec.dumps(masivo)
+        out.append((f"json/{nombre}/dumps-read", lambda c=codec, o=read: c.dumps(o)))
+        out.append((f"json/{nombre}/dumps-adjunto-4mb", lambda c=codec, o=adjunto: c.dumps(o)))
+        out.append((f"json/{nombre}/loads-adjunto-4mb", lambda c=codec, b=adjunto_bytes: c.loads(b)))
+        out.append((f"json/{nombre}/loads-search_read-500", lambda c=codec, b=masivo_bytes: c.loads(b)))
+    return out
+
+
+def medir(fn: Callable[[], Any], repeticiones: int, min_segundos: float) -> float:
+    """Segundos por llamada: mínimo de `repeticiones` lotes de al menos `min_segundos`."""
+    timer = timeit.Timer(fn)
+    numero = 1
+    while True:
+        if timer.timeit(numero) >= min_segundos:
+            break
+        numero *= 2
+    return min(timer.repeat(repeat=repeticiones, number=numero)) / numero
+
+
+def _fmt(segundos: float) -> str:
+    if segundos >= 1e-3:
+        return f"{segundos * 1e3:9.2f} ms"
+    return f"{segundos * 1e6:9.1f} µs"
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Benchmarks del hot path WS22")
+    parser.add_argument("--baseline", default=BASELINE)
+    parser.add_argument("--save-baseline", action="store_true")
+    parser.add_argument("--threshold", type=float, default=BENCH_THRESHOLD, help="0.15 = 15%% más lento")
+    parser.add_argument("--filter", help="solo casos cuyo nombre contenga este texto")
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--min-time", type=float, default=0.2, help="segundos mínimos por lote")
+    args = parser.parse_args(argv)
+
+    # Se mide CPU, no la salida de logs
+    logging.disable(logging.CRITICAL)
+
+    base: Dict[str, float] = {}
+    if not args.save_baseline and os.path.exists(args.baseline):
+        with open(args.baseline, encoding="utf-8") as fh:
+            base = json.load(fh).get("resultados", {})
+
+    resultados: Dict[str, float] = {}
+    regresiones = []
+    for nombre, fn in casos():
+        if args.filter and args.filter not in nombre:
+            continue
+        t = medir(fn, args.repeat, args.min_time)
+        resultados[nombre] = t
+        linea = f"{nombre:38s} {_fmt(t)}"
+        if nombre in base:
+            ratio = t / base[nombre]
+            marca = ""
+            if ratio > 1 + args.threshold:
+                marca = "  ⚠️ REGRESIÓN"
+                regresiones.append(nombre)
+            linea += f"   baseline {_fmt(base[nombre])}   x{ratio:5.2f}{marca}"
+        elif base:
+            linea += "   (sin baseline)"
+        print(linea, flush=True)
+
+    if args.save_baseline:
+        datos = {"resultados": {}}
+        if args.filter and os.path.exists(args.baseline):
+            # Con --filter solo se actualizan los casos medidos
+            with open(args.baseline, encoding="utf-8") as fh:
+                datos = json.load(fh)
+        datos["resultados"].update(resultados)
+        datos.update(
+            {
+                "creado": time.strftime("%Y-%m-%dT%H:%M:%S"),
+                "python": platform.python_version(),
+                "maquina": platform.platform(),
+            }
+        )
+        with open(args.baseline, "w", encoding="utf-8") as fh:
+            json.dump(datos, fh, indent=2, sort_keys=True)
+            fh.write("\n")
+        print(f"💾 Baseline guardado en {args.baseline}")
+        return 0
+
+    if not base:
+        print(f"❌ Sin baseline en {args.baseline}: ejecutar con --save-baseline para guardar esta corrida")
+        return 2
+    sin_medir = [n for n in base if n not in resultados and not (args.filter and args.filter not in n)]
+    if sin_medir:
+        print(f"ℹ️ Casos del baseline que no se midieron: {', '.join(sin_medir)}")
+    if regresiones:
+        print(f"❌ {len(regresiones)} regresiones (> {args.threshold:.0%}): {', '.join(regresiones)}")
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
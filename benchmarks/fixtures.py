@@ -0,0 +1,192 @@
+"""
+Fixtures sintéticas pero realistas para los benchmarks del hot path WS22.
+Deterministas (semilla fija): la misma corrida produce los mismos datos.
+"""
+import base64
+import random
+from typing import Any, Dict, List
+
+SEMILLA = 20240611
+
+PRODUCTOS = [
+    "Camiseta Algodón Manga Corta Talla M Azul",
+    "Pantalón Drill Slim Fit Talla 32",
+    "Zapato Deportivo Running Malla Negro 41",
+    "Audífonos Inalámbricos Bluetooth 5.3 Cancelación Ruido",
+    "Cargador USB-C Carga Rápida 65W",
+    "Morral Antirrobo Impermeable 25L Gris",
+    "Termo Acero Inoxidable 1L Doble Pared",
+    "Mouse Ergonómico Vertical Recargable",
+    "Cable HDMI 2.1 8K Trenzado 2m",
+    "Lámpara LED Escritorio Brazo Flexible",
+]
+CIUDADES = [
+    ("Medellín", "Antioquia"),
+    ("Bogotá", "Bogotá D.C."),
+    ("Cali", "Valle del Cauca"),
+    ("Barranquilla", "Atlántico"),
+    ("Bucaramanga", "Santander"),
+]
+
+TEM = "http://tempuri.org/"
+
+
+def picking(n_moves: int = 5) -> Dict[str, Any]:
+    return {
+        "id": 241,
+        "name": "WH/OUT/00241",
+        "state": "done",
+        "carrier_tracking_ref": False,
+        "weight": round(1.5 * max(n_moves, 1), 2),
+        "shipping_weight": 0.0,
+        "partner_id": [77, "Cliente Prueba"],
+        "move_ids": list(range(1000, 1000 + n_moves)),
+        "carrier_id": [3, "Servientrega Nacional"],
+    }
+
+
+def partner(idx: int = 0) -> Dict[str, Any]:
+    ciudad, depto = CIUDADES[idx % len(CIUDADES)]
+    return {
+        "id": 77 + idx,
+        "name": "Distribuidora El Progreso S.A.S.",
+        "street": "Calle 10 # 43A-25 Oficina 502",
+        "city": ciudad,
+        "state_id": [600 + idx, f"{depto} (CO)"],
+        "phone": "+57 604 444 1234",
+        "mobile": "3001234567",
+        "vat": "900123456-7",
+    }
+
+
+def moves(n: int) -> List[Dict[str, Any]]:
+    rnd = random.Random(SEMILLA + n)
+    return [
+        {
+            "id": 1000 + i,
+            "product_id": [500 + i, f"[SKU-{i:05d}] {rnd.choice(PRODUCTOS)}"],
+            "product_uom_qty": rnd.randint(1, 12),
+            "price_unit": rnd.randint(10, 900) * 1000,
+        }
+        for i in range(n)
+    ]
+
+
+def paquetes(n: int) -> List[Dict[str, Any]]:
+    """Como los arma hidratar_paquetes(): ~1 de cada 4 sin peso (reparte el resto)."""
+    rnd = random.Random(SEMILLA + n)
+    return [
+        {
+            "id": 9000 + i,
+            "name": f"PACK{i + 1:05d}",
+            "peso": 0 if i % 4 == 3 else round(rnd.uniform(0.3, 12.0), 2),
+            "alto": rnd.choice([10, 15, 20, 30, 40]),
+            "ancho": rnd.choice([10, 20, 25, 30]),
+            "largo": rnd.choice([20, 30, 40, 60]),
+        }
+        for i in range(n)
+    ]
+
+
+def respuesta_ok(guia: str = "2130000001") -> str:
+    return (
+        '<?xml version="1.0" encoding="utf-8"?>'
+        '<soap:Envelope xmlns:soap="http://www.w3.org/2003/05/soap-envelope">'
+        f'<soap:Body><CargueMasivoExternoResponse xmlns="{TEM}">'
+        "<CargueMasivoExternoResult>true</CargueMasivoExternoResult>"
+        "<envios><CargueMasivoExternoDTO><objEnvios><EnviosExterno>"
+        f"<Num_Guia>{guia}</Num_Guia><Doc_Relacionado>WH/OUT/00241</Doc_Relacionado>"
+        "</EnviosExterno></objEnvios></CargueMasivoExternoDTO></envios>"
+        "<arrayGuias><string>OK</string></arrayGuias>"
+        "</CargueMasivoExternoResponse></soap:Body></soap:Envelope>"
+    )
+
+
+def respuesta_errores(n: int) -> str:
+    """Rechazo de WS22 con `n` mensajes en arrayGuias (validaciones por pieza)."""
+    mensajes = "".join(
+        f"<string>Pieza {i + 1}: El campo Num_Peso no es válido para la unidad de empaque "
+        f"GENERICA en el destino 05001000 (valor recibido {i % 7}.0). Verifique el peso "
+        "y las dimensiones del bulto.</string>"
+        for i in range(n)
+    )
+    return (
+        '<?xml version="1.0" encoding="utf-8"?>'
+        '<soap:Envelope xmlns:soap="http://www.w3.org/2003/05/soap-envelope">'
+        f'<soap:Body><CargueMasivoExternoResponse xmlns="{TEM}">'
+        "<CargueMasivoExternoResult>false</CargueMasivoExternoResult>"
+        "<envios><CargueMasivoExternoDTO><objEnvios><EnviosExterno>"
+        "<Num_Guia>0</Num_Guia></EnviosExterno></objEnvios></CargueMasivoExternoDTO></envios>"
+        f"<arrayGuias>{mensajes}</arrayGuias>"
+        "</CargueMasivoExternoResponse></soap:Body></soap:Envelope>"
+    )
+
+
+def respuesta_sticker(mb: float) -> str:
+    """GenerarGuiaSticker con un bytesReport de ~`mb` MB (base64 de un PDF ficticio)."""
+    n = int(mb * 1024 * 1024 * 3 / 4)
+    pdf = b"%PDF-1.4\n" + random.Random(SEMILLA).randbytes(n)
+    b64 = base64.b64encode(pdf).decode("ascii")
+    return (
+        '<?xml version="1.0" encoding="utf-8"?>'
+        '<soap:Envelope xmlns:soap="http://www.w3.org/2003/05/soap-envelope">'
+        f'<soap:Body><GenerarGuiaStickerResponse xmlns="{TEM}">'
+        "<GenerarGuiaStickerResult>true</GenerarGuiaStickerResult>"
+        f"<bytesReport>{b64}</bytesReport>"
+        "</GenerarGuiaStickerResponse></soap:Body></soap:Envelope>"
+    )
+
+
+def rpc_read(n_ids: int = 1) -> Dict[str, Any]:
+    """Body JSON-RPC típico: execute_kw read de stock.picking."""
+    return {
+        "jsonrpc": "2.0",
+        "id": 12,
+        "method": "call",
+        "params": {
+            "service": "object",
+            "method": "execute_kw",
+            "args": [
+                "odoo-prod",
+                2,
+                "clave-api-0123456789abcdef",
+                "stock.picking",
+                "read",
+                [list(range(241, 241 + n_ids))],
+                {"fields": list(picking().keys()) + ["move_line_ids", "write_date", "x_studio_servientrega"]},
+            ],
+        },
+    }
+
+
+def rpc_adjunto(mb: float) -> Dict[str, Any]:
+    """create de ir.attachment con el sticker en base64 (~`mb` MB de PDF)."""
+    pdf = b"%PDF-1.4\n" + random.Random(SEMILLA).randbytes(int(mb * 1024 * 1024))
+    body = rpc_read()
+    body["params"]["args"][3:] = [
+        "ir.attachment",
+        "create",
+        [
+            {
+                "name": "Guia_2130000001.pdf",
+                "type": "binary",
+                "datas": base64.b64encode(pdf).decode("ascii"),
+                "res_model": "stock.picking",
+                "res_id": 241,
+                "mimetype": "application/pdf",
+            }
+        ],
+    ]
+    return body
+
+
+def respuesta_search_read(n: int) -> Dict[str, Any]:
+    """Respuesta JSON-RPC de un search_read masivo (tracking, dead letters)."""
+    return {
+        "jsonrpc": "2.0",
+        "id": 14,
+        "result": [
+            {**picking(3), "id": 241 + i, "name": f"WH/OUT/{241 + i:05d}", "carrier_tracking_ref": str(2130000000 + i)}
+            for i in range(n)
+        ],
+    }
@@ -0,0 +1,70 @@
+import os
+import socket
+import threading
+import time
+
+import pytest
+
+# El webhook se importa sin hilos de fondo ni recarga por archivo (igual que benchmarks/)
+os.environ.setdefault("SERVI_URL_QA", "http://127.0.0.1:9/ws22")
+os.environ.setdefault("WARMUP_ENABLED", "false")
+os.environ.setdefault("SETTINGS_WATCH_INTERVAL", "0")
+
+
+def puerto_libre() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def esperar_puerto(port: int) -> None:
+    for _ in range(100):
+        try:
+            socket.create_connection(("127.0.0.1", port), timeout=0.1).close()
+            return
+        except OSError:
+            time.sleep(0.05)
+    raise RuntimeError(f"Puerto {port} no disponible")
+
+
+@pytest.fixture(scope="session")
+def stubs():
+    """Odoo JSON-RPC y WS22 falsos de webhook_replay (un servidor por sesión)."""
+    pytest.importorskip("requests")
+    pytest.importorskip("dotenv")
+    import webhook_replay
+
+    port = puerto_libre()
+    threading.Thread(target=webhook_replay.servir_stubs, args=(port,), daemon=True).start()
+    esperar_puerto(port)
+    return f"http://127.0.0.1:{port}"
+
+
+@pytest.fixture
+def webhook(monkeypatch, tmp_path, stubs):
+    """
+    Módulo del webhook con el tenant "stub" apuntando a los stubs y todo lo que escribe
+    a disco (stickers, archivo SOAP, dead letters) dentro de tmp_path.
+    """
+    pytest.importorskip("flask")
+    import dead_letter
+    import label_store
+    import soap_archive
+    import tenants
+    import webhook_servientrega_ws22
+
+    monkeypatch.setattr(label_store, "LABEL_CACHE_DIR", str(tmp_path / "labels"))
+    monkeypatch.setattr(soap_archive, "SOAP_ARCHIVE_ENABLED", False)
+    monkeypatch.setattr(dead_letter, "DEAD_LETTER_DB", str(tmp_path / "dead_letter.sqlite3"))
+    monkeypatch.setattr(dead_letter, "_local", threading.local())
+
+    tenants.todos()
+    stub = tenants._tenant_desde_config(
+        "stub",
+        {
+            "odoo": {"jsonrpc": f"{stubs}/jsonrpc", "db": "stub", "uid": 2, "password": "x"},
+            "servientrega": {"url": f"{stubs}/ws22", "login": "u", "pwd_enc": "p", "cod_fact": "SER1"},
+        },
+    )
+    monkeypatch.setitem(tenants._TENANTS, "stub", stub)
+    return webhook_servientrega_ws22
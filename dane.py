@@ -0,0 +1,262 @@
+import os
+import csv
+import sys
+import difflib
+import argparse
+import logging
+import re
+import unicodedata
+from typing import Any, Dict, List, Optional, Set, Tuple
+
+import shared_cache
+
+log = logging.getLogger("dane")
+
+# Tabla DANE empaquetada (código municipio 5 dígitos, municipio, departamento, alias)
+DANE_CSV = os.path.join(os.path.dirname(os.path.abspath(__file__)), "data", "dane_municipios.csv")
+
+# WS22 espera el código de ciudad DANE de 8 dígitos (ej: 11001000 = Bogotá)
+SUFIJO_CIUDAD_WS22 = "000"
+FUZZY_CUTOFF = 0.85
+
+# Alias comunes de departamentos (tal como suelen venir en res.country.state / texto libre)
+ALIAS_DEPARTAMENTOS = {
+    "Bogotá D.C.": ["Bogota", "Distrito Capital", "D.C.", "Bogota DC"],
+    "Valle del Cauca": ["Valle"],
+    "La Guajira": ["Guajira"],
+    "Norte de Santander": ["Norte Santander", "N. de Santander", "N Santander"],
+    "San Andrés y Providencia": [
+        "San Andres",
+        "San Andres Providencia y Santa Catalina",
+        "Archipielago de San Andres",
+    ],
+}
+
+# Índices precalculados (se llenan una sola vez con cargar())
+_INDICE_CIUDADES: Dict[str, List[Dict[str, str]]] = {}
+_INDICE_DEPARTAMENTOS: Dict[str, str] = {}
+_CLAVES_CIUDADES: List[str] = []
+_CLAVES_POR_DEPARTAMENTO: Dict[str, List[str]] = {}
+_CACHE_FUZZY: Dict[Tuple[str, Optional[str]], Optional[str]] = {}
+_CACHE_PARTNER: Dict[Tuple[Any, str, str], Optional[Dict[str, str]]] = {}
+_CODIGOS: Set[str] = set()  # códigos de municipio (5 dígitos) de la tabla
+# Versión de la tabla cargada: una tabla distinta no reutiliza resultados de la caché compartida
+_VERSION = ""
+
+
+def normalizar(texto: Optional[str]) -> str:
+    """Minúsculas, sin tildes, sin sufijo de país '(CO)' ni puntuación, espacios colapsados."""
+    if not texto:
+        return ""
+    t = unicodedata.normalize("NFKD", str(texto))
+    t = "".join(c for c in t if not unicodedata.combining(c)).lower()
+    t = re.sub(r"\(.*?\)", " ", t)
+    t = re.sub(r"[^a-z0-9 ]+", " ", t)
+    return " ".join(t.split())
+
+
+def cargar(path: str = DANE_CSV) -> int:
+    """Carga la tabla DANE y construye los índices hash. Retorna el número de municipios."""
+    ciudades: Dict[str, List[Dict[str, str]]] = {}
+    departamentos: Dict[str, str] = {}
+
+    with open(path, encoding="utf-8", newline="") as fh:
+        for row in csv.DictReader(fh):
+            codigo = row["codigo"].strip().zfill(5)
+            muni = {
+                "codigo": codigo,
+                "municipio": row["municipio"].strip(),
+                "departamento": row["departamento"].strip(),
+                "cod_departamento": codigo[:2],
+            }
+            nombres = [muni["municipio"]] + [
+                a for a in (row.get("alias") or "").split("|") if a.strip()
+            ]
+            for nombre in nombres:
+                ciudades.setdefault(normalizar(nombre), []).append(muni)
+            departamentos[normalizar(muni["departamento"])] = muni["cod_departamento"]
+
+    for nombre, alias in ALIAS_DEPARTAMENTOS.items():
+        cod = departamentos.get(normalizar(nombre))
+        if cod:
+            for a in alias:
+                departamentos[normalizar(a)] = cod
+
+    por_departamento: Dict[str, List[str]] = {}
+    for clave, munis in ciudades.items():
+        for cod in {m["cod_departamento"] for m in munis}:
+            por_departamento.setdefault(cod, []).append(clave)
+
+    global _INDICE_CIUDADES, _INDICE_DEPARTAMENTOS, _CLAVES_CIUDADES, _CLAVES_POR_DEPARTAMENTO, _CODIGOS, _VERSION
+    _INDICE_CIUDADES = ciudades
+    _CODIGOS = {m["codigo"] for ms in ciudades.values() for m in ms}
+    _INDICE_DEPARTAMENTOS = departamentos
+    _CLAVES_CIUDADES = sorted(ciudades)
+    _CLAVES_POR_DEPARTAMENTO = {cod: sorted(claves) for cod, claves in por_departamento.items()}
+    st = os.stat(path)
+    _VERSION = f"{int(st.st_mtime)}-{st.st_size}"
+    _CACHE_FUZZY.clear()
+    _CACHE_PARTNER.clear()
+
+    log.info("🗺️ Tabla DANE cargada: %s municipios", len(_CODIGOS))
+    return len(_CODIGOS)
+
+
+def codigo_ws22(codigo: Optional[str]) -> Optional[str]:
+    """
+    Código de ciudad WS22 (8 dígitos) si `codigo` es un municipio de la tabla, dado con 5
+    dígitos ("05001") o ya con el sufijo WS22 ("05001000"). None si no existe.
+    """
+    if not _INDICE_CIUDADES:
+        cargar()
+    codigo = (codigo or "").strip()
+    if not codigo.isdigit():
+        return None
+    if len(codigo) == 5 + len(SUFIJO_CIUDAD_WS22) and codigo.endswith(SUFIJO_CIUDAD_WS22):
+        codigo = codigo[:5]
+    return codigo + SUFIJO_CIUDAD_WS22 if len(codigo) == 5 and codigo in _CODIGOS else None
+
+
+def codigo_departamento(departamento: Optional[str]) -> Optional[str]:
+    """Código DANE (2 dígitos) del departamento a partir de su nombre."""
+    return _INDICE_DEPARTAMENTOS.get(normalizar(departamento))
+
+
+def _clave_fuzzy(clave: str, cod_depto: Optional[str] = None) -> Optional[str]:
+    """Nombre más parecido; con departamento, solo entre los municipios de ese departamento."""
+    key = (clave, cod_depto)
+    if key not in _CACHE_FUZZY:
+        universo = _CLAVES_POR_DEPARTAMENTO.get(cod_depto, []) if cod_depto else _CLAVES_CIUDADES
+        match = difflib.get_close_matches(clave, universo, n=1, cutoff=FUZZY_CUTOFF)
+        _CACHE_FUZZY[key] = match[0] if match else None
+    return _CACHE_FUZZY[key]
+
+
+def _candidatos(clave: str, cod_depto: Optional[str]) -> List[Dict[str, str]]:
+    munis = _INDICE_CIUDADES.get(clave) or []
+    if cod_depto:
+        return [m for m in munis if m["cod_departamento"] == cod_depto]
+    return munis
+
+
+def resolver(ciudad: Optional[str], departamento: Optional[str] = None) -> Optional[Dict[str, str]]:
+    """
+    Resuelve ciudad (+ departamento opcional) a códigos WS22.
+    Retorna {"ciudad": "05001000", "departamento": "05", "municipio": ..., "metodo": ...}
+    o None si no hay coincidencia.
+
+    Si el departamento se reconoce, restringe la búsqueda (exacta, por prefijo y fuzzy) a sus
+    municipios: "Rionegro" + "Santander" nunca cae en Rionegro (Antioquia). Si ningún municipio
+    del departamento coincide, retorna None (el llamador decide el fallback). Un departamento
+    que no se reconoce no filtra.
+    """
+    if not _INDICE_CIUDADES:
+        cargar()
+
+    clave = normalizar(ciudad)
+    if not clave:
+        return None
+    cod_depto = codigo_departamento(departamento)
+
+    metodo = "exacto"
+    candidatos = _candidatos(clave, cod_depto)
+    if not candidatos and " " in clave:
+        # Texto libre tipo "Medellin Antioquia": probar prefijos de mayor a menor
+        partes = clave.split()
+        for n in range(len(partes) - 1, 0, -1):
+            candidatos = _candidatos(" ".join(partes[:n]), cod_depto)
+            if candidatos:
+                break
+    if not candidatos:
+        fuzzy = _clave_fuzzy(clave, cod_depto)
+        if fuzzy:
+            candidatos = _candidatos(fuzzy, cod_depto)
+            metodo = "fuzzy"
+    if not candidatos:
+        if cod_depto:
+            log.info("🗺️ '%s' no corresponde a ningún municipio de %s (%s)", ciudad, departamento, cod_depto)
+        return None
+
+    muni = candidatos[0]
+    return {
+        "ciudad": muni["codigo"] + SUFIJO_CIUDAD_WS22,
+        "departamento": muni["cod_departamento"],
+        "municipio": muni["municipio"],
+        "metodo": metodo,
+    }
+
+
+def resolver_partner(partner: Dict[str, Any]) -> Optional[Dict[str, str]]:
+    """
+    resolver() cacheado por partner (id + ciudad + departamento, para invalidar si cambian).
+    En memoria por proceso y, debajo, en la caché compartida entre workers (por ciudad/departamento).
+    """
+    state = partner.get("state_id")
+    depto = state[1] if isinstance(state, (list, tuple)) and len(state) > 1 else None
+    key = (partner.get("id"), partner.get("city") or "", depto or "")
+    if key not in _CACHE_PARTNER:
+        if not _INDICE_CIUDADES:
+            cargar()
+        clave = shared_cache.clave(_VERSION, normalizar(partner.get("city")), normalizar(depto))
+        codigos = shared_cache.get("dane", clave)
+        if codigos is shared_cache.FALTA:
+            codigos = resolver(partner.get("city"), depto)
+            shared_cache.set("dane", clave, codigos, shared_cache.TTL_DANE)
+        _CACHE_PARTNER[key] = codigos
+    return _CACHE_PARTNER[key]
+
+
+def _columna(encabezados: List[str], *palabras: str) -> str:
+    for h in encabezados:
+        n = normalizar(h)
+        if all(p in n for p in palabras):
+            return h
+    raise ValueError(f"Columna con {' '.join(palabras)!r} no encontrada en {encabezados}")
+
+
+def importar_divipola(origen: str, destino: str = DANE_CSV) -> int:
+    """
+    Regenera la tabla empaquetada desde el CSV oficial DIVIPOLA del DANE (datos.gov.co,
+    "Código Municipio" / "Nombre Municipio" / "Nombre Departamento"). Los códigos que ya
+    están en la tabla actual conservan su nombre, departamento y alias (el oficial viene en
+    mayúsculas); los nuevos toman el nombre oficial. Retorna el número de municipios escritos.
+    """
+    actuales: Dict[str, Tuple[str, str, str]] = {}
+    if os.path.exists(destino):
+        with open(destino, encoding="utf-8", newline="") as fh:
+            actuales = {
+                r["codigo"].zfill(5): (r["municipio"], r["departamento"], r.get("alias") or "")
+                for r in csv.DictReader(fh)
+            }
+
+    filas: Dict[str, Tuple[str, str]] = {}
+    with open(origen, encoding="utf-8-sig", newline="") as fh:
+        lector = csv.DictReader(fh)
+        encabezados = list(lector.fieldnames or [])
+        col_cod = _columna(encabezados, "codigo", "municipio")
+        col_muni = _columna(encabezados, "nombre", "municipio")
+        col_depto = _columna(encabezados, "nombre", "departamento")
+        for row in lector:
+            codigo = re.sub(r"\D", "", row[col_cod] or "").zfill(5)
+            if len(codigo) == 5:
+                filas[codigo] = (row[col_muni].strip(), row[col_depto].strip())
+
+    with open(destino, "w", encoding="utf-8", newline="") as fh:
+        w = csv.writer(fh, lineterminator="\n")
+        w.writerow(["codigo", "municipio", "departamento", "alias"])
+        for codigo in sorted(filas):
+            w.writerow([codigo, *actuales.get(codigo, (*filas[codigo], ""))])
+    return len(filas)
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO, format="%(message)s")
+    parser = argparse.ArgumentParser(description="Tabla DANE de municipios")
+    sub = parser.add_subparsers(dest="cmd", required=True)
+    imp = sub.add_parser("importar", help="Regenerar data/dane_municipios.csv desde el CSV DIVIPOLA oficial")
+    imp.add_argument("origen")
+    imp.add_argument("--destino", default=DANE_CSV)
+    args = parser.parse_args()
+    if args.cmd == "importar":
+        print(f"{importar_divipola(args.origen, args.destino)} municipios → {args.destino}")
+        sys.exit(0)
@@ -0,0 +1,340 @@
+import os
+import re
+import sys
+import json
+import time
+import sqlite3
+import logging
+import argparse
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+log = logging.getLogger("dead_letter")
+
+# Cola de envíos fallidos (SQLite local, compartible entre workers)
+DEAD_LETTER_DB = os.getenv("DEAD_LETTER_DB", "dead_letter.sqlite3")
+DEAD_LETTER_CONCURRENCY = int(os.getenv("DEAD_LETTER_CONCURRENCY", "4"))
+DEAD_LETTER_RATE = float(os.getenv("DEAD_LETTER_RATE", "2"))  # reprocesos por segundo
+
+# Etapas del flujo donde puede fallar un envío
+ETAPA_WS22 = "ws22"  # CargueMasivoExterno rechazó o no devolvió guía
+ETAPA_WS22_HTTP = "ws22_http"  # error de red/HTTP hacia WS22
+ETAPA_PERSISTENCIA = "odoo_persist"  # la guía existe pero no se pudo escribir en Odoo
+ETAPA_STICKER = "sticker"  # el PDF no se pudo generar/adjuntar
+
+# Sticker diferido encolado y aún sin adjuntar: si el proceso se reinicia, queda aquí
+CLASE_STICKER_EN_COLA = "sticker_en_cola"
+
+# Clasificación de mensajes WS22 → clase de error (primera coincidencia)
+CLASES_ERROR: List[Tuple[str, str]] = [
+    (r"login|contrase|autentic|credencial", "ws22_credenciales"),
+    (r"ciudad|departamento|dane|destino", "ws22_destino"),
+    (r"tel[eé]fono|celular", "ws22_telefono"),
+    (r"direcci[oó]n", "ws22_direccion"),
+    (r"peso|volumen|dimensi", "ws22_peso"),
+    (r"factura|cod.?facturaci", "ws22_facturacion"),
+    (r"timeout|timed out", "ws22_timeout"),
+]
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS dead_letters (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    tenant TEXT NOT NULL DEFAULT 'default',
+    picking_id INTEGER NOT NULL,
+    etapa TEXT NOT NULL,
+    error_class TEXT NOT NULL,
+    mensaje TEXT,
+    intentos INTEGER NOT NULL DEFAULT 1,
+    inputs TEXT,
+    estado TEXT NOT NULL DEFAULT 'pendiente',
+    creado REAL NOT NULL,
+    actualizado REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS ix_dl_estado_clase ON dead_letters (estado, error_class);
+CREATE INDEX IF NOT EXISTS ix_dl_picking ON dead_letters (picking_id, etapa, estado);
+"""
+
+# Columnas agregadas después de la primera versión del esquema (bases existentes)
+_MIGRACIONES = [
+    ("tenant", "ALTER TABLE dead_letters ADD COLUMN tenant TEXT NOT NULL DEFAULT 'default'"),
+]
+
+_local = threading.local()
+
+
+def _conn() -> sqlite3.Connection:
+    conn = getattr(_local, "conn", None)
+    if conn is None:
+        conn = sqlite3.connect(DEAD_LETTER_DB, timeout=10, isolation_level=None)
+        conn.row_factory = sqlite3.Row
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.executescript(_SCHEMA)
+        columnas = {r["name"] for r in conn.execute("PRAGMA table_info(dead_letters)")}
+        for columna, ddl in _MIGRACIONES:
+            if columna not in columnas:
+                conn.execute(ddl)
+        _local.conn = conn
+    return conn
+
+
+def clasificar_error(etapa: str, mensaje: Optional[str]) -> str:
+    texto = (mensaje or "").lower()
+    for patron, clase in CLASES_ERROR:
+        if re.search(patron, texto):
+            return clase
+    return {
+        ETAPA_WS22: "ws22_rechazo",
+        ETAPA_WS22_HTTP: "ws22_http",
+        ETAPA_PERSISTENCIA: "odoo_persist",
+        ETAPA_STICKER: "sticker",
+    }.get(etapa, etapa)
+
+
+def registrar(
+    picking_id: int,
+    etapa: str,
+    mensaje: Any,
+    inputs: Optional[Dict[str, Any]] = None,
+    error_class: Optional[str] = None,
+    tenant: str = "default",
+) -> int:
+    """
+    Registra (o acumula un intento sobre) el fallo pendiente de un picking en una etapa.
+    Retorna el id de la entrada.
+    """
+    if not isinstance(mensaje, str):
+        mensaje = json.dumps(mensaje, ensure_ascii=False, default=str)
+    clase = error_class or clasificar_error(etapa, mensaje)
+    ahora = time.time()
+    conn = _conn()
+    row = conn.execute(
+        "SELECT id FROM dead_letters WHERE tenant=? AND picking_id=? AND etapa=?"
+        " AND estado='pendiente'",
+        (tenant, int(picking_id), etapa),
+    ).fetchone()
+    inputs_json = json.dumps(inputs or {}, ensure_ascii=False, default=str)
+    if row:
+        conn.execute(
+            "UPDATE dead_letters SET intentos=intentos+1, error_class=?, mensaje=?, inputs=?,"
+            " actualizado=? WHERE id=?",
+            (clase, mensaje, inputs_json, ahora, row["id"]),
+        )
+        entry_id = row["id"]
+    else:
+        cur = conn.execute(
+            "INSERT INTO dead_letters (tenant, picking_id, etapa, error_class, mensaje, inputs,"
+            " creado, actualizado) VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+            (tenant, int(picking_id), etapa, clase, mensaje, inputs_json, ahora, ahora),
+        )
+        entry_id = cur.lastrowid
+    log.warning(
+        "📮 Dead letter #%s tenant=%s picking=%s etapa=%s clase=%s",
+        entry_id,
+        tenant,
+        picking_id,
+        etapa,
+        clase,
+    )
+    return entry_id
+
+
+def _row(r: sqlite3.Row) -> Dict[str, Any]:
+    d = dict(r)
+    d["inputs"] = json.loads(d["inputs"] or "{}")
+    return d
+
+
+def listar(
+    estado: Optional[str] = "pendiente",
+    error_class: Optional[str] = None,
+    etapa: Optional[str] = None,
+    ids: Optional[List[int]] = None,
+    limit: int = 500,
+    tenant: Optional[str] = None,
+) -> List[Dict[str, Any]]:
+    sql = "SELECT * FROM dead_letters WHERE 1=1"
+    params: List[Any] = []
+    if tenant:
+        sql += " AND tenant=?"
+        params.append(tenant)
+    if estado:
+        sql += " AND estado=?"
+        params.append(estado)
+    if error_class:
+        sql += " AND error_class=?"
+        params.append(error_class)
+    if etapa:
+        sql += " AND etapa=?"
+        params.append(etapa)
+    if ids:
+        sql += f" AND id IN ({','.join('?' * len(ids))})"
+        params.extend(int(i) for i in ids)
+    sql += " ORDER BY id LIMIT ?"
+    params.append(int(limit))
+    return [_row(r) for r in _conn().execute(sql, params)]
+
+
+def marcar(
+    entry_id: int, estado: str, mensaje: Optional[str] = None, desde: Optional[float] = None
+) -> None:
+    """
+    Cambia el estado de una entrada. Con `mensaje` cuenta un intento nuevo, salvo que el
+    propio reproceso ya lo haya registrado (entrada actualizada después de `desde`).
+    """
+    conn = _conn()
+    if mensaje is None:
+        conn.execute(
+            "UPDATE dead_letters SET estado=?, actualizado=? WHERE id=?",
+            (estado, time.time(), entry_id),
+        )
+    else:
+        conn.execute(
+            "UPDATE dead_letters SET estado=?, mensaje=?,"
+            " intentos=intentos + (CASE WHEN actualizado < ? THEN 1 ELSE 0 END), actualizado=?"
+            " WHERE id=?",
+            (estado, mensaje, desde if desde is not None else time.time(), time.time(), entry_id),
+        )
+
+
+def resolver_picking(picking_id: int, tenant: str = "default", etapa: Optional[str] = None) -> int:
+    """
+    Marca como resueltas las entradas pendientes de un picking que ya se procesó bien
+    (solo las de `etapa`, si se indica).
+    """
+    sql = "UPDATE dead_letters SET estado='resuelto', actualizado=? WHERE tenant=? AND picking_id=?"
+    params: List[Any] = [time.time(), tenant, int(picking_id)]
+    if etapa:
+        sql += " AND etapa=?"
+        params.append(etapa)
+    cur = _conn().execute(sql + " AND estado='pendiente'", params)
+    return cur.rowcount
+
+
+def resumen() -> List[Dict[str, Any]]:
+    rows = _conn().execute(
+        "SELECT tenant, error_class, etapa, COUNT(*) AS total FROM dead_letters"
+        " WHERE estado='pendiente' GROUP BY tenant, error_class, etapa ORDER BY total DESC"
+    )
+    return [dict(r) for r in rows]
+
+
+class _RateLimiter:
+    """Limita a `por_segundo` adquisiciones por segundo entre todos los hilos."""
+
+    def __init__(self, por_segundo: float):
+        self.intervalo = 1.0 / por_segundo if por_segundo > 0 else 0.0
+        self.siguiente = time.monotonic()
+        self.lock = threading.Lock()
+
+    def acquire(self) -> None:
+        if not self.intervalo:
+            return
+        with self.lock:
+            ahora = time.monotonic()
+            espera = self.siguiente - ahora
+            self.siguiente = max(ahora, self.siguiente) + self.intervalo
+        if espera > 0:
+            time.sleep(espera)
+
+
+def reprocesar(
+    entradas: List[Dict[str, Any]],
+    procesar: Callable[[Dict[str, Any]], Tuple[bool, Any]],
+    concurrencia: int = DEAD_LETTER_CONCURRENCY,
+    por_segundo: float = DEAD_LETTER_RATE,
+) -> Dict[str, Any]:
+    """
+    Reprocesa entradas en paralelo con límite de tasa.
+    `procesar(entrada) -> (ok, detalle)`; ok marca la entrada como 'reprocesado',
+    si no, sigue 'pendiente' con el nuevo mensaje e intento acumulado.
+    """
+    limiter = _RateLimiter(por_segundo)
+
+    def _uno(entrada: Dict[str, Any]) -> Dict[str, Any]:
+        limiter.acquire()
+        desde = time.time()
+        try:
+            ok, detalle = procesar(entrada)
+        except Exception as e:
+            ok, detalle = False, {"error": "replay_exception", "detail": str(e)}
+        if ok:
+            marcar(entrada["id"], "reprocesado")
+        else:
+            marcar(
+                entrada["id"],
+                "pendiente",
+                json.dumps(detalle, ensure_ascii=False, default=str),
+                desde=desde,
+            )
+        return {
+            "id": entrada["id"],
+            "tenant": entrada["tenant"],
+            "picking_id": entrada["picking_id"],
+            "ok": ok,
+            "detail": detalle,
+        }
+
+    inicio = time.monotonic()
+    with ThreadPoolExecutor(max_workers=max(1, concurrencia), thread_name_prefix="dl-replay") as ex:
+        resultados = list(ex.map(_uno, entradas))
+    ok_count = sum(1 for r in resultados if r["ok"])
+    log.info(
+        "📮 Replay: %s/%s reprocesados en %.1fs", ok_count, len(resultados), time.monotonic() - inicio
+    )
+    return {"total": len(resultados), "ok": ok_count, "fallidos": len(resultados) - ok_count, "resultados": resultados}
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Dead letters de envíos Servientrega")
+    sub = parser.add_subparsers(dest="cmd", required=True)
+
+    p_list = sub.add_parser("list", help="listar entradas")
+    p_list.add_argument("--estado", default="pendiente")
+    p_list.add_argument("--class", dest="error_class")
+    p_list.add_argument("--etapa")
+    p_list.add_argument("--tenant")
+    p_list.add_argument("--limit", type=int, default=100)
+
+    sub.add_parser("summary", help="pendientes agrupados por clase de error")
+
+    p_replay = sub.add_parser("replay", help="reprocesar entradas pendientes")
+    p_replay.add_argument("--ids", help="ids separados por coma")
+    p_replay.add_argument("--class", dest="error_class")
+    p_replay.add_argument("--etapa")
+    p_replay.add_argument("--tenant")
+    p_replay.add_argument("--limit", type=int, default=500)
+    p_replay.add_argument("--concurrency", type=int, default=DEAD_LETTER_CONCURRENCY)
+    p_replay.add_argument("--rate", type=float, default=DEAD_LETTER_RATE)
+
+    args = parser.parse_args(argv)
+
+    if args.cmd == "list":
+        out = listar(
+            args.estado or None, args.error_class, args.etapa, limit=args.limit, tenant=args.tenant
+        )
+    elif args.cmd == "summary":
+        out = resumen()
+    else:
+        ids = [int(i) for i in args.ids.split(",")] if args.ids else None
+        if not (ids or args.error_class or args.etapa or args.tenant):
+            parser.error("indique --ids, --class, --etapa o --tenant")
+        # Importación diferida: el reproceso usa el mismo flujo del webhook
+        from webhook_servientrega_ws22 import reprocesar_dead_letters
+
+        out = reprocesar_dead_letters(
+            ids=ids,
+            error_class=args.error_class,
+            etapa=args.etapa,
+            tenant=args.tenant,
+            limit=args.limit,
+            concurrencia=args.concurrency,
+            por_segundo=args.rate,
+        )
+
+    sys.stdout.write(json.dumps(out, ensure_ascii=False, indent=2, default=str) + "\n")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,96 @@
+import os
+import json
+import uuid
+import decimal
+import logging
+from typing import Any, Callable, Dict, NamedTuple, Union
+
+log = logging.getLogger("json_codec")
+
+# "auto" usa orjson si está instalado; "stdlib" fuerza el json de la librería estándar
+JSON_CODEC = os.getenv("JSON_CODEC", "auto").lower()
+
+
+class Codec(NamedTuple):
+    nombre: str
+    dumps: Callable[[Any], bytes]
+    loads: Callable[[Union[bytes, str]], Any]
+
+
+def _default(obj: Any) -> Any:
+    # Tipos que no son JSON nativo, como los serializa Flask por defecto
+    if isinstance(obj, (decimal.Decimal, uuid.UUID)):
+        return str(obj)
+    if isinstance(obj, (set, frozenset)):
+        return list(obj)
+    if hasattr(obj, "isoformat"):
+        return obj.isoformat()
+    raise TypeError(f"Object of type {type(obj).__name__} is not JSON serializable")
+
+
+def _stdlib() -> Codec:
+    encoder = json.JSONEncoder(ensure_ascii=False, separators=(",", ":"), default=_default)
+
+    def dumps(obj: Any) -> bytes:
+        return encoder.encode(obj).encode("utf-8")
+
+    return Codec("stdlib", dumps, json.loads)
+
+
+def _orjson() -> Codec:
+    import orjson
+
+    # NON_STR_KEYS: claves int (ids) como en json.dumps
+    opciones = orjson.OPT_NON_STR_KEYS
+
+    def dumps(obj: Any) -> bytes:
+        # Escribe directo a bytes: los base64 de PDFs no pasan por un str intermedio
+        return orjson.dumps(obj, default=_default, option=opciones)
+
+    return Codec("orjson", dumps, orjson.loads)
+
+
+def disponibles() -> Dict[str, Codec]:
+    codecs = {"stdlib": _stdlib()}
+    try:
+        codecs["orjson"] = _orjson()
+    except ImportError:
+        pass
+    return codecs
+
+
+def _elegir(nombre: str) -> Codec:
+    codecs = disponibles()
+    if nombre == "auto":
+        return codecs.get("orjson") or codecs["stdlib"]
+    if nombre not in codecs:
+        log.warning("⚠️ JSON_CODEC=%s no disponible; se usa stdlib", nombre)
+        return codecs["stdlib"]
+    return codecs[nombre]
+
+
+_codec = _elegir(JSON_CODEC)
+NOMBRE = _codec.nombre
+# Funciones del módulo enlazadas directamente (sin indirección por llamada)
+dumps = _codec.dumps
+loads = _codec.loads
+
+
+def instalar_en_flask(app) -> None:
+    """Reemplaza el proveedor JSON de Flask (jsonify y request.get_json) por este codec."""
+    from flask.json.provider import JSONProvider
+
+    class CodecJSONProvider(JSONProvider):
+        def dumps(self, obj: Any, **kwargs: Any) -> str:
+            return dumps(obj).decode("utf-8")
+
+        def loads(self, s: Union[str, bytes], **kwargs: Any) -> Any:
+            return loads(s)
+
+        def response(self, *args: Any, **kwargs: Any):
+            # El body sale en bytes tal cual lo produce el codec
+            obj = self._prepare_response_obj(args, kwargs)
+            return self._app.response_class(dumps(obj), mimetype="application/json")
+
+    app.json = CodecJSONProvider(app)
+    log.info("🧩 Codec JSON: %s", NOMBRE)
@@ -0,0 +1,214 @@
+import os
+import re
+import hashlib
+import logging
+import tempfile
+import threading
+from typing import BinaryIO, Optional, Tuple
+
+import tenants
+
+log = logging.getLogger("label_store")
+
+# Almacén de stickers PDF direccionado por contenido:
+#   <dir>/objects/<sha256>.pdf      → bytes del PDF (inmutable, compartido)
+#   <dir>/refs/<tenant>/<guia>      → sha256 del PDF de esa guía en ese tenant
+# Los números de guía solo son únicos por código de facturación: sin el tenant en la
+# referencia, un tenant podría leer el sticker (nombre, dirección) de otro.
+LABEL_CACHE_DIR = os.getenv("LABEL_CACHE_DIR", "labels")
+LABEL_CACHE_MAX_MB = int(os.getenv("LABEL_CACHE_MAX_MB", "512"))
+
+_GUIA_RE = re.compile(r"^[0-9A-Za-z\-]{1,40}$")
+_TENANT_RE = re.compile(r"^[0-9A-Za-z_\-]{1,64}$")
+_lock = threading.Lock()
+
+
+def _dirs() -> Tuple[str, str]:
+    objects = os.path.join(LABEL_CACHE_DIR, "objects")
+    refs = os.path.join(LABEL_CACHE_DIR, "refs")
+    os.makedirs(objects, exist_ok=True)
+    os.makedirs(refs, exist_ok=True)
+    return objects, refs
+
+
+def guia_valida(guia: str) -> bool:
+    return bool(guia) and bool(_GUIA_RE.match(str(guia)))
+
+
+def _ref(refs: str, guia: str, tenant: Optional[str]) -> Optional[str]:
+    """Ruta de la referencia de la guía en el tenant indicado (por defecto, el activo)."""
+    tenant = tenant or tenants.actual().nombre
+    if not guia_valida(guia) or not _TENANT_RE.match(tenant):
+        return None
+    return os.path.join(refs, tenant, guia)
+
+
+def _write_atomic(path: str, data: bytes) -> None:
+    fd, tmp = tempfile.mkstemp(dir=os.path.dirname(path), prefix=".tmp-")
+    try:
+        with os.fdopen(fd, "wb") as fh:
+            fh.write(data)
+        os.replace(tmp, path)
+    except Exception:
+        if os.path.exists(tmp):
+            os.unlink(tmp)
+        raise
+
+
+def guardar(guia: str, pdf_bytes: bytes, tenant: Optional[str] = None) -> Optional[str]:
+    """Guarda el PDF de una guía. Retorna el sha256 del contenido (None si la guía es inválida)."""
+    objects, refs = _dirs()
+    ref_path = _ref(refs, guia, tenant)
+    if not ref_path or not pdf_bytes:
+        return None
+
+    sha = hashlib.sha256(pdf_bytes).hexdigest()
+    obj_path = os.path.join(objects, f"{sha}.pdf")
+
+    with _lock:
+        if not os.path.exists(obj_path):
+            _write_atomic(obj_path, pdf_bytes)
+        os.makedirs(os.path.dirname(ref_path), exist_ok=True)
+        _write_atomic(ref_path, sha.encode("ascii"))
+        _evict()
+
+    log.info("🗄️ Sticker de guía %s en caché (%s bytes, %s)", guia, len(pdf_bytes), sha[:12])
+    return sha
+
+
+def ruta(guia: str, tenant: Optional[str] = None) -> Optional[str]:
+    """Ruta local del PDF de la guía del tenant, o None si no está en caché."""
+    objects, refs = _dirs()
+    ref_path = _ref(refs, guia, tenant)
+    if not ref_path:
+        return None
+    if not os.path.exists(ref_path) and ref_path == os.path.join(refs, tenants.DEFAULT_TENANT, guia):
+        # Referencias de antes de multi-tenant (refs/<guia>): todas son del tenant default
+        legado = os.path.join(refs, guia)
+        if os.path.isfile(legado):
+            ref_path = legado
+    try:
+        with open(ref_path, "rb") as fh:
+            sha = fh.read().decode("ascii").strip()
+    except FileNotFoundError:
+        return None
+
+    obj_path = os.path.join(objects, f"{sha}.pdf")
+    if not os.path.exists(obj_path):
+        # El objeto fue desalojado: la referencia queda huérfana
+        try:
+            os.unlink(ref_path)
+        except FileNotFoundError:
+            pass
+        return None
+
+    try:
+        os.utime(obj_path)  # mtime = último uso (para el desalojo LRU)
+    except OSError:
+        pass
+    return obj_path
+
+
+def abrir(guia: str, tenant: Optional[str] = None) -> Optional[Tuple[BinaryIO, str]]:
+    """
+    (archivo abierto, sha256) del PDF de la guía, o None si no está en caché.
+    El descriptor sigue válido aunque otro proceso desaloje el objeto después de abrirlo.
+    """
+    path = ruta(guia, tenant)
+    if not path:
+        return None
+    try:
+        fh = open(path, "rb")
+    except FileNotFoundError:
+        # Desalojado entre ruta() y open()
+        return None
+    return fh, os.path.basename(path)[: -len(".pdf")]
+
+
+def leer(guia: str, tenant: Optional[str] = None) -> Optional[bytes]:
+    abierto = abrir(guia, tenant)
+    if not abierto:
+        return None
+    fh, _ = abierto
+    with fh:
+        return fh.read()
+
+
+def _evict() -> None:
+    """Desaloja los PDFs menos usados hasta quedar bajo LABEL_CACHE_MAX_MB (llamar con _lock)."""
+    objects, _ = _dirs()
+    limite = LABEL_CACHE_MAX_MB * 1024 * 1024
+    entradas = []
+    total = 0
+    with os.scandir(objects) as it:
+        for e in it:
+            if e.is_file() and e.name.endswith(".pdf"):
+                st = e.stat()
+                entradas.append((st.st_mtime, st.st_size, e.path))
+                total += st.st_size
+    if total <= limite:
+        return
+
+    entradas.sort()
+    for _, size, path in entradas:
+        if total <= limite:
+            break
+        try:
+            os.unlink(path)
+            total -= size
+        except FileNotFoundError:
+            pass
+    log.info("🧹 Caché de stickers desalojada a %.1f MB", total / 1024 / 1024)
+
+
+def precalentar(limit: int) -> int:
+    """
+    Llena la caché con los stickers de las guías más recientes de cada tenant, leyendo
+    los adjuntos Guia_<n>.pdf que ya existen en su Odoo (sin llamar a Servientrega).
+    Retorna cuántos stickers se agregaron en total.
+    """
+    agregados = 0
+    for tenant in tenants.todos():
+        # Corre en un hilo de fondo, fuera de cualquier request: se activa cada tenant
+        with tenants.activar(tenant):
+            try:
+                agregados += _precalentar_tenant(limit)
+            except Exception as e:
+                log.warning("⚠️ Precalentado de stickers del tenant %s falló: %s", tenant.nombre, str(e))
+    return agregados
+
+
+def _precalentar_tenant(limit: int) -> int:
+    import base64
+    from odoo_rpc import search_read, read
+
+    ok, resp = search_read(
+        "ir.attachment",
+        [["res_model", "=", "stock.picking"], ["name", "=like", "Guia_%.pdf"]],
+        ["name"],
+        limit=limit,
+        order="create_date desc",
+    )
+    if not ok:
+        log.warning("⚠️ No se pudo precalentar la caché de stickers: %s", resp)
+        return 0
+
+    faltantes = {}
+    for att in resp.get("result", []):
+        guia = att["name"][len("Guia_") : -len(".pdf")]
+        if guia_valida(guia) and not ruta(guia):
+            faltantes[att["id"]] = guia
+    if not faltantes:
+        return 0
+
+    ok, resp = read("ir.attachment", list(faltantes), ["datas"])
+    if not ok:
+        log.warning("⚠️ No se pudieron leer adjuntos para la caché: %s", resp)
+        return 0
+
+    agregados = 0
+    for att in resp.get("result", []):
+        if att.get("datas") and guardar(faltantes[att["id"]], base64.b64decode(att["datas"])):
+            agregados += 1
+    log.info("🔥 Caché de stickers precalentada (%s): %s guías", tenants.actual().nombre, agregados)
+    return agregados
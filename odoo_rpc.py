@@ -1,12 +1,19 @@
 import os
+import json
 import logging
 import requests
+from requests.adapters import HTTPAdapter
 import base64
 import re
+import time
+import threading
+from contextvars import ContextVar
 from typing import Any, Dict, List, Optional, Tuple
-from dotenv import load_dotenv
 
-load_dotenv()
+import json_codec
+import settings
+import shared_cache
+
 log = logging.getLogger("odoo_rpc")
 
 # ===== SWITCH DE AMBIENTE =====
@@ -29,30 +36,106 @@ else:
     PWD = os.getenv("TEST_ODOO_PASSWORD")
     CALLBACK_URL = os.getenv("TEST_CALLBACK_URL")
 
-TIMEOUT = int(os.getenv("ODOO_TIMEOUT", "35"))
+POOL_SIZE = int(os.getenv("ODOO_POOL_SIZE", "10"))
+RATE_LIMIT = float(os.getenv("ODOO_RATE_LIMIT", "0"))  # llamadas/segundo, 0 = sin límite
+
+
+class OdooClient:
+    """
+    Conexión a una instancia Odoo (un tenant): credenciales, pool HTTP keep-alive,
+    caché de esquema (fields_get) y límite de tasa propios.
+    """
+
+    def __init__(
+        self,
+        jsonrpc: Optional[str],
+        db: Optional[str],
+        uid: int,
+        pwd: Optional[str],
+        timeout: Optional[int] = None,
+        pool_size: int = POOL_SIZE,
+        rate_limit: float = RATE_LIMIT,
+        name: str = "default",
+    ):
+        self.name = name
+        self.jsonrpc = jsonrpc
+        self.db = db
+        self.uid = uid
+        self.pwd = pwd
+        self._timeout = timeout
+        self.session = requests.Session()
+        self.session.mount("https://", HTTPAdapter(pool_connections=1, pool_maxsize=pool_size))
+        self.session.mount("http://", HTTPAdapter(pool_connections=1, pool_maxsize=pool_size))
+        # Caché de esquema por modelo: {model: set(campos)}
+        self.fields_cache: Dict[str, set] = {}
+        self._intervalo = 1.0 / rate_limit if rate_limit > 0 else 0.0
+        self._siguiente = 0.0
+        self._rl_lock = threading.Lock()
+
+    @property
+    def timeout(self) -> int:
+        # Sin timeout propio (tenant) se usa ODOO_TIMEOUT vigente: recargable en caliente
+        return self._timeout or settings.actual().odoo_timeout
+
+    def _throttle(self) -> None:
+        if not self._intervalo:
+            return
+        with self._rl_lock:
+            ahora = time.monotonic()
+            espera = self._siguiente - ahora
+            self._siguiente = max(ahora, self._siguiente) + self._intervalo
+        if espera > 0:
+            time.sleep(espera)
+
+    def post(self, payload: Dict[str, Any]) -> Tuple[bool, dict]:
+        """POST JSON-RPC a Odoo."""
+        try:
+            if not self.jsonrpc:
+                return False, {
+                    "error": "missing_env",
+                    "detail": f"Falta ODOO_JSONRPC para el tenant '{self.name}'",
+                }
+            self._throttle()
+            r = self.session.post(
+                self.jsonrpc,
+                data=json_codec.dumps(payload),
+                timeout=self.timeout,
+                headers={"Content-Type": "application/json"},
+            )
+            r.raise_for_status()
+            # Se parsean los bytes crudos: sin decodificar antes a str (adjuntos/search_read grandes)
+            data = json_codec.loads(r.content)
+            if "error" in data:
+                return False, data
+            return True, data
+        except Exception as e:
+            return False, {"error": "odoo_rpc_http_failed", "detail": str(e)}
+
+
+# Cliente por defecto (variables de entorno) y cliente activo del request/tenant actual
+_default_client = OdooClient(ODOO_JSONRPC, DB, UID, PWD)
+_current_client: ContextVar[Optional[OdooClient]] = ContextVar("odoo_client", default=None)
+
+
+def cliente() -> OdooClient:
+    return _current_client.get() or _default_client
+
+
+def cliente_por_defecto() -> OdooClient:
+    return _default_client
+
+
+def usar_cliente(client: Optional[OdooClient]):
+    """Activa un cliente para el contexto actual. Retorna el token para liberar_cliente()."""
+    return _current_client.set(client)
+
+
+def liberar_cliente(token) -> None:
+    _current_client.reset(token)
 
 
 def _post(payload: Dict[str, Any]) -> Tuple[bool, dict]:
-    """POST JSON-RPC a Odoo."""
-    try:
-        if not ODOO_JSONRPC:
-            return False, {
-                "error": "missing_env",
-                "detail": "Falta ODOO_JSONRPC en .env",
-            }
-        r = requests.post(
-            ODOO_JSONRPC,
-            json=payload,
-            timeout=TIMEOUT,
-            headers={"Content-Type": "application/json"},
-        )
-        r.raise_for_status()
-        data = r.json()
-        if "error" in data:
-            return False, data
-        return True, data
-    except Exception as e:
-        return False, {"error": "odoo_rpc_http_failed", "detail": str(e)}
+    return cliente().post(payload)
 
 
 def execute_kw(
@@ -63,6 +146,7 @@ def execute_kw(
     rpc_id: int = 10,
 ) -> Tuple[bool, dict]:
     """Llamada genérica execute_kw."""
+    c = cliente()
     payload = {
         "jsonrpc": "2.0",
         "id": rpc_id,
@@ -70,12 +154,74 @@ def execute_kw(
         "params": {
             "service": "object",
             "method": "execute_kw",
-            "args": [DB, UID, PWD, model, method, args] + ([kwargs] if kwargs else []),
+            "args": [c.db, c.uid, c.pwd, model, method, args] + ([kwargs] if kwargs else []),
         },
     }
     return _post(payload)
 
 
+def ping() -> Tuple[bool, dict]:
+    """common.version: no requiere credenciales; sirve para abrir/mantener la conexión."""
+    return _post(
+        {
+            "jsonrpc": "2.0",
+            "id": 1,
+            "method": "call",
+            "params": {"service": "common", "method": "version", "args": []},
+        }
+    )
+
+
+# Mínimo de segundos entre refrescos de fields_get por (tenant, modelo) al pedir un campo desconocido
+FIELDS_REFRESH_MIN = int(os.getenv("ODOO_FIELDS_REFRESH_MIN", "300"))
+_FIELDS_REFRESH: Dict[Tuple[str, str], float] = {}
+_fields_refresh_lock = threading.Lock()
+
+
+def fields_get(model: str, refresh: bool = False) -> Tuple[bool, set]:
+    """Campos existentes del modelo (cacheado por cliente/tenant, en memoria y en la caché compartida)."""
+    c = cliente()
+    cache = c.fields_cache
+    if not refresh and model in cache:
+        return True, cache[model]
+    clave = shared_cache.clave(c.name, c.jsonrpc, c.db, model)
+    if not refresh:
+        campos = shared_cache.get("fields_get", clave)
+        if campos is not shared_cache.FALTA:
+            cache[model] = set(campos)
+            return True, cache[model]
+    ok, resp = execute_kw(model, "fields_get", [], {"attributes": ["type"]}, rpc_id=16)
+    if not ok:
+        return False, set()
+    cache[model] = set((resp.get("result") or {}).keys())
+    shared_cache.set("fields_get", clave, sorted(cache[model]), shared_cache.TTL_FIELDS_GET)
+    return True, cache[model]
+
+
+def _known_fields(model: str, fields: List[str]) -> List[str]:
+    """
+    Si el esquema del modelo ya está en caché, descarta de antemano los campos que no existen.
+    Un campo ausente del esquema cacheado (p. ej. creado en Studio después del warm-up) fuerza
+    un fields_get(refresh=True), como máximo uno cada FIELDS_REFRESH_MIN segundos por modelo.
+    """
+    c = cliente()
+    known = c.fields_cache.get(model)
+    if not known:
+        return list(fields)
+    if any(f not in known and f != "id" for f in fields):
+        clave = (c.name, model)
+        ahora = time.monotonic()
+        with _fields_refresh_lock:
+            refrescar = ahora - _FIELDS_REFRESH.get(clave, float("-inf")) >= FIELDS_REFRESH_MIN
+            if refrescar:
+                _FIELDS_REFRESH[clave] = ahora
+        if refrescar:
+            ok, nuevos = fields_get(model, refresh=True)
+            if ok:
+                known = nuevos
+    return [f for f in fields if f in known or f == "id"]
+
+
 def search_read(
     model: str,
     domain: List[Any],
@@ -139,8 +285,11 @@ def safe_read(
     read() con tolerancia a campos desconocidos.
     Retorna (ok, resp, fields_usados).
     """
-    f = list(fields)
+    f = _known_fields(model, fields)
     for _ in range(5):
+        if fields and not f:
+            # read([]) devuelve TODOS los campos del modelo: nunca es lo que se pidió
+            return False, {"error": "no_known_fields", "fields": list(fields)}, f
         ok, resp = read(model, ids, f)
         if ok:
             return True, resp, f
@@ -159,7 +308,7 @@ def safe_write(
     write() con tolerancia a campos desconocidos.
     Retorna (ok, resp, vals_usados).
     """
-    v = dict(vals)
+    v = {k: vals[k] for k in _known_fields(model, list(vals))}
     for _ in range(5):
         ok, resp = write(model, ids, v)
         if ok:
@@ -177,7 +326,7 @@ def safe_create(model: str, vals: Dict[str, Any]) -> Tuple[bool, dict, Dict[str,
     create() con tolerancia a campos desconocidos.
     Retorna (ok, resp, vals_usados).
     """
-    v = dict(vals)
+    v = {k: vals[k] for k in _known_fields(model, list(vals))}
     for _ in range(5):
         ok, resp = create(model, v)
         if ok:
@@ -224,3 +373,102 @@ def write_tracking_ref(
         [int(picking_id)],
         {"carrier_tracking_ref": tracking_ref},
     )
+
+
+# ---------- helpers por lote: una sola llamada RPC para N registros ----------
+def _vals_key(vals: Dict[str, Any]) -> str:
+    """Clave estable para agrupar vals idénticos (dicts no son hashables)."""
+    return json.dumps(vals, sort_keys=True, default=str)
+
+
+def write_many(
+    model: str, updates: List[Tuple[int, Dict[str, Any]]]
+) -> Tuple[bool, List[Dict[str, Any]]]:
+    """
+    Escribe varios registros agrupando por vals idénticos: un write multi-id por grupo.
+    `updates` es una lista de (record_id, vals). Un id repetido se fusiona en un solo write
+    (las claves posteriores pisan a las anteriores, como dos writes en orden).
+    Retorna (ok_global, resultados) con un resultado por elemento de `updates`, en el mismo orden:
+    {"id", "ok", "vals" (vals_usados), "error" (si falló)}.
+    """
+    por_id: Dict[int, Dict[str, Any]] = {}
+    for record_id, vals in updates:
+        por_id.setdefault(int(record_id), {}).update(vals)
+
+    grupos: Dict[str, Tuple[Dict[str, Any], List[int]]] = {}
+    for record_id, vals in por_id.items():
+        key = _vals_key(vals)
+        if key not in grupos:
+            grupos[key] = (vals, [])
+        grupos[key][1].append(record_id)
+
+    resultados: Dict[int, Dict[str, Any]] = {}
+    for vals, ids in grupos.values():
+        ok, resp, usados = safe_write(model, ids, vals)
+        for record_id in ids:
+            item = {"id": record_id, "ok": ok, "vals": usados}
+            if not ok:
+                item["error"] = resp
+            resultados[record_id] = item
+
+    # Copias: dos entradas del mismo id no comparten (ni pisan) el mismo dict de resultado
+    ordenados = [dict(resultados[int(record_id)]) for record_id, _ in updates]
+    return all(r["ok"] for r in ordenados), ordenados
+
+
+def create_many(
+    model: str, vals_list: List[Dict[str, Any]], rpc_id: int = 15
+) -> Tuple[bool, List[Dict[str, Any]]]:
+    """
+    create() con una lista de vals en una sola llamada (Odoo >= 12 acepta lista).
+    Mantiene la tolerancia de safe_create: un campo desconocido se elimina de todos los vals.
+    Retorna (ok, resultados) con un resultado por vals: {"id", "ok", "vals", "error"}.
+    """
+    if not vals_list:
+        return True, []
+
+    vl = [dict(v) for v in vals_list]
+    ok, resp = False, {"error": "safe_create_many_failed"}
+    for _ in range(5):
+        ok, resp = execute_kw(model, "create", [vl], None, rpc_id=rpc_id)
+        if ok:
+            break
+        unk = _extract_unknown_field(resp)
+        if unk and any(unk in v for v in vl):
+            for v in vl:
+                v.pop(unk, None)
+            continue
+        break
+
+    if not ok:
+        return False, [{"id": None, "ok": False, "vals": v, "error": resp} for v in vl]
+
+    ids = resp.get("result")
+    if not isinstance(ids, list):
+        ids = [ids]
+    return True, [
+        {"id": new_id, "ok": True, "vals": v} for new_id, v in zip(ids, vl)
+    ]
+
+
+def message_post_many(
+    model: str,
+    posts: List[Tuple[int, str]],
+    message_type: str = "comment",
+    subtype_xmlid: str = "mail.mt_comment",
+) -> Tuple[bool, List[Dict[str, Any]]]:
+    """
+    Publica varios mensajes de chatter en una sola creación de mail.message.
+    `posts` es una lista de (res_id, body).
+    """
+    vals_list = [
+        {
+            "body": body,
+            "message_type": message_type,
+            "subtype_xmlid": subtype_xmlid,
+            "res_id": int(res_id),
+            "model": model,
+        }
+        for res_id, body in posts
+    ]
+    return create_many("mail.message", vals_list, rpc_id=21)
@@ -0,0 +1,81 @@
+import os
+import time
+import uuid
+import random
+import cProfile
+import logging
+import functools
+from typing import Callable
+
+from flask import request
+
+import settings
+
+log = logging.getLogger("profiling")
+
+# Perfilado opcional por request. Sin PROFILE_DIR el decorador retorna la vista
+# original sin envolver: costo cero cuando está apagado.
+PROFILE_DIR = os.getenv("PROFILE_DIR", "")
+PROFILE_HEADER = os.getenv("PROFILE_HEADER", "X-Profile")
+PROFILE_MAX_FILES = int(os.getenv("PROFILE_MAX_FILES", "200"))
+
+
+def _debe_perfilar() -> bool:
+    if request.headers.get(PROFILE_HEADER, "").lower() in ["1", "true", "yes"]:
+        return True
+    tasa = settings.actual().profile_sample_rate
+    return tasa > 0 and random.random() < tasa
+
+
+def _aplicar_retencion() -> None:
+    archivos = sorted(
+        (os.path.join(PROFILE_DIR, f) for f in os.listdir(PROFILE_DIR) if f.endswith(".prof")),
+        key=os.path.getmtime,
+    )
+    for path in archivos[: max(0, len(archivos) - PROFILE_MAX_FILES)]:
+        try:
+            os.unlink(path)
+        except FileNotFoundError:
+            pass
+
+
+def perfilar(view: Callable) -> Callable:
+    """Decorador para vistas Flask: guarda un .prof (cProfile) por request muestreado."""
+    if not PROFILE_DIR:
+        return view
+
+    os.makedirs(PROFILE_DIR, exist_ok=True)
+    log.info(
+        "🔬 Perfilado activo en %s (muestreo=%s, header=%s)",
+        PROFILE_DIR,
+        settings.actual().profile_sample_rate,
+        PROFILE_HEADER,
+    )
+
+    @functools.wraps(view)
+    def wrapper(*args, **kwargs):
+        if not _debe_perfilar():
+            return view(*args, **kwargs)
+
+        trace_id = request.headers.get("X-Request-ID") or uuid.uuid4().hex[:12]
+        payload = request.get_json(silent=True) or {}
+        picking_id = payload.get("id") or payload.get("_id") or "na"
+
+        prof = cProfile.Profile()
+        inicio = time.perf_counter()
+        prof.enable()
+        try:
+            return view(*args, **kwargs)
+        finally:
+            prof.disable()
+            ms = (time.perf_counter() - inicio) * 1000
+            nombre = f"{time.strftime('%Y%m%dT%H%M%S')}_picking-{picking_id}_{trace_id}.prof"
+            nombre = "".join(c if c.isalnum() or c in "._-" else "_" for c in nombre)
+            try:
+                prof.dump_stats(os.path.join(PROFILE_DIR, nombre))
+                _aplicar_retencion()
+                log.info("🔬 Perfil guardado: %s (%.0f ms)", nombre, ms)
+            except OSError as e:
+                log.warning("⚠️ No se pudo guardar el perfil: %s", str(e))
+
+    return wrapper
@@ -0,0 +1,268 @@
+import os
+import math
+import time
+import logging
+import threading
+import xml.etree.ElementTree as ET
+from collections import Counter, OrderedDict
+from contextlib import contextmanager
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Tuple
+
+import requests
+
+import dane
+import settings
+from servientrega_ws22 import (
+    TEM,
+    cliente,
+    _envelope,
+    _extract_soap_fault,
+    _find_first_text_by_localname,
+    _parse_xml,
+)
+
+log = logging.getLogger("servientrega_quote")
+
+# Operación de liquidación (cotización) de Servientrega. Nombre y URL configurables
+# porque dependen del contrato/servicio habilitado para el código de facturación.
+# Vacío = la URL WS22 del tenant (QA o producción según su switch, como la creación de guías)
+SERVI_QUOTE_URL = os.getenv("SERVI_QUOTE_URL", "")
+SERVI_QUOTE_OPERATION = os.getenv("SERVI_QUOTE_OPERATION", "LiquidacionGuia")
+SERVI_QUOTE_ORIGEN = os.getenv("SERVI_QUOTE_ORIGEN", "11001000")
+
+QUOTE_VALOR_BRACKET = int(os.getenv("QUOTE_VALOR_BRACKET", "50000"))
+QUOTE_CACHE_MAX = int(os.getenv("QUOTE_CACHE_MAX", "10000"))  # entradas; se descartan las menos usadas
+QUOTE_VALOR_MIN = 5000
+QUOTE_PRECOMPUTE_PESOS = [1, 2, 3, 5, 10, 20]
+QUOTE_PRECOMPUTE_VALORES = [QUOTE_VALOR_BRACKET]
+
+# (cod_facturación, origen, destino, bracket_peso, bracket_valor) → (expira, resultado), en orden LRU
+_CACHE: "OrderedDict[Tuple[str, str, str, int, int], Tuple[float, Dict[str, Any]]]" = OrderedDict()
+# Lock por clave mientras haya peticiones esperándola: [lock, peticiones]
+_LOCKS: Dict[Tuple[str, str, str, int, int], List[Any]] = {}
+# Protege _LOCKS, _CACHE y STATS (secciones cortas, sin I/O)
+_LOCKS_GUARD = threading.Lock()
+STATS = {"hits": 0, "misses": 0, "errores": 0}
+
+
+def bracket_peso(peso: float) -> int:
+    """Kilos facturables: por kilo hasta 30 kg, luego en tramos de 5 kg."""
+    kg = max(1, math.ceil(float(peso or 0)))
+    return kg if kg <= 30 else int(math.ceil(kg / 5.0) * 5)
+
+
+def bracket_valor(valor: float) -> int:
+    """Valor declarado redondeado hacia arriba al tramo (la cotización queda del lado conservador)."""
+    v = max(float(valor or 0), QUOTE_VALOR_MIN)
+    return int(math.ceil(v / QUOTE_VALOR_BRACKET) * QUOTE_VALOR_BRACKET)
+
+
+def _clave(
+    destino: str, peso: float, valor: float, origen: Optional[str]
+) -> Tuple[str, str, str, int, int]:
+    # La tarifa depende del contrato: cada código de facturación (tenant) tiene su propia caché
+    return (
+        cliente().cod_fact or "",
+        origen or SERVI_QUOTE_ORIGEN,
+        str(destino),
+        bracket_peso(peso),
+        bracket_valor(valor),
+    )
+
+
+@contextmanager
+def _lock_para(clave: Tuple[str, str, str, int, int]) -> Iterator[None]:
+    """Serializa las peticiones de una misma clave; el lock se descarta con la última."""
+    with _LOCKS_GUARD:
+        entrada = _LOCKS.setdefault(clave, [threading.Lock(), 0])
+        entrada[1] += 1
+    try:
+        with entrada[0]:
+            yield
+    finally:
+        with _LOCKS_GUARD:
+            entrada[1] -= 1
+            if not entrada[1]:
+                _LOCKS.pop(clave, None)
+
+
+def _contar(stat: str) -> None:
+    with _LOCKS_GUARD:
+        STATS[stat] += 1
+
+
+def _vigente(clave: Tuple[str, str, str, int, int]) -> Optional[Dict[str, Any]]:
+    """Resultado cacheado y vigente de la clave (cuenta el hit y la marca como reciente)."""
+    with _LOCKS_GUARD:
+        entrada = _CACHE.get(clave)
+        if not entrada or entrada[0] <= time.time():
+            return None
+        _CACHE.move_to_end(clave)
+        STATS["hits"] += 1
+        return entrada[1]
+
+
+def _guardar(clave: Tuple[str, str, str, int, int], resultado: Dict[str, Any]) -> None:
+    expira = time.time() + settings.actual().quote_ttl
+    with _LOCKS_GUARD:
+        _purgar_vencidas()
+        _CACHE[clave] = (expira, resultado)
+        _CACHE.move_to_end(clave)
+        while len(_CACHE) > QUOTE_CACHE_MAX:
+            _CACHE.popitem(last=False)
+
+
+def liquidar(origen: str, destino: str, peso_kg: int, valor: int) -> Tuple[bool, Dict[str, Any]]:
+    """Llamada SOAP de liquidación a Servientrega (sin caché)."""
+    c = cliente()
+    url = SERVI_QUOTE_URL or c.url
+    if not url:
+        return False, {"error": "missing_env", "detail": "Falta SERVI_QUOTE_URL"}
+
+    root = ET.Element(f"{{{TEM}}}{SERVI_QUOTE_OPERATION}")
+    ET.SubElement(root, f"{{{TEM}}}Ide_CodFacturacion").text = c.cod_fact
+    ET.SubElement(root, f"{{{TEM}}}Des_CiudadOrigen").text = origen
+    ET.SubElement(root, f"{{{TEM}}}Des_CiudadDestino").text = destino
+    ET.SubElement(root, f"{{{TEM}}}Num_PesoTotal").text = str(peso_kg)
+    ET.SubElement(root, f"{{{TEM}}}Num_ValorDeclaradoTotal").text = str(valor)
+    ET.SubElement(root, f"{{{TEM}}}Num_Piezas").text = "1"
+
+    try:
+        r = c.session.post(
+            url,
+            data=_envelope(root).encode("utf-8"),
+            headers={"Content-Type": "text/xml; charset=utf-8"},
+            timeout=settings.actual().servi_quote_timeout,
+        )
+        r.raise_for_status()
+    except requests.RequestException as e:
+        return False, {"error": "quote_http_failed", "detail": str(e)}
+
+    fault = _extract_soap_fault(r.text)
+    if fault:
+        return False, fault
+
+    try:
+        root_resp = _parse_xml(r.text)
+        total = _find_first_text_by_localname(
+            root_resp, ["Num_ValorLiquidado", "ValorTotal", "Valor_Total", "Total"]
+        )
+        if not total:
+            return False, {"error": "no_valor_liquidado", "raw_xml": r.text}
+        flete = _find_first_text_by_localname(root_resp, ["Num_VlrFlete", "ValorFlete"])
+        sobreflete = _find_first_text_by_localname(root_resp, ["Num_VlrSobreflete", "ValorSobreflete"])
+        return True, {
+            "total": float(total),
+            "flete": float(flete) if flete else None,
+            "sobreflete": float(sobreflete) if sobreflete else None,
+        }
+    except (ET.ParseError, ValueError) as e:
+        # XML inválido o valores no numéricos (p. ej. "1.234,50"): error de cotización, no un 500
+        return False, {"error": "quote_invalid_response", "detail": str(e), "raw_xml": r.text}
+
+
+def cotizar(
+    destino: str, peso: float, valor: float, origen: Optional[str] = None
+) -> Tuple[bool, Dict[str, Any]]:
+    """
+    Cotización por (origen, destino DANE, tramo de peso, tramo de valor).
+    Responde desde memoria si la entrada sigue vigente; si no, liquida una sola vez
+    por clave aunque lleguen varias peticiones concurrentes.
+    """
+    # Solo municipios de la tabla DANE: un código arbitrario no llega a Servientrega ni a la caché
+    destino_ws22 = dane.codigo_ws22(str(destino))
+    if not destino_ws22:
+        return False, {"error": "destino_invalido", "detail": f"Código DANE desconocido: {destino}"}
+    origen_ws22 = dane.codigo_ws22(origen) if origen else SERVI_QUOTE_ORIGEN
+    if not origen_ws22:
+        return False, {"error": "origen_invalido", "detail": f"Código DANE desconocido: {origen}"}
+
+    clave = _clave(destino_ws22, peso, valor, origen_ws22)
+    resultado = _vigente(clave)
+    if resultado is not None:
+        return True, {**resultado, "cache": True}
+
+    with _lock_para(clave):
+        resultado = _vigente(clave)
+        if resultado is not None:
+            return True, {**resultado, "cache": True}
+
+        _contar("misses")
+        ok, data = liquidar(*clave[1:])
+        if not ok:
+            _contar("errores")
+            return False, data
+
+        resultado = {
+            **data,
+            "origen": clave[1],
+            "destino": clave[2],
+            "peso_kg": clave[3],
+            "valor_declarado": clave[4],
+            "cotizado": time.time(),
+        }
+        _guardar(clave, resultado)
+        return True, {**resultado, "cache": False}
+
+
+def _purgar_vencidas() -> int:
+    ahora = time.time()
+    vencidas = [k for k, (exp, _) in _CACHE.items() if exp <= ahora]
+    for k in vencidas:
+        del _CACHE[k]
+    return len(vencidas)
+
+
+def purgar_vencidas() -> int:
+    with _LOCKS_GUARD:
+        return _purgar_vencidas()
+
+
+def destinos_frecuentes(limit: int = 20, dias: int = 60) -> List[str]:
+    """Códigos DANE de los destinos más frecuentes en los pickings recientes (2 lecturas a Odoo)."""
+    from odoo_rpc import search_read, read
+
+    desde = time.strftime("%Y-%m-%d %H:%M:%S", time.gmtime(time.time() - dias * 86400))
+    ok, resp = search_read(
+        "stock.picking",
+        [["picking_type_code", "=", "outgoing"], ["date_done", ">=", desde]],
+        ["partner_id"],
+        limit=5000,
+    )
+    if not ok:
+        log.warning("⚠️ No se pudieron leer pickings recientes: %s", resp)
+        return []
+
+    conteo_partners = Counter(p["partner_id"][0] for p in resp.get("result", []) if p.get("partner_id"))
+    if not conteo_partners:
+        return []
+    ok, resp = read("res.partner", list(conteo_partners), ["city", "state_id"])
+    if not ok:
+        return []
+
+    conteo = Counter()
+    for partner in resp.get("result", []):
+        codigos = dane.resolver_partner(partner)
+        if codigos:
+            conteo[codigos["ciudad"]] += conteo_partners[partner["id"]]
+    return [c for c, _ in conteo.most_common(limit)]
+
+
+def precalcular(
+    destinos: Iterable[str],
+    pesos: Iterable[float] = QUOTE_PRECOMPUTE_PESOS,
+    valores: Iterable[float] = QUOTE_PRECOMPUTE_VALORES,
+    concurrencia: int = 4,
+) -> Dict[str, int]:
+    """Llena la caché para todas las combinaciones destino × peso × valor."""
+    combinaciones = [(d, p, v) for d in destinos for p in pesos for v in valores]
+    with ThreadPoolExecutor(max_workers=concurrencia, thread_name_prefix="quote") as ex:
+        resultados = list(ex.map(lambda c: cotizar(*c)[0], combinaciones))
+    ok = sum(resultados)
+    log.info("💲 Cotizaciones precalculadas: %s/%s", ok, len(combinaciones))
+    return {"total": len(combinaciones), "ok": ok}
+
+
+def precalcular_top(limit: int) -> Dict[str, int]:
+    return precalcular(destinos_frecuentes(limit))
@@ -2,11 +2,15 @@ import os
 import base64
 import logging
 import requests
+from requests.adapters import HTTPAdapter
+import soap_archive
 import xml.etree.ElementTree as ET
+from contextvars import ContextVar
 from typing import Optional, Dict, Any, List, Tuple
-from dotenv import load_dotenv
 
-load_dotenv()
+import settings
+import ws22_latency
+
 log = logging.getLogger("servientrega_ws22")
 
 # ===== SWITCH DE AMBIENTE SERVIENTREGA =====
@@ -26,7 +30,62 @@ else:
 SERVI_LOGIN = os.getenv("SERVI_LOGIN")
 SERVI_PWD_ENC = os.getenv("SERVI_PWD_ENC")
 SERVI_COD_FACT = os.getenv("SERVI_COD_FACT")
-TIMEOUT = int(os.getenv("SERVI_TIMEOUT", "60"))
+POOL_SIZE = int(os.getenv("SERVI_POOL_SIZE", "10"))
+
+
+class Ws22Client:
+    """Credenciales WS22 de un tenant (login/código de facturación) con su propia sesión keep-alive."""
+
+    def __init__(
+        self,
+        url: Optional[str],
+        login: Optional[str],
+        pwd_enc: Optional[str],
+        cod_fact: Optional[str],
+        timeout: Optional[int] = None,
+        pool_size: int = POOL_SIZE,
+        name: str = "default",
+    ):
+        self.name = name
+        self.url = url
+        self.login = login
+        self.pwd_enc = pwd_enc
+        self.cod_fact = cod_fact
+        self._timeout = timeout
+        self.session = requests.Session()
+        self.session.mount("https://", HTTPAdapter(pool_connections=1, pool_maxsize=pool_size))
+        self.session.mount("http://", HTTPAdapter(pool_connections=1, pool_maxsize=pool_size))
+
+    @property
+    def timeout(self) -> int:
+        # Sin timeout propio (tenant) se usa SERVI_TIMEOUT vigente: recargable en caliente
+        return self._timeout or settings.actual().servi_timeout
+
+
+# Cliente por defecto (variables de entorno) y cliente activo del request/tenant actual
+_default_client = Ws22Client(SERVI_URL, SERVI_LOGIN, SERVI_PWD_ENC, SERVI_COD_FACT)
+_current_client: ContextVar[Optional[Ws22Client]] = ContextVar("ws22_client", default=None)
+
+# Sesión HTTP del cliente por defecto (keep-alive hacia WS22)
+session = _default_client.session
+
+
+def cliente() -> Ws22Client:
+    return _current_client.get() or _default_client
+
+
+def cliente_por_defecto() -> Ws22Client:
+    return _default_client
+
+
+def usar_cliente(client: Optional[Ws22Client]):
+    """Activa un cliente para el contexto actual. Retorna el token para liberar_cliente()."""
+    return _current_client.set(client)
+
+
+def liberar_cliente(token) -> None:
+    _current_client.reset(token)
+
 
 SOAPENV = "http://schemas.xmlsoap.org/soap/envelope/"
 TEM = "http://tempuri.org/"
@@ -65,22 +124,37 @@ def _extract_soap_fault(xml_resp: str) -> Optional[Dict[str, Any]]:
     return None
 
 
-def _soap_post(xml: str) -> str:
+def _soap_post(xml: str, operacion: str) -> str:
+    c = cliente()
     headers = {"Content-Type": "text/xml; charset=utf-8"}
-    r = requests.post(
-        SERVI_URL, data=xml.encode("utf-8"), headers=headers, timeout=TIMEOUT
-    )
-    r.raise_for_status()
-    return r.text
+
+    def post(timeout: float) -> str:
+        r = c.session.post(c.url, data=xml.encode("utf-8"), headers=headers, timeout=timeout)
+        r.raise_for_status()
+        return r.text
+
+    try:
+        return ws22_latency.ejecutar(operacion, post, c.timeout)
+    except requests.RequestException as e:
+        # Sin respuesta útil también queda el request en el archivo (y el body del error HTTP, si lo hubo)
+        resp = getattr(e, "response", None)
+        soap_archive.registrar(
+            operacion,
+            xml,
+            resp.text if resp is not None else None,
+            http_status=resp.status_code if resp is not None else None,
+        )
+        raise
 
 
 def _envelope(body: ET.Element) -> str:
+    c = cliente()
     env = ET.Element(f"{{{SOAPENV}}}Envelope")
     hdr = ET.SubElement(env, f"{{{SOAPENV}}}Header")
     auth = ET.SubElement(hdr, f"{{{TEM}}}AuthHeader")
-    ET.SubElement(auth, f"{{{TEM}}}login").text = SERVI_LOGIN
-    ET.SubElement(auth, f"{{{TEM}}}pwd").text = SERVI_PWD_ENC
-    ET.SubElement(auth, f"{{{TEM}}}Id_CodFacturacion").text = SERVI_COD_FACT
+    ET.SubElement(auth, f"{{{TEM}}}login").text = c.login
+    ET.SubElement(auth, f"{{{TEM}}}pwd").text = c.pwd_enc
+    ET.SubElement(auth, f"{{{TEM}}}Id_CodFacturacion").text = c.cod_fact
     ET.SubElement(auth, f"{{{TEM}}}Nombre_Cargue").text = "Odoo Servientrega"
     bod = ET.SubElement(env, f"{{{SOAPENV}}}Body")
     bod.append(body)
@@ -94,15 +168,23 @@ def create_shipment_envios_externo(envio_xml_inner: str) -> Tuple[bool, Dict[str
     obj = ET.SubElement(dto, f"{{{TEM}}}objEnvios")
 
     obj.append(ET.fromstring(envio_xml_inner))
-    xml_resp = _soap_post(_envelope(root))
+    xml_req = _envelope(root)
+    xml_resp = _soap_post(xml_req, "CargueMasivoExterno")
 
-    fault = _extract_soap_fault(xml_resp)
-    if fault:
-        fault["raw_xml"] = xml_resp
-        return False, fault
+    guia = None
+    try:
+        fault = _extract_soap_fault(xml_resp)
+        if fault:
+            fault["raw_xml"] = xml_resp
+            return False, fault
+
+        guia = _find_first_text_by_localname(_parse_xml(xml_resp), ["Num_Guia", "NumeroGuia"])
+    except ET.ParseError as e:
+        return False, {"error": "invalid_xml", "detail": str(e), "raw_xml": xml_resp}
+    finally:
+        # Se archiva siempre, también cuando la respuesta no se puede interpretar
+        soap_archive.registrar("CargueMasivoExterno", xml_req, xml_resp, guia=guia)
 
-    root_resp = _parse_xml(xml_resp)
-    guia = _find_first_text_by_localname(root_resp, ["Num_Guia", "NumeroGuia"])
     if not guia:
         return False, {"error": "no_num_guia", "raw_xml": xml_resp}
 
@@ -113,11 +195,13 @@ def print_label(num_guia: str) -> Tuple[bool, Dict[str, Any]]:
     root = ET.Element(f"{{{TEM}}}GenerarGuiaSticker")
     ET.SubElement(root, f"{{{TEM}}}num_Guia").text = num_guia
     ET.SubElement(root, f"{{{TEM}}}num_GuiaFinal").text = num_guia
-    ET.SubElement(root, f"{{{TEM}}}ide_CodFacturacion").text = SERVI_COD_FACT
+    ET.SubElement(root, f"{{{TEM}}}ide_CodFacturacion").text = cliente().cod_fact
     ET.SubElement(root, f"{{{TEM}}}sFormatoImpresionGuia").text = "1"
     ET.SubElement(root, f"{{{TEM}}}interno").text = "false"
 
-    xml_resp = _soap_post(_envelope(root))
+    xml_req = _envelope(root)
+    xml_resp = _soap_post(xml_req, "GenerarGuiaSticker")
+    soap_archive.registrar("GenerarGuiaSticker", xml_req, xml_resp, guia=num_guia)
 
     fault = _extract_soap_fault(xml_resp)
     if fault:
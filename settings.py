@@ -0,0 +1,234 @@
+import os
+import json
+import time
+import signal
+import logging
+import threading
+from typing import Any, Callable, Dict, List, NamedTuple, Optional
+
+from dotenv import dotenv_values, find_dotenv, load_dotenv
+
+log = logging.getLogger("settings")
+
+# Entorno real del proceso (antes de mezclar el .env). Igual que load_dotenv(), una variable
+# definida en el entorno tiene prioridad sobre el archivo, también al recargar.
+_ENTORNO = dict(os.environ)
+
+SETTINGS_FILE = os.getenv("SETTINGS_FILE") or find_dotenv()
+SETTINGS_WATCH_INTERVAL = int(os.getenv("SETTINGS_WATCH_INTERVAL", "5"))
+
+# Credenciales, URLs y switches de ambiente se siguen leyendo de os.environ al importar
+# cada módulo (definen pools y clientes); el .env se carga una sola vez, aquí.
+load_dotenv(SETTINGS_FILE or None)
+
+# Nombres de los campos Studio según la base Odoo (sobrescribibles con ODOO_CAMPOS_* en JSON)
+CAMPOS_PRODUCCION = {
+    "check_servientrega": "x_studio_servientrega",  # Ajustar si en Prod se llama diferente
+    "contador_paquetes": "x_studio_numero_de_paquetes",  # Ajustar nombre real de Prod
+    "historial_paquetes": "x_studio_paquetes_transferidos",  # Ajustar nombre real de Prod
+    "estado_etiqueta": "x_studio_estado_etiqueta",  # Opcional (selection/char en Studio)
+}
+CAMPOS_PRUEBAS = {
+    "check_servientrega": "x_studio_servientrega",
+    "contador_paquetes": "packages_count",
+    "historial_paquetes": "package_history_ids",
+    "estado_etiqueta": "x_studio_estado_etiqueta",
+}
+
+# Unidad de longitud de las dimensiones de empaque en Odoo → cm para WS22
+FACTOR_A_CM = {"mm": 0.1, "cm": 1.0, "m": 100.0, "in": 2.54, "ft": 30.48}
+
+
+class Settings(NamedTuple):
+    """Parámetros recargables en caliente. Inmutable: una recarga reemplaza el objeto completo."""
+
+    odoo_timeout: int
+    servi_timeout: int
+    servi_quote_timeout: int
+    webhook_fast_path: bool
+    webhook_fast_path_max_age: int
+    label_async: bool
+    label_async_workers: int
+    label_async_retries: int
+    label_async_backoff: float
+    keepalive_interval: int
+    odoo_unidad_longitud: str
+    factor_a_cm: float
+    quote_ttl: int
+    profile_sample_rate: float
+    ws22_latency_min_samples: int
+    ws22_timeout_factor: float
+    ws22_timeout_min: float
+    ws22_hedge_enabled: bool
+    ws22_hedge_max_ratio: float
+    ws22_hedge_workers: int
+    campos_produccion: Dict[str, str]
+    campos_pruebas: Dict[str, str]
+
+
+class _Lector:
+    """Convierte y valida valores; acumula todos los errores para reportarlos juntos."""
+
+    def __init__(self, valores: Dict[str, Optional[str]]):
+        self.valores = valores
+        self.errores: List[str] = []
+
+    def _crudo(self, clave: str, default: str) -> str:
+        valor = self.valores.get(clave)
+        return default if valor is None or valor == "" else valor.strip()
+
+    def entero(self, clave: str, default: int, minimo: int = 0) -> int:
+        try:
+            valor = int(self._crudo(clave, str(default)))
+        except ValueError:
+            self.errores.append(f"{clave}: debe ser entero")
+            return default
+        if valor < minimo:
+            self.errores.append(f"{clave}: debe ser >= {minimo}")
+        return valor
+
+    def decimal(self, clave: str, default: float, minimo: float = 0.0, maximo: Optional[float] = None) -> float:
+        try:
+            valor = float(self._crudo(clave, str(default)))
+        except ValueError:
+            self.errores.append(f"{clave}: debe ser numérico")
+            return default
+        if valor < minimo or (maximo is not None and valor > maximo):
+            self.errores.append(f"{clave}: fuera de rango")
+        return valor
+
+    def flag(self, clave: str, default: bool) -> bool:
+        return self._crudo(clave, str(default)).lower() in ["true", "1", "yes"]
+
+    def texto(self, clave: str, default: str) -> str:
+        return self._crudo(clave, default)
+
+    def campos(self, clave: str, base: Dict[str, str]) -> Dict[str, str]:
+        crudo = self._crudo(clave, "")
+        if not crudo:
+            return dict(base)
+        try:
+            extra = json.loads(crudo)
+        except ValueError:
+            self.errores.append(f"{clave}: JSON inválido")
+            return dict(base)
+        if not isinstance(extra, dict) or not all(isinstance(v, str) for v in extra.values()):
+            self.errores.append(f"{clave}: debe ser un objeto {{clave: nombre_de_campo}}")
+            return dict(base)
+        desconocidas = set(extra) - set(base)
+        if desconocidas:
+            self.errores.append(f"{clave}: claves desconocidas {sorted(desconocidas)}")
+        return {**base, **extra}
+
+
+def _valores() -> Dict[str, Optional[str]]:
+    archivo = dotenv_values(SETTINGS_FILE) if SETTINGS_FILE and os.path.exists(SETTINGS_FILE) else {}
+    return {**archivo, **_ENTORNO}
+
+
+def cargar(valores: Optional[Dict[str, Optional[str]]] = None) -> Settings:
+    """Lee y valida la configuración. Lanza ValueError con todos los errores encontrados."""
+    r = _Lector(_valores() if valores is None else valores)
+    unidad = r.texto("ODOO_UNIDAD_LONGITUD", "mm").lower()
+    if unidad not in FACTOR_A_CM:
+        r.errores.append(f"ODOO_UNIDAD_LONGITUD: use una de {sorted(FACTOR_A_CM)}")
+
+    s = Settings(
+        odoo_timeout=r.entero("ODOO_TIMEOUT", 35, minimo=1),
+        servi_timeout=r.entero("SERVI_TIMEOUT", 60, minimo=1),
+        servi_quote_timeout=r.entero("SERVI_QUOTE_TIMEOUT", 20, minimo=1),
+        webhook_fast_path=r.flag("WEBHOOK_FAST_PATH", False),
+        webhook_fast_path_max_age=r.entero("WEBHOOK_FAST_PATH_MAX_AGE", 300),
+        label_async=r.flag("LABEL_ASYNC", False),
+        label_async_workers=r.entero("LABEL_ASYNC_WORKERS", 4, minimo=1),
+        label_async_retries=r.entero("LABEL_ASYNC_RETRIES", 5, minimo=1),
+        label_async_backoff=r.decimal("LABEL_ASYNC_BACKOFF", 5.0),
+        keepalive_interval=r.entero("KEEPALIVE_INTERVAL", 60),
+        odoo_unidad_longitud=unidad,
+        factor_a_cm=FACTOR_A_CM.get(unidad, 0.1),
+        quote_ttl=r.entero("QUOTE_TTL", 12 * 3600),
+        profile_sample_rate=r.decimal("PROFILE_SAMPLE_RATE", 0.0, maximo=1.0),
+        ws22_latency_min_samples=r.entero("WS22_LATENCY_MIN_SAMPLES", 20, minimo=1),
+        ws22_timeout_factor=r.decimal("WS22_TIMEOUT_FACTOR", 3.0, minimo=1.0),
+        ws22_timeout_min=r.decimal("WS22_TIMEOUT_MIN", 10.0),
+        ws22_hedge_enabled=r.flag("WS22_HEDGE_ENABLED", True),
+        ws22_hedge_max_ratio=r.decimal("WS22_HEDGE_MAX_RATIO", 0.2, maximo=1.0),
+        ws22_hedge_workers=r.entero("WS22_HEDGE_WORKERS", 8, minimo=1),
+        campos_produccion=r.campos("ODOO_CAMPOS_PRODUCCION", CAMPOS_PRODUCCION),
+        campos_pruebas=r.campos("ODOO_CAMPOS_PRUEBAS", CAMPOS_PRUEBAS),
+    )
+    if r.errores:
+        raise ValueError("Configuración inválida: " + "; ".join(r.errores))
+    return s
+
+
+def _mtime() -> Optional[float]:
+    try:
+        return os.path.getmtime(SETTINGS_FILE) if SETTINGS_FILE else None
+    except OSError:
+        return None
+
+
+# Objeto vigente: se lee sin lock (una referencia); la recarga lo reemplaza de una vez
+_actual: Settings = cargar()
+_mtime_cargado = _mtime()
+_recarga_lock = threading.Lock()
+_suscriptores: List[Callable[[Settings, Settings], Any]] = []
+
+
+def actual() -> Settings:
+    return _actual
+
+
+def suscribir(fn: Callable[[Settings, Settings], Any]) -> None:
+    """Registra fn(anterior, nuevo), llamado después de cada recarga exitosa."""
+    _suscriptores.append(fn)
+
+
+def recargar() -> bool:
+    """Relee el archivo y el entorno. Si la nueva configuración es inválida se conserva la vigente."""
+    global _actual, _mtime_cargado
+    with _recarga_lock:
+        _mtime_cargado = _mtime()
+        try:
+            nuevo = cargar()
+        except ValueError as e:
+            log.error("❌ %s (se mantiene la configuración vigente)", str(e))
+            return False
+        anterior, _actual = _actual, nuevo
+
+    cambios = [f for f in Settings._fields if getattr(anterior, f) != getattr(nuevo, f)]
+    log.info("🔧 Configuración recargada: %s", ", ".join(cambios) or "sin cambios")
+    for fn in list(_suscriptores):
+        try:
+            fn(anterior, nuevo)
+        except Exception as e:
+            log.error("❌ Error aplicando la configuración recargada (%s): %s", fn.__name__, str(e))
+    return True
+
+
+def _loop_vigilar(intervalo: int) -> None:
+    while True:
+        time.sleep(intervalo)
+        if _mtime() != _mtime_cargado:
+            recargar()
+
+
+def instalar_recarga() -> None:
+    """
+    SIGHUP y/o cambio del archivo disparan recargar(). La recarga corre en un hilo aparte:
+    el handler de la señal no toma locks ni hace I/O.
+    """
+    try:
+        signal.signal(
+            signal.SIGHUP,
+            lambda signum, frame: threading.Thread(target=recargar, name="settings-reload", daemon=True).start(),
+        )
+    except (ValueError, AttributeError):
+        # Fuera del hilo principal (o sin SIGHUP): queda solo la vigilancia del archivo
+        log.info("🔧 SIGHUP no disponible en este proceso; recarga solo por cambio de archivo")
+
+    if SETTINGS_WATCH_INTERVAL > 0 and SETTINGS_FILE:
+        threading.Thread(
+            target=_loop_vigilar, args=(SETTINGS_WATCH_INTERVAL,), name="settings-watch", daemon=True
+        ).start()
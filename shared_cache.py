@@ -0,0 +1,184 @@
+import os
+import time
+import sqlite3
+import logging
+import threading
+from typing import Any, Optional
+
+import json_codec
+
+log = logging.getLogger("shared_cache")
+
+# Caché compartida entre workers (SQLite WAL en disco local), debajo de las cachés en memoria
+# de cada proceso: lo que un worker trae de Odoo queda disponible para los demás.
+# Vacío = desactivada (cada proceso solo con su caché en memoria). Usar una ruta absoluta:
+# todos los workers deben abrir el mismo archivo sin importar su directorio de trabajo.
+SHARED_CACHE_DB = os.getenv("SHARED_CACHE_DB", "")
+SHARED_CACHE_MAX_ROWS = int(os.getenv("SHARED_CACHE_MAX_ROWS", "50000"))
+SHARED_CACHE_PURGE_EVERY = int(os.getenv("SHARED_CACHE_PURGE_EVERY", "500"))  # escrituras entre purgas
+
+# TTL por espacio de nombres (segundos)
+TTL_FIELDS_GET = int(os.getenv("SHARED_CACHE_FIELDS_TTL", "3600"))
+TTL_DANE = int(os.getenv("SHARED_CACHE_DANE_TTL", str(24 * 3600)))
+# Registros res.partner: 0 = no se cachean (una dirección editada en Odoo se vería hasta el TTL)
+TTL_PARTNER = int(os.getenv("SHARED_CACHE_PARTNER_TTL", "0"))
+# Guía recién creada por (tenant, picking): evita una segunda guía mientras se escribe en Odoo
+TTL_IDEMPOTENCIA = int(os.getenv("SHARED_CACHE_IDEMPOTENCY_TTL", "900"))
+# Reclamo "creando guía" por (tenant, picking) mientras dura la llamada a CargueMasivoExterno
+TTL_RECLAMO = int(os.getenv("SHARED_CACHE_CLAIM_TTL", "300"))
+# Estado del sticker diferido por (tenant, guía): /labels/<guia>/status responde en cualquier worker
+TTL_ETIQUETA = int(os.getenv("SHARED_CACHE_LABEL_STATUS_TTL", str(24 * 3600)))
+
+# Distingue "no está" de un valor cacheado None (p. ej. ciudad sin código DANE)
+FALTA = object()
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS cache (
+    ns TEXT NOT NULL,
+    clave TEXT NOT NULL,
+    valor BLOB NOT NULL,
+    expira REAL NOT NULL,
+    PRIMARY KEY (ns, clave)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS ix_cache_expira ON cache (expira);
+"""
+
+_local = threading.local()
+_escrituras = 0
+
+
+def activa() -> bool:
+    return bool(SHARED_CACHE_DB)
+
+
+def _conn() -> sqlite3.Connection:
+    conn = getattr(_local, "conn", None)
+    # Una conexión heredada de otro proceso (fork de Gunicorn) no se reutiliza
+    if conn is None or _local.pid != os.getpid():
+        conn = sqlite3.connect(SHARED_CACHE_DB, timeout=2, isolation_level=None)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        conn.executescript(_SCHEMA)
+        _local.conn, _local.pid = conn, os.getpid()
+    return conn
+
+
+def get(ns: str, clave: str) -> Any:
+    """Valor vigente o FALTA. Un error de SQLite cuenta como miss: la caché nunca rompe el flujo."""
+    if not SHARED_CACHE_DB:
+        return FALTA
+    try:
+        row = _conn().execute(
+            "SELECT valor FROM cache WHERE ns=? AND clave=? AND expira>?", (ns, clave, time.time())
+        ).fetchone()
+    except sqlite3.Error as e:
+        log.warning("⚠️ Caché compartida no disponible (get %s): %s", ns, str(e))
+        return FALTA
+    return json_codec.loads(row[0]) if row else FALTA
+
+
+def set(ns: str, clave: str, valor: Any, ttl: int) -> None:
+    if not SHARED_CACHE_DB or ttl <= 0:
+        return
+    try:
+        _conn().execute(
+            "INSERT OR REPLACE INTO cache (ns, clave, valor, expira) VALUES (?, ?, ?, ?)",
+            (ns, clave, json_codec.dumps(valor), time.time() + ttl),
+        )
+    except sqlite3.Error as e:
+        log.warning("⚠️ Caché compartida no disponible (set %s): %s", ns, str(e))
+        return
+    _tal_vez_purgar()
+
+
+def set_max(ns: str, clave: str, valor: str, ttl: int) -> None:
+    """
+    Guarda `valor` solo si es mayor (orden de texto) que el vigente, en una sola sentencia:
+    dos workers que escriben a la vez nunca retroceden el valor.
+    """
+    if not SHARED_CACHE_DB or ttl <= 0:
+        return
+    ahora = time.time()
+    try:
+        _conn().execute(
+            "INSERT INTO cache (ns, clave, valor, expira) VALUES (?, ?, ?, ?) "
+            "ON CONFLICT (ns, clave) DO UPDATE SET valor=excluded.valor, expira=excluded.expira "
+            "WHERE cache.expira<=? OR excluded.valor>cache.valor",
+            (ns, clave, json_codec.dumps(valor), ahora + ttl, ahora),
+        )
+    except sqlite3.Error as e:
+        log.warning("⚠️ Caché compartida no disponible (set_max %s): %s", ns, str(e))
+        return
+    _tal_vez_purgar()
+
+
+def reclamar(ns: str, clave: str, valor: Any, ttl: int) -> bool:
+    """
+    Guarda `valor` solo si no hay uno vigente, en una sola sentencia. True si este proceso
+    quedó con la clave; False si otro la tiene. Desactivada o con error de SQLite: True
+    (sin caché compartida cada worker solo cuenta con lo que ya está en Odoo).
+    """
+    if not SHARED_CACHE_DB:
+        return True
+    ahora = time.time()
+    try:
+        cur = _conn().execute(
+            "INSERT INTO cache (ns, clave, valor, expira) VALUES (?, ?, ?, ?) "
+            "ON CONFLICT (ns, clave) DO UPDATE SET valor=excluded.valor, expira=excluded.expira "
+            "WHERE cache.expira<=?",
+            (ns, clave, json_codec.dumps(valor), ahora + ttl, ahora),
+        )
+    except sqlite3.Error as e:
+        log.warning("⚠️ Caché compartida no disponible (reclamar %s): %s", ns, str(e))
+        return True
+    _tal_vez_purgar()
+    return cur.rowcount == 1
+
+
+def delete(ns: str, clave: str) -> None:
+    if not SHARED_CACHE_DB:
+        return
+    try:
+        _conn().execute("DELETE FROM cache WHERE ns=? AND clave=?", (ns, clave))
+    except sqlite3.Error as e:
+        log.warning("⚠️ Caché compartida no disponible (delete %s): %s", ns, str(e))
+
+
+# Namespaces que el tope de filas nunca desaloja (solo vencen por TTL): desalojar un reclamo
+# o una guía recién creada abriría la puerta a una segunda guía del mismo picking
+NS_SIN_DESALOJO = ("guia",)
+
+
+def purgar() -> int:
+    """
+    Elimina lo vencido y, si aún se excede SHARED_CACHE_MAX_ROWS, lo más próximo a vencer
+    fuera de NS_SIN_DESALOJO.
+    """
+    conn = _conn()
+    borradas = conn.execute("DELETE FROM cache WHERE expira<=?", (time.time(),)).rowcount
+    excluidos = ",".join("?" * len(NS_SIN_DESALOJO))
+    exceso = conn.execute("SELECT COUNT(*) FROM cache").fetchone()[0] - SHARED_CACHE_MAX_ROWS
+    if exceso > 0:
+        borradas += conn.execute(
+            "DELETE FROM cache WHERE (ns, clave) IN "
+            f"(SELECT ns, clave FROM cache WHERE ns NOT IN ({excluidos}) ORDER BY expira LIMIT ?)",
+            (*NS_SIN_DESALOJO, exceso),
+        ).rowcount
+    return borradas
+
+
+def _tal_vez_purgar() -> None:
+    global _escrituras
+    _escrituras += 1
+    if _escrituras % SHARED_CACHE_PURGE_EVERY:
+        return
+    try:
+        borradas = purgar()
+        if borradas:
+            log.info("🧹 Caché compartida: %s entradas desalojadas", borradas)
+    except sqlite3.Error as e:
+        log.warning("⚠️ No se pudo purgar la caché compartida: %s", str(e))
+
+
+def clave(*partes: Optional[Any]) -> str:
+    return "|".join("" if p is None else str(p) for p in partes)
@@ -0,0 +1,202 @@
+import os
+import re
+import sys
+import gzip
+import json
+import fcntl
+import time
+import queue
+import logging
+import argparse
+import threading
+from typing import Any, Dict, Iterator, List, Optional
+
+log = logging.getLogger("soap_archive")
+
+# Archivo append-only de intercambios SOAP WS22:
+#   <dir>/seg-000001.gz   → segmentos; cada intercambio es un miembro gzip independiente
+#   <dir>/index.jsonl     → índice {ts, op, picking_id, guia, seg, off, len}
+SOAP_ARCHIVE_ENABLED = os.getenv("SOAP_ARCHIVE_ENABLED", "true").lower() in ["true", "1", "yes"]
+SOAP_ARCHIVE_DIR = os.getenv("SOAP_ARCHIVE_DIR", "soap_archive")
+SOAP_ARCHIVE_SEGMENT_MB = int(os.getenv("SOAP_ARCHIVE_SEGMENT_MB", "64"))
+SOAP_ARCHIVE_QUEUE = int(os.getenv("SOAP_ARCHIVE_QUEUE", "1000"))
+
+INDEX_FILE = "index.jsonl"
+_PWD_RE = re.compile(r"(<(?:\w+:)?pwd>)(.*?)(</(?:\w+:)?pwd>)", re.S)
+
+_queue: "queue.Queue[Dict[str, Any]]" = queue.Queue(maxsize=SOAP_ARCHIVE_QUEUE)
+_writer: Optional[threading.Thread] = None
+_writer_lock = threading.Lock()
+
+
+def _enmascarar(xml: Optional[str]) -> Optional[str]:
+    """No archivar la contraseña WS22 del AuthHeader."""
+    return _PWD_RE.sub(r"\1***\3", xml) if xml else xml
+
+
+def registrar(
+    operacion: str,
+    request_xml: Optional[str],
+    response_xml: Optional[str],
+    picking_id: Optional[int] = None,
+    guia: Optional[str] = None,
+    http_status: Optional[int] = None,
+) -> bool:
+    """
+    Encola un intercambio SOAP para archivarlo. No bloquea: si la cola está llena,
+    el intercambio se descarta con un warning (el request nunca espera al disco).
+    """
+    if not SOAP_ARCHIVE_ENABLED:
+        return False
+    _arrancar_writer()
+    record = {
+        "ts": time.time(),
+        "op": operacion,
+        "picking_id": picking_id,
+        "guia": guia,
+        "http_status": http_status,
+        "request": _enmascarar(request_xml),
+        "response": response_xml,
+    }
+    try:
+        _queue.put_nowait(record)
+        return True
+    except queue.Full:
+        log.warning("⚠️ Archivo SOAP saturado: se descarta intercambio %s (guía %s)", operacion, guia)
+        return False
+
+
+def _arrancar_writer() -> None:
+    global _writer
+    if _writer and _writer.is_alive():
+        return
+    with _writer_lock:
+        if _writer and _writer.is_alive():
+            return
+        _writer = threading.Thread(target=_loop_writer, name="soap-archive", daemon=True)
+        _writer.start()
+
+
+def _segmento_actual() -> str:
+    os.makedirs(SOAP_ARCHIVE_DIR, exist_ok=True)
+    segs = sorted(f for f in os.listdir(SOAP_ARCHIVE_DIR) if f.startswith("seg-") and f.endswith(".gz"))
+    if not segs:
+        return "seg-000001.gz"
+    ultimo = segs[-1]
+    if os.path.getsize(os.path.join(SOAP_ARCHIVE_DIR, ultimo)) >= SOAP_ARCHIVE_SEGMENT_MB * 1024 * 1024:
+        return f"seg-{int(ultimo[4:10]) + 1:06d}.gz"
+    return ultimo
+
+
+def _escribir(record: Dict[str, Any]) -> None:
+    blob = gzip.compress(json.dumps(record, ensure_ascii=False).encode("utf-8"))
+    os.makedirs(SOAP_ARCHIVE_DIR, exist_ok=True)
+    # Lock sobre el índice: varios workers (procesos) pueden compartir el directorio
+    with open(os.path.join(SOAP_ARCHIVE_DIR, INDEX_FILE), "a", encoding="utf-8") as idx:
+        fcntl.flock(idx, fcntl.LOCK_EX)
+        try:
+            seg = _segmento_actual()
+            with open(os.path.join(SOAP_ARCHIVE_DIR, seg), "ab") as fh:
+                fh.seek(0, os.SEEK_END)
+                off = fh.tell()
+                fh.write(blob)
+            entry = {
+                "ts": record["ts"],
+                "op": record["op"],
+                "picking_id": record["picking_id"],
+                "guia": record["guia"],
+                "seg": seg,
+                "off": off,
+                "len": len(blob),
+            }
+            idx.write(json.dumps(entry) + "\n")
+            idx.flush()
+        finally:
+            fcntl.flock(idx, fcntl.LOCK_UN)
+
+
+def _loop_writer() -> None:
+    while True:
+        record = _queue.get()
+        try:
+            _escribir(record)
+        except Exception as e:
+            log.error("❌ Error archivando intercambio SOAP: %s", str(e))
+        finally:
+            _queue.task_done()
+
+
+def flush(timeout: float = 5.0) -> None:
+    """Espera a que la cola se vacíe (para CLI/pruebas; el request path no lo usa)."""
+    limite = time.time() + timeout
+    while _queue.unfinished_tasks and time.time() < limite:
+        time.sleep(0.01)
+
+
+# ---------- consulta ----------
+def buscar(
+    guia: Optional[str] = None,
+    picking_id: Optional[int] = None,
+    desde: Optional[float] = None,
+    hasta: Optional[float] = None,
+) -> List[Dict[str, Any]]:
+    """Entradas del índice que cumplen los filtros (sin abrir los segmentos)."""
+    path = os.path.join(SOAP_ARCHIVE_DIR, INDEX_FILE)
+    if not os.path.exists(path):
+        return []
+    out = []
+    with open(path, encoding="utf-8") as fh:
+        for line in fh:
+            try:
+                e = json.loads(line)
+            except ValueError:
+                continue
+            if guia is not None and str(e.get("guia")) != str(guia):
+                continue
+            if picking_id is not None and e.get("picking_id") != picking_id:
+                continue
+            if desde is not None and e["ts"] < desde:
+                continue
+            if hasta is not None and e["ts"] > hasta:
+                continue
+            out.append(e)
+    return out
+
+
+def leer(entry: Dict[str, Any]) -> Dict[str, Any]:
+    """Lee un intercambio completo posicionándose directo en su offset del segmento."""
+    with open(os.path.join(SOAP_ARCHIVE_DIR, entry["seg"]), "rb") as fh:
+        fh.seek(entry["off"])
+        blob = fh.read(entry["len"])
+    return json.loads(gzip.decompress(blob).decode("utf-8"))
+
+
+def intercambios(**filtros: Any) -> Iterator[Dict[str, Any]]:
+    for entry in buscar(**filtros):
+        yield leer(entry)
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Consulta el archivo de intercambios SOAP WS22")
+    parser.add_argument("--guia", help="número de guía")
+    parser.add_argument("--picking", type=int, help="ID de stock.picking")
+    parser.add_argument("--desde", type=float, help="timestamp epoch mínimo")
+    parser.add_argument("--hasta", type=float, help="timestamp epoch máximo")
+    parser.add_argument("--op", help="filtrar por operación (ej: CargueMasivoExterno)")
+    parser.add_argument("--index-only", action="store_true", help="solo mostrar entradas del índice")
+    args = parser.parse_args(argv)
+
+    if args.guia is None and args.picking is None and args.desde is None:
+        parser.error("indique --guia, --picking o --desde")
+
+    entries = buscar(guia=args.guia, picking_id=args.picking, desde=args.desde, hasta=args.hasta)
+    if args.op:
+        entries = [e for e in entries if e["op"] == args.op]
+    for e in entries:
+        data = e if args.index_only else leer(e)
+        sys.stdout.write(json.dumps(data, ensure_ascii=False, indent=2) + "\n")
+    return 0 if entries else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
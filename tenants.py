@@ -0,0 +1,168 @@
+import os
+import json
+import logging
+import contextlib
+from contextvars import ContextVar
+from typing import Any, Dict, Iterator, List, Optional
+
+import odoo_rpc
+import servientrega_ws22
+import settings
+from odoo_rpc import OdooClient
+from servientrega_ws22 import Ws22Client
+
+log = logging.getLogger("tenants")
+
+# Archivo JSON con los tenants adicionales (empresa Odoo + código de facturación Servientrega).
+# El tenant "default" siempre existe y sale de las variables de entorno de siempre.
+TENANTS_FILE = os.getenv("TENANTS_FILE", "")
+TENANT_HEADER = os.getenv("TENANT_HEADER", "X-Tenant")
+DEFAULT_TENANT = "default"
+
+
+class Tenant:
+    """Una empresa servida por el webhook: su cliente Odoo, su cliente WS22 y sus nombres de campos."""
+
+    def __init__(
+        self,
+        nombre: str,
+        odoo: OdooClient,
+        ws22: Ws22Client,
+        odoo_produccion: bool,
+        servi_produccion: bool,
+        campos: Optional[Dict[str, str]] = None,
+    ):
+        self.nombre = nombre
+        self.odoo = odoo
+        self.ws22 = ws22
+        self.odoo_produccion = odoo_produccion
+        self.servi_produccion = servi_produccion
+        self._campos = campos or {}
+
+    @property
+    def campos(self) -> Dict[str, str]:
+        """Nombres de campos vigentes (settings recargables + los propios del tenant)."""
+        s = settings.actual()
+        base = s.campos_produccion if self.odoo_produccion else s.campos_pruebas
+        return {**base, **self._campos} if self._campos else base
+
+    def __repr__(self) -> str:
+        return f"Tenant({self.nombre!r})"
+
+
+# Registro inmutable por referencia: cargar() arma uno nuevo y lo reemplaza de una vez
+_TENANTS: Dict[str, Tenant] = {}
+_current: ContextVar[Optional[Tenant]] = ContextVar("tenant", default=None)
+
+
+def _flag(valor: Any) -> bool:
+    return str(valor).lower() in ["true", "1", "yes"]
+
+
+def _expandir(valor: Any) -> Any:
+    """Permite "${VAR}" en el archivo para no guardar contraseñas en claro."""
+    return os.path.expandvars(valor) if isinstance(valor, str) else valor
+
+
+def _tenant_desde_config(nombre: str, cfg: Dict[str, Any]) -> Tenant:
+    o = {k: _expandir(v) for k, v in (cfg.get("odoo") or {}).items()}
+    s = {k: _expandir(v) for k, v in (cfg.get("servientrega") or {}).items()}
+    odoo_prod = _flag(o.get("production", False))
+    servi_prod = _flag(s.get("production", False))
+
+    odoo = OdooClient(
+        o.get("jsonrpc"),
+        o.get("db"),
+        int(o.get("uid", 2)),
+        o.get("password"),
+        timeout=int(o["timeout"]) if o.get("timeout") else None,
+        pool_size=int(o.get("pool_size", odoo_rpc.POOL_SIZE)),
+        rate_limit=float(o.get("rate_limit", odoo_rpc.RATE_LIMIT)),
+        name=nombre,
+    )
+    ws22 = Ws22Client(
+        s.get("url") or (s.get("url_prod") if servi_prod else s.get("url_qa")),
+        s.get("login"),
+        s.get("pwd_enc"),
+        s.get("cod_fact"),
+        timeout=int(s["timeout"]) if s.get("timeout") else None,
+        pool_size=int(s.get("pool_size", servientrega_ws22.POOL_SIZE)),
+        name=nombre,
+    )
+    return Tenant(nombre, odoo, ws22, odoo_prod, servi_prod, cfg.get("campos"))
+
+
+def cargar(path: Optional[str] = None) -> Dict[str, Tenant]:
+    """(Re)construye el registro: "default" desde el entorno + los definidos en TENANTS_FILE."""
+    global _TENANTS
+    path = TENANTS_FILE if path is None else path
+    registro = {
+        DEFAULT_TENANT: Tenant(
+            DEFAULT_TENANT,
+            odoo_rpc.cliente_por_defecto(),
+            servientrega_ws22.cliente_por_defecto(),
+            odoo_rpc.USE_PRODUCTION,
+            servientrega_ws22.SERVI_USE_PRODUCTION,
+        )
+    }
+    if path:
+        with open(path, encoding="utf-8") as fh:
+            data = json.load(fh)
+        for nombre, cfg in data.items():
+            if nombre == DEFAULT_TENANT:
+                log.warning("⚠️ El tenant 'default' se configura por entorno; se ignora en %s", path)
+                continue
+            registro[nombre] = _tenant_desde_config(nombre, cfg)
+    _TENANTS = registro
+    log.info("🏢 Tenants cargados: %s", ", ".join(sorted(_TENANTS)))
+    return _TENANTS
+
+
+def obtener(nombre: Optional[str]) -> Optional[Tenant]:
+    if not _TENANTS:
+        cargar()
+    return _TENANTS.get(nombre or DEFAULT_TENANT)
+
+
+def todos() -> List[Tenant]:
+    if not _TENANTS:
+        cargar()
+    return list(_TENANTS.values())
+
+
+def actual() -> Tenant:
+    return _current.get() or obtener(DEFAULT_TENANT)
+
+
+def entrar(tenant: Tenant) -> tuple:
+    """Activa el tenant (y sus clientes Odoo/WS22) en el contexto actual. Retorna los tokens."""
+    return (
+        _current.set(tenant),
+        odoo_rpc.usar_cliente(tenant.odoo),
+        servientrega_ws22.usar_cliente(tenant.ws22),
+    )
+
+
+def salir(tokens: tuple) -> None:
+    t, o, s = tokens
+    servientrega_ws22.liberar_cliente(s)
+    odoo_rpc.liberar_cliente(o)
+    _current.reset(t)
+
+
+def _recargar(anterior, nuevo) -> None:
+    # Con SIGHUP/cambio de configuración también se releen los tenants (nuevos pools)
+    if TENANTS_FILE:
+        cargar()
+
+
+settings.suscribir(_recargar)
+
+
+@contextlib.contextmanager
+def activar(tenant: Tenant) -> Iterator[Tenant]:
+    tokens = entrar(tenant)
+    try:
+        yield tenant
+    finally:
+        salir(tokens)
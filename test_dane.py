@@ -0,0 +1,60 @@
+import csv
+
+import pytest
+
+import dane
+
+
+@pytest.mark.parametrize(
+    "ciudad, departamento, esperado",
+    [
+        ("Rionegro", "Santander", "68615000"),
+        ("Rionegro", "Antioquia", "05615000"),
+        ("Cartagena del Chaira", "Caqueta", "18150000"),
+        ("Mosquera", "Nariño", "52473000"),
+        ("Mosquera", "Cundinamarca", "25473000"),
+        ("Caldas", "Boyaca", "15131000"),
+        ("MEDELLIN", "ANTIOQUIA", "05001000"),
+        ("Medellin Antioquia", None, "05001000"),
+    ],
+)
+def test_resolver_por_departamento(ciudad, departamento, esperado):
+    assert dane.resolver(ciudad, departamento)["ciudad"] == esperado
+
+
+def test_fuzzy_dentro_del_departamento():
+    r = dane.resolver("Rionegroo", "Santander")
+    assert (r["ciudad"], r["metodo"]) == ("68615000", "fuzzy")
+
+
+def test_departamento_que_no_coincide():
+    assert dane.resolver("Medellin", "Santander") is None
+    assert dane.resolver("Mosquera", "Antioquia") is None
+    assert dane.resolver("Caldas", "Caqueta") is None
+
+
+def test_departamento_desconocido_no_filtra():
+    assert dane.resolver("Medellin", "Departamento Inventado")["ciudad"] == "05001000"
+
+
+def test_tabla_completa():
+    with open(dane.DANE_CSV, encoding="utf-8", newline="") as fh:
+        codigos = [r["codigo"] for r in csv.DictReader(fh)]
+    assert len(codigos) == len(set(codigos)) > 1100
+    assert all(len(c) == 5 and c.isdigit() for c in codigos)
+
+
+def test_importar_divipola_conserva_curado(tmp_path):
+    destino = tmp_path / "dane.csv"
+    destino.write_text("codigo,municipio,departamento,alias\n05001,Medellín,Antioquia,MDE\n", encoding="utf-8")
+    origen = tmp_path / "divipola.csv"
+    origen.write_text(
+        "Código Departamento,Nombre Departamento,Código Municipio,Nombre Municipio\n"
+        "05,ANTIOQUIA,05001,MEDELLÍN\n"
+        "05,ANTIOQUIA,5002,ABEJORRAL\n",
+        encoding="utf-8",
+    )
+    assert dane.importar_divipola(str(origen), str(destino)) == 2
+    with open(destino, encoding="utf-8", newline="") as fh:
+        filas = [tuple(r.values()) for r in csv.DictReader(fh)]
+    assert filas == [("05001", "Medellín", "Antioquia", "MDE"), ("05002", "ABEJORRAL", "ANTIOQUIA", "")]
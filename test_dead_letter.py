@@ -0,0 +1,118 @@
+import threading
+import time
+
+import pytest
+
+import dead_letter
+
+
+@pytest.fixture(autouse=True)
+def db(monkeypatch, tmp_path):
+    monkeypatch.setattr(dead_letter, "DEAD_LETTER_DB", str(tmp_path / "dead_letter.sqlite3"))
+    monkeypatch.setattr(dead_letter, "_local", threading.local())
+
+
+def test_clasificar_error():
+    assert dead_letter.clasificar_error(dead_letter.ETAPA_WS22, "Ciudad destino no existe") == "ws22_destino"
+    assert dead_letter.clasificar_error(dead_letter.ETAPA_WS22, "Error interno") == "ws22_rechazo"
+    assert dead_letter.clasificar_error(dead_letter.ETAPA_PERSISTENCIA, None) == "odoo_persist"
+
+
+def test_registrar_acumula_intentos():
+    a = dead_letter.registrar(241, dead_letter.ETAPA_WS22, "Teléfono inválido", {"payload": {"id": 241}})
+    b = dead_letter.registrar(241, dead_letter.ETAPA_WS22, "Dirección vacía")
+    otro_tenant = dead_letter.registrar(241, dead_letter.ETAPA_WS22, "Dirección vacía", tenant="acme")
+    assert a == b != otro_tenant
+    (entrada,) = dead_letter.listar(tenant="default")
+    assert (entrada["intentos"], entrada["error_class"]) == (2, "ws22_direccion")
+
+
+def _entradas():
+    dead_letter.registrar(1, dead_letter.ETAPA_WS22, "Ciudad destino no existe")
+    dead_letter.registrar(2, dead_letter.ETAPA_WS22, "Ciudad destino no existe")
+    dead_letter.registrar(3, dead_letter.ETAPA_PERSISTENCIA, "timeout", tenant="acme")
+    return dead_letter.listar(error_class="ws22_destino")
+
+
+def test_replay_por_clase():
+    entradas = _entradas()
+    assert [e["picking_id"] for e in entradas] == [1, 2]
+
+    out = dead_letter.reprocesar(
+        entradas, lambda e: (e["picking_id"] == 1, {"picking": e["picking_id"]}), concurrencia=2, por_segundo=0
+    )
+    assert (out["total"], out["ok"], out["fallidos"]) == (2, 1, 1)
+    assert [e["picking_id"] for e in dead_letter.listar(estado="reprocesado")] == [1]
+    (pendiente,) = dead_letter.listar(error_class="ws22_destino")
+    assert (pendiente["picking_id"], pendiente["intentos"]) == (2, 2)
+    # La entrada de otra clase no se tocó
+    assert dead_letter.listar(tenant="acme")[0]["intentos"] == 1
+
+
+def test_replay_excepcion_no_corta_el_lote():
+    entradas = _entradas()
+
+    def procesar(e):
+        if e["picking_id"] == 1:
+            raise RuntimeError("boom")
+        return True, {}
+
+    out = dead_letter.reprocesar(entradas, procesar, por_segundo=0)
+    fallo = next(r for r in out["resultados"] if not r["ok"])
+    assert fallo["detail"] == {"error": "replay_exception", "detail": "boom"}
+    assert out["ok"] == 1
+
+
+def test_replay_que_vuelve_a_fallar_cuenta_un_intento():
+    (entrada,) = [e for e in _entradas() if e["picking_id"] == 1]
+
+    def procesar(e):
+        # El propio reproceso registra el fallo (como el webhook): no se cuenta dos veces
+        dead_letter.registrar(e["picking_id"], dead_letter.ETAPA_WS22, "Ciudad destino no existe")
+        return False, {"error": "ws22"}
+
+    dead_letter.reprocesar([entrada], procesar, por_segundo=0)
+    assert dead_letter.listar(ids=[entrada["id"]])[0]["intentos"] == 2
+
+
+def test_replay_respeta_tasa():
+    entradas = [dead_letter.listar(ids=[dead_letter.registrar(n, dead_letter.ETAPA_STICKER, "x")])[0] for n in range(4)]
+    inicio = time.monotonic()
+    dead_letter.reprocesar(entradas, lambda e: (True, {}), concurrencia=4, por_segundo=20)
+    assert time.monotonic() - inicio >= 0.14
+
+
+def test_resolver_picking():
+    _entradas()
+    assert dead_letter.resolver_picking(1) == 1
+    assert [r["total"] for r in dead_letter.resumen()] == [1, 1]
+
+
+def test_sticker_que_falla_no_pierde_la_guia(webhook, monkeypatch):
+    """La guía ya existe en Servientrega: un timeout del sticker no impide escribirla en Odoo."""
+    import requests
+
+    def sticker_caido(guia):
+        raise requests.Timeout("GenerarGuiaSticker timeout")
+
+    persistidas = []
+    persistir = webhook.persistir_resultado_ws22
+
+    def espia(picking_id, guia, url, pdf_base64=None, estado_etiqueta=None):
+        persistidas.append((picking_id, guia, pdf_base64, estado_etiqueta))
+        return persistir(picking_id, guia, url, pdf_base64, estado_etiqueta)
+
+    monkeypatch.setattr(webhook, "generar_pdf_guia", sticker_caido)
+    monkeypatch.setattr(webhook, "persistir_resultado_ws22", espia)
+
+    resp = webhook.app.test_client().post("/webhook", json={"id": 241}, headers={"X-Tenant": "stub"})
+    body = resp.get_json()
+    assert resp.status_code == 200
+    assert body["guia"] and body["label_status"] == "error"
+    assert persistidas == [(241, body["guia"], None, "error")]
+    (entrada,) = dead_letter.listar(tenant="stub")
+    assert (entrada["id"], entrada["etapa"], entrada["inputs"]) == (
+        body["dead_letter_id"],
+        dead_letter.ETAPA_STICKER,
+        {"guia": body["guia"]},
+    )
@@ -0,0 +1,115 @@
+from datetime import timedelta
+
+import pytest
+
+CAMPOS = ["name", "state", "carrier_tracking_ref", "partner_id"]
+
+
+@pytest.fixture
+def fast(webhook, monkeypatch):
+    import settings
+
+    monkeypatch.setattr(webhook, "_ULTIMO_WRITE_DATE", {})
+    monkeypatch.setattr(
+        settings,
+        "_actual",
+        settings.actual()._replace(webhook_fast_path=True, webhook_fast_path_max_age=300),
+    )
+    return webhook
+
+
+def write_date(webhook, hace=0.0):
+    return (webhook._utcnow() - timedelta(seconds=hace)).strftime("%Y-%m-%d %H:%M:%S")
+
+
+def body(webhook, hace=0.0, **extra):
+    return {
+        "id": 241,
+        "name": "WH/OUT/00241",
+        "state": "done",
+        "carrier_tracking_ref": False,
+        "partner_id": [77, "Cliente"],
+        "write_date": write_date(webhook, hace),
+        **extra,
+    }
+
+
+def test_body_completo_y_fresco(fast):
+    picking = fast.picking_desde_payload(body(fast, hace=5), 241, CAMPOS)
+    assert picking == {"id": 241, "name": "WH/OUT/00241", "state": "done", "carrier_tracking_ref": False, "partner_id": [77, "Cliente"]}
+
+
+@pytest.mark.parametrize(
+    "cambios",
+    [
+        {"state": None},  # se quita el campo
+        {"write_date": "ayer"},
+        {"write_date": None},
+    ],
+)
+def test_body_incompleto_se_lee_de_odoo(fast, cambios):
+    payload = body(fast)
+    for campo, valor in cambios.items():
+        if valor is None:
+            payload.pop(campo)
+        else:
+            payload[campo] = valor
+    assert fast.picking_desde_payload(payload, 241, CAMPOS) is None
+
+
+def test_body_viejo_se_lee_de_odoo(fast):
+    assert fast.picking_desde_payload(body(fast, hace=301), 241, CAMPOS) is None
+
+
+def test_duplicado_y_reordenado_se_leen_de_odoo(fast):
+    nuevo, viejo = body(fast, hace=5), body(fast, hace=20)
+    assert fast.picking_desde_payload(nuevo, 241, CAMPOS)
+    # Reintento de Odoo con el mismo body
+    assert fast.picking_desde_payload(nuevo, 241, CAMPOS) is None
+    # Body anterior que llega tarde
+    assert fast.picking_desde_payload(viejo, 241, CAMPOS) is None
+    # Otro picking no se ve afectado
+    assert fast.picking_desde_payload({**viejo, "id": 242}, 242, CAMPOS)
+
+
+def test_webhook_relee_solo_la_idempotencia(fast, monkeypatch):
+    """Con el body completo el read de stock.picking es el mínimo; la guía del body no decide."""
+    lecturas = []
+    leer = fast.safe_read_one
+
+    def espia(model, record_id, fields):
+        if model == "stock.picking":
+            lecturas.append(list(fields))
+        return leer(model, record_id, fields)
+
+    monkeypatch.setattr(fast, "safe_read_one", espia)
+    payload = body(
+        fast,
+        hace=5,
+        carrier_tracking_ref="2130009999",  # el body dice que ya tiene guía; Odoo dice que no
+        weight=2.5,
+        move_ids=[1, 2],
+        move_line_ids=[1],
+        carrier_id=[3, "Servientrega Nacional"],
+        x_studio_numero_de_paquetes=1,
+        packages_count=1,
+    )
+    resp = fast.app.test_client().post("/webhook", json=payload, headers={"X-Tenant": "stub"})
+    assert resp.status_code == 200 and resp.get_json()["guia"]
+    assert lecturas[0] == ["carrier_tracking_ref", "write_date", "x_studio_servientrega"]
+    assert "move_ids" not in [c for campos in lecturas for c in campos]
+
+
+def test_webhook_sin_fast_path_lee_el_picking_completo(webhook, monkeypatch):
+    lecturas = []
+    leer = webhook.safe_read_one
+
+    def espia(model, record_id, fields):
+        if model == "stock.picking":
+            lecturas.append(list(fields))
+        return leer(model, record_id, fields)
+
+    monkeypatch.setattr(webhook, "safe_read_one", espia)
+    resp = webhook.app.test_client().post("/webhook", json=body(webhook), headers={"X-Tenant": "stub"})
+    assert resp.status_code == 200
+    assert "move_ids" in lecturas[0]
@@ -0,0 +1,82 @@
+import base64
+import decimal
+import json
+import uuid
+from datetime import date, datetime
+
+import pytest
+
+import json_codec
+
+CODECS = sorted(json_codec.disponibles())
+
+PAYLOAD = {
+    "jsonrpc": "2.0",
+    "params": {
+        "args": [[241, 242], {"carrier_tracking_ref": "2130000001", "x_studio_estado_etiqueta": "adjunta"}],
+        "datas": base64.b64encode(b"%PDF-1.4" + bytes(range(256)) * 64).decode("ascii"),
+        "note": "Guía 2130000001 — Medellín ñ",
+        "peso": 2.5,
+        "activo": False,
+        "vacio": None,
+    },
+}
+
+
+@pytest.mark.parametrize("nombre", CODECS)
+def test_ida_y_vuelta_igual_que_stdlib(nombre):
+    codec = json_codec.disponibles()[nombre]
+    crudo = codec.dumps(PAYLOAD)
+    assert isinstance(crudo, bytes)
+    assert codec.loads(crudo) == PAYLOAD == json.loads(crudo)
+    # loads acepta bytes y str (request.get_json / respuestas de requests)
+    assert codec.loads(crudo.decode("utf-8")) == PAYLOAD
+    # Sin escapes \u: los acentos viajan en UTF-8
+    assert "Medellín".encode("utf-8") in crudo
+
+
+@pytest.mark.parametrize("nombre", CODECS)
+def test_tipos_no_nativos(nombre):
+    codec = json_codec.disponibles()[nombre]
+    id_ = uuid.UUID(int=241)
+    obj = {
+        "monto": decimal.Decimal("12.50"),
+        "id": id_,
+        "fecha": date(2024, 3, 1),
+        "ts": datetime(2024, 3, 1, 8, 30),
+        "tags": {"ws22"},
+        # Claves int (ids de Odoo) salen como texto, igual que json.dumps
+        7: "siete",
+    }
+    assert codec.loads(codec.dumps(obj)) == {
+        "monto": "12.50",
+        "id": str(id_),
+        "fecha": "2024-03-01",
+        "ts": "2024-03-01T08:30:00",
+        "tags": ["ws22"],
+        "7": "siete",
+    }
+    with pytest.raises(TypeError):
+        codec.dumps({"x": object()})
+
+
+def test_sin_orjson_cae_a_stdlib(monkeypatch):
+    monkeypatch.setattr(json_codec, "disponibles", lambda: {"stdlib": json_codec._stdlib()})
+    assert json_codec._elegir("auto").nombre == "stdlib"
+    assert json_codec._elegir("orjson").nombre == "stdlib"
+    assert json_codec._elegir("stdlib").nombre == "stdlib"
+
+
+def test_flask_usa_el_codec():
+    flask = pytest.importorskip("flask")
+    app = flask.Flask("codec")
+    json_codec.instalar_en_flask(app)
+
+    @app.post("/eco")
+    def eco():
+        return flask.jsonify({**flask.request.get_json(), "monto": decimal.Decimal("1.10")})
+
+    resp = app.test_client().post("/eco", data=json_codec.dumps(PAYLOAD), content_type="application/json")
+    assert resp.status_code == 200 and resp.mimetype == "application/json"
+    assert resp.get_json() == {**PAYLOAD, "monto": "1.10"}
+    assert resp.data == json_codec.dumps({**PAYLOAD, "monto": decimal.Decimal("1.10")})
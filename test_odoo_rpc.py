@@ -0,0 +1,115 @@
+import pytest
+
+pytest.importorskip("requests")
+pytest.importorskip("dotenv")
+
+import odoo_rpc  # noqa: E402
+
+
+@pytest.fixture
+def rpc(monkeypatch):
+    """Cliente limpio (sin esquema cacheado) y execute_kw que registra cada llamada."""
+    llamadas = []
+    respuestas = []
+
+    def execute_kw(model, method, args, kwargs=None, rpc_id=1):
+        llamadas.append((model, method, args))
+        if respuestas:
+            return respuestas.pop(0)
+        if method == "create":
+            return True, {"result": list(range(100, 100 + len(args[0])))}
+        return True, {"result": True}
+
+    monkeypatch.setattr(odoo_rpc, "execute_kw", execute_kw)
+    token = odoo_rpc.usar_cliente(odoo_rpc.OdooClient(None, None, 0, None, name="test"))
+    yield llamadas, respuestas
+    odoo_rpc.liberar_cliente(token)
+
+
+def _error_campo(campo):
+    return False, {"error": {"data": {"message": f"Invalid field '{campo}' on model 'stock.picking'"}}}
+
+
+def test_write_many_agrupa_vals_identicos(rpc):
+    llamadas, _ = rpc
+    ok, resultados = odoo_rpc.write_many(
+        "stock.picking", [(1, {"a": 1}), (2, {"a": 1}), (3, {"a": 2}), (4, {"a": 1})]
+    )
+    assert ok
+    assert sorted((m, args[0]) for _, m, args in llamadas) == [("write", [1, 2, 4]), ("write", [3])]
+    assert [r["id"] for r in resultados] == [1, 2, 3, 4]
+    assert all(r["ok"] for r in resultados)
+
+
+def test_write_many_fusiona_ids_repetidos(rpc):
+    llamadas, _ = rpc
+    ok, resultados = odoo_rpc.write_many("stock.picking", [(1, {"a": 1}), (2, {"b": 2}), (1, {"b": 3})])
+    assert ok
+    # El id repetido va en un solo write con las claves posteriores pisando a las anteriores
+    assert [args for _, _, args in llamadas if args[0] == [1]] == [[[1], {"a": 1, "b": 3}]]
+    assert [r["id"] for r in resultados] == [1, 2, 1]
+    assert resultados[0] == resultados[2] and resultados[0] is not resultados[2]
+
+
+def test_write_many_descarta_campo_desconocido(rpc):
+    llamadas, respuestas = rpc
+    respuestas.append(_error_campo("x_studio_no_existe"))
+    ok, resultados = odoo_rpc.write_many(
+        "stock.picking", [(5, {"carrier_tracking_ref": "G1", "x_studio_no_existe": True})]
+    )
+    assert ok
+    assert len(llamadas) == 2
+    assert resultados[0]["vals"] == {"carrier_tracking_ref": "G1"}
+
+
+def test_write_many_reporta_error_por_registro(rpc):
+    _, respuestas = rpc
+    respuestas.append((False, {"error": "odoo_rpc_http_failed"}))
+    ok, resultados = odoo_rpc.write_many("stock.picking", [(1, {"a": 1}), (2, {"a": 2})])
+    assert not ok
+    fallidos = [r for r in resultados if not r["ok"]]
+    assert len(fallidos) == 1 and fallidos[0]["error"] == {"error": "odoo_rpc_http_failed"}
+
+
+def test_create_many_una_sola_llamada(rpc):
+    llamadas, respuestas = rpc
+    respuestas.append(_error_campo("x_b"))
+    ok, resultados = odoo_rpc.create_many("res.partner", [{"name": "A", "x_b": 1}, {"name": "B"}])
+    assert ok
+    assert [m for _, m, _ in llamadas] == ["create", "create"]
+    assert [(r["id"], r["vals"]) for r in resultados] == [(100, {"name": "A"}), (101, {"name": "B"})]
+
+
+def test_message_post_many_un_solo_create(rpc):
+    llamadas, _ = rpc
+    ok, resultados = odoo_rpc.message_post_many("stock.picking", [(7, "a"), (8, "b")])
+    assert ok and len(resultados) == 2
+    ((model, method, args),) = llamadas
+    assert (model, method) == ("mail.message", "create")
+    assert [(v["res_id"], v["body"]) for v in args[0]] == [(7, "a"), (8, "b")]
+
+
+def test_safe_read_sin_campos_conocidos(rpc, monkeypatch):
+    llamadas, _ = rpc
+    odoo_rpc.cliente().fields_cache["stock.picking"] = {"name"}
+    monkeypatch.setattr(odoo_rpc, "fields_get", lambda model, refresh=False: (True, {"name"}))
+    ok, resp, usados = odoo_rpc.safe_read("stock.picking", [1], ["x_studio_nuevo"])
+    # read([]) traería todos los campos: no se llama
+    assert not ok and resp["error"] == "no_known_fields" and usados == []
+    assert llamadas == []
+
+
+def test_campo_nuevo_refresca_esquema(rpc, monkeypatch):
+    odoo_rpc.cliente().fields_cache["stock.picking"] = {"name"}
+    refrescos = []
+
+    def fields_get(model, refresh=False):
+        refrescos.append(refresh)
+        return True, {"name", "x_studio_nuevo"}
+
+    monkeypatch.setattr(odoo_rpc, "fields_get", fields_get)
+    monkeypatch.setattr(odoo_rpc, "_FIELDS_REFRESH", {})
+    assert odoo_rpc._known_fields("stock.picking", ["name", "x_studio_nuevo"]) == ["name", "x_studio_nuevo"]
+    # Un segundo miss dentro de FIELDS_REFRESH_MIN no vuelve a pedir el esquema
+    odoo_rpc._known_fields("stock.picking", ["otro"])
+    assert refrescos == [True]
@@ -0,0 +1,89 @@
+import pytest
+
+
+class OdooFalso:
+    """safe_read sobre registros en memoria; cuenta las llamadas (RPC) por modelo."""
+
+    def __init__(self, n_paquetes, odoo16=True):
+        self.llamadas = []
+        campo_tipo = "package_type_id" if odoo16 else "packaging_id"
+        self.campos_pkg = {"name", "shipping_weight", "weight", campo_tipo}
+        self.registros = {
+            # Dos move lines por paquete y una línea sin paquete
+            "stock.move.line": {
+                i: {"id": i, "result_package_id": [(i + 1) // 2, f"PACK{(i + 1) // 2:04d}"] if i <= 2 * n_paquetes else False}
+                for i in range(1, 2 * n_paquetes + 2)
+            },
+            "stock.quant.package": {
+                p: {
+                    "id": p,
+                    "name": f"PACK{p:04d}",
+                    "shipping_weight": 2.5 if p % 2 else 0.0,
+                    "weight": 1.0,
+                    campo_tipo: [p % 3 + 1, "Caja"] if p % 4 else False,
+                }
+                for p in range(1, n_paquetes + 1)
+            },
+        }
+        tipos = {t: {"id": t, "height": 100 * t, "width": 200, "packaging_length": 0, "base_weight": 0.1} for t in (1, 2, 3)}
+        self.registros["stock.package.type" if odoo16 else "product.packaging"] = tipos
+
+    def safe_read(self, model, ids, fields):
+        self.llamadas.append(model)
+        campos = [f for f in fields if model != "stock.quant.package" or f in self.campos_pkg]
+        filas = [{"id": i, **{f: self.registros[model][i].get(f, False) for f in campos}} for i in ids]
+        return True, {"result": filas}, campos
+
+
+@pytest.fixture
+def odoo(webhook, monkeypatch):
+    def instalar(n_paquetes, odoo16=True):
+        falso = OdooFalso(n_paquetes, odoo16)
+        monkeypatch.setattr(webhook, "safe_read", falso.safe_read)
+        return falso
+
+    return instalar
+
+
+@pytest.mark.parametrize("n", [1, 10, 300])
+def test_tres_rpc_sin_importar_cuantos_paquetes(webhook, odoo, n):
+    falso = odoo(n)
+    paquetes = webhook.hidratar_paquetes(list(falso.registros["stock.move.line"]))
+    # Cada paquete aparece una vez aunque lo compartan dos move lines
+    assert [p["name"] for p in paquetes] == [f"PACK{p:04d}" for p in range(1, n + 1)]
+    assert falso.llamadas == ["stock.move.line", "stock.quant.package", "stock.package.type"]
+
+
+def test_peso_y_dimensiones(webhook, odoo):
+    odoo(4)
+    paquetes = {p["name"]: p for p in webhook.hidratar_paquetes(list(range(1, 10)))}
+    # shipping_weight manda; si es 0 se usa weight
+    assert (paquetes["PACK0001"]["peso"], paquetes["PACK0002"]["peso"]) == (2.5, 1.0)
+    # Dimensiones en mm (ODOO_UNIDAD_LONGITUD por defecto) → cm; 0 = sin dato
+    assert (paquetes["PACK0001"]["alto"], paquetes["PACK0001"]["ancho"], paquetes["PACK0001"]["largo"]) == (20.0, 20.0, None)
+    # Sin tipo de empaque: sin dimensiones (el payload usa el default)
+    assert (paquetes["PACK0004"]["alto"], paquetes["PACK0004"]["ancho"]) == (None, None)
+
+
+def test_odoo_anterior_usa_packaging_id(webhook, odoo):
+    falso = odoo(3, odoo16=False)
+    paquetes = webhook.hidratar_paquetes(list(range(1, 8)))
+    assert falso.llamadas == ["stock.move.line", "stock.quant.package", "product.packaging"]
+    assert paquetes[0]["alto"] == 20.0
+
+
+def test_sin_paquetes_una_sola_lectura(webhook, odoo):
+    falso = odoo(0)
+    assert webhook.hidratar_paquetes([1]) == []
+    assert falso.llamadas == ["stock.move.line"]
+    assert webhook.hidratar_paquetes([]) == []
+    assert falso.llamadas == ["stock.move.line"]
+
+
+def test_unidad_de_longitud_recargable(webhook, odoo, monkeypatch):
+    import settings
+
+    odoo(1)
+    monkeypatch.setattr(settings, "_actual", settings.actual()._replace(odoo_unidad_longitud="cm", factor_a_cm=1.0))
+    (paquete,) = webhook.hidratar_paquetes([1, 2])
+    assert (paquete["alto"], paquete["ancho"]) == (200, 200)
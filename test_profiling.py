@@ -0,0 +1,65 @@
+import os
+import pstats
+
+import pytest
+
+flask = pytest.importorskip("flask")
+pytest.importorskip("dotenv")
+
+import profiling  # noqa: E402
+import settings  # noqa: E402
+
+
+def vista():
+    return flask.jsonify({"ok": True})
+
+
+@pytest.fixture
+def app_perfilada(monkeypatch, tmp_path):
+    monkeypatch.setattr(profiling, "PROFILE_DIR", str(tmp_path / "prof"))
+    app = flask.Flask("perfilada")
+    app.post("/webhook")(profiling.perfilar(vista))
+    return app.test_client()
+
+
+def perfiles(tmp_path):
+    directorio = tmp_path / "prof"
+    return sorted(os.listdir(directorio)) if directorio.exists() else []
+
+
+def tasa(monkeypatch, valor):
+    monkeypatch.setattr(settings, "_actual", settings.actual()._replace(profile_sample_rate=valor))
+
+
+def test_sin_profile_dir_no_envuelve(monkeypatch):
+    monkeypatch.setattr(profiling, "PROFILE_DIR", "")
+    assert profiling.perfilar(vista) is vista
+
+
+def test_header_activa_el_perfil(app_perfilada, monkeypatch, tmp_path):
+    tasa(monkeypatch, 0.0)
+    assert app_perfilada.post("/webhook", json={"id": 241}).status_code == 200
+    assert perfiles(tmp_path) == []
+
+    resp = app_perfilada.post("/webhook", json={"id": 241}, headers={"X-Profile": "1", "X-Request-ID": "abc/../123"})
+    assert resp.status_code == 200
+    (nombre,) = perfiles(tmp_path)
+    assert nombre.endswith("_picking-241_abc_.._123.prof") and "/" not in nombre
+    # Es un perfil cProfile legible
+    assert pstats.Stats(str(tmp_path / "prof" / nombre)).total_calls > 0
+
+
+def test_muestreo_recargable(app_perfilada, monkeypatch, tmp_path):
+    tasa(monkeypatch, 1.0)
+    app_perfilada.post("/webhook", json={"id": 1}, headers={"X-Request-ID": "a"})
+    assert len(perfiles(tmp_path)) == 1
+    tasa(monkeypatch, 0.0)
+    app_perfilada.post("/webhook", json={"id": 2}, headers={"X-Request-ID": "b"})
+    assert len(perfiles(tmp_path)) == 1
+
+
+def test_retencion(app_perfilada, monkeypatch, tmp_path):
+    monkeypatch.setattr(profiling, "PROFILE_MAX_FILES", 2)
+    for i in range(4):
+        app_perfilada.post("/webhook", json={"id": i}, headers={"X-Profile": "true", "X-Request-ID": f"r{i}"})
+    assert len(perfiles(tmp_path)) == 2
@@ -0,0 +1,94 @@
+import threading
+import time
+from collections import OrderedDict
+
+import pytest
+
+pytest.importorskip("requests")
+pytest.importorskip("dotenv")
+
+import servientrega_quote  # noqa: E402
+
+MEDELLIN = "05001000"
+CALI = "76001000"
+
+
+@pytest.fixture(autouse=True)
+def liquidaciones(monkeypatch):
+    """Caché vacía y liquidar() falso que cuenta las llamadas a Servientrega."""
+    monkeypatch.setattr(servientrega_quote, "_CACHE", OrderedDict())
+    monkeypatch.setattr(servientrega_quote, "STATS", {"hits": 0, "misses": 0, "errores": 0})
+    llamadas = []
+
+    def liquidar(origen, destino, peso_kg, valor):
+        llamadas.append((origen, destino, peso_kg, valor))
+        time.sleep(0.01)
+        return True, {"total": 10000.0 + peso_kg, "flete": 9000.0, "sobreflete": None}
+
+    monkeypatch.setattr(servientrega_quote, "liquidar", liquidar)
+    return llamadas
+
+
+def test_tramos():
+    assert [servientrega_quote.bracket_peso(p) for p in (0, 1.2, 30, 31, 47)] == [1, 2, 30, 35, 50]
+    assert [servientrega_quote.bracket_valor(v) for v in (0, 50000, 50001)] == [50000, 50000, 100000]
+
+
+def test_hit_dentro_del_tramo_y_vencimiento(monkeypatch, liquidaciones):
+    ok, primera = servientrega_quote.cotizar(MEDELLIN, 2.3, 40000)
+    assert ok and primera["cache"] is False and primera["peso_kg"] == 3
+    # Mismo tramo de peso y valor: no se vuelve a liquidar
+    ok, segunda = servientrega_quote.cotizar(MEDELLIN, 2.9, 45000)
+    assert ok and segunda["cache"] is True and segunda["total"] == primera["total"]
+    assert len(liquidaciones) == 1
+
+    t = time.time()
+    monkeypatch.setattr(servientrega_quote.time, "time", lambda: t + servientrega_quote.settings.actual().quote_ttl + 1)
+    ok, vencida = servientrega_quote.cotizar(MEDELLIN, 2.3, 40000)
+    assert ok and vencida["cache"] is False
+    assert len(liquidaciones) == 2
+    assert servientrega_quote.STATS == {"hits": 1, "misses": 2, "errores": 0}
+
+
+def test_codigo_de_5_digitos_comparte_la_entrada(liquidaciones):
+    servientrega_quote.cotizar(MEDELLIN, 1, 0)
+    ok, data = servientrega_quote.cotizar("05001", 1, 0)
+    assert ok and data["cache"] is True and data["destino"] == MEDELLIN
+    assert len(liquidaciones) == 1
+
+
+def test_destino_fuera_de_la_tabla_dane(liquidaciones):
+    for destino in ("99999000", "abc", "0500100"):
+        ok, data = servientrega_quote.cotizar(destino, 1, 0)
+        assert not ok and data["error"] == "destino_invalido"
+    ok, data = servientrega_quote.cotizar(MEDELLIN, 1, 0, origen="12345678")
+    assert not ok and data["error"] == "origen_invalido"
+    assert liquidaciones == [] and len(servientrega_quote._CACHE) == 0
+
+
+def test_cache_acotada_descarta_la_menos_usada(monkeypatch, liquidaciones):
+    monkeypatch.setattr(servientrega_quote, "QUOTE_CACHE_MAX", 2)
+    servientrega_quote.cotizar(MEDELLIN, 1, 0)
+    servientrega_quote.cotizar(CALI, 1, 0)
+    servientrega_quote.cotizar(MEDELLIN, 1, 0)  # hit: Medellín pasa a ser la más reciente
+    servientrega_quote.cotizar(MEDELLIN, 5, 0)  # tercera clave: sale Cali
+    assert len(servientrega_quote._CACHE) == 2
+    assert servientrega_quote.cotizar(MEDELLIN, 1, 0)[1]["cache"] is True
+    assert servientrega_quote.cotizar(CALI, 1, 0)[1]["cache"] is False
+
+
+def test_concurrentes_liquidan_una_vez(liquidaciones):
+    barrera = threading.Barrier(16)
+
+    def pedir():
+        barrera.wait()
+        servientrega_quote.cotizar(CALI, 4, 100000)
+
+    hilos = [threading.Thread(target=pedir) for _ in range(16)]
+    for h in hilos:
+        h.start()
+    for h in hilos:
+        h.join()
+    assert len(liquidaciones) == 1
+    assert servientrega_quote.STATS["hits"] + servientrega_quote.STATS["misses"] == 16
+    assert servientrega_quote._LOCKS == {}
@@ -0,0 +1,120 @@
+import os
+import signal
+import time
+import types
+
+import pytest
+
+pytest.importorskip("dotenv")
+
+import settings  # noqa: E402
+
+
+@pytest.fixture
+def archivo(monkeypatch, tmp_path):
+    """SETTINGS_FILE en tmp_path, sin entorno que lo tape y sin los suscriptores de otros módulos."""
+    path = tmp_path / "settings.env"
+    path.write_text("QUOTE_TTL=60\n", encoding="utf-8")
+    monkeypatch.setattr(settings, "SETTINGS_FILE", str(path))
+    monkeypatch.setattr(settings, "_ENTORNO", {})
+    monkeypatch.setattr(settings, "_actual", settings.cargar())
+    monkeypatch.setattr(settings, "_mtime_cargado", settings._mtime())
+    monkeypatch.setattr(settings, "_suscriptores", [])
+    return path
+
+
+def escribir(path, contenido):
+    path.write_text(contenido, encoding="utf-8")
+    # Garantiza un mtime distinto aunque el sistema de archivos tenga resolución de segundos
+    mtime = os.path.getmtime(path) + 2
+    os.utime(path, (mtime, mtime))
+
+
+def test_recargar_aplica_y_notifica(archivo):
+    vistos = []
+    settings.suscribir(lambda anterior, nuevo: vistos.append((anterior.quote_ttl, nuevo.quote_ttl)))
+    assert settings.actual().quote_ttl == 60
+
+    escribir(archivo, "QUOTE_TTL=120\nODOO_UNIDAD_LONGITUD=cm\n")
+    assert settings.recargar()
+    assert (settings.actual().quote_ttl, settings.actual().factor_a_cm) == (120, 1.0)
+    assert vistos == [(60, 120)]
+
+
+def test_entorno_tiene_prioridad(archivo, monkeypatch):
+    monkeypatch.setattr(settings, "_ENTORNO", {"QUOTE_TTL": "30"})
+    escribir(archivo, "QUOTE_TTL=120\n")
+    assert settings.recargar()
+    assert settings.actual().quote_ttl == 30
+
+
+def test_archivo_invalido_conserva_la_vigente(archivo):
+    vistos = []
+    settings.suscribir(lambda anterior, nuevo: vistos.append(nuevo))
+    vigente = settings.actual()
+
+    escribir(archivo, "QUOTE_TTL=mucho\nODOO_UNIDAD_LONGITUD=pulgadas\nPROFILE_SAMPLE_RATE=2\n")
+    with pytest.raises(ValueError) as e:
+        settings.cargar()
+    # Todos los errores en un solo mensaje
+    assert all(clave in str(e.value) for clave in ("QUOTE_TTL", "ODOO_UNIDAD_LONGITUD", "PROFILE_SAMPLE_RATE"))
+    assert not settings.recargar()
+    assert settings.actual() is vigente and vistos == []
+
+
+def test_suscriptor_que_falla_no_corta_a_los_demas(archivo):
+    vistos = []
+
+    def roto(anterior, nuevo):
+        raise RuntimeError("boom")
+
+    settings.suscribir(roto)
+    settings.suscribir(lambda anterior, nuevo: vistos.append(nuevo.quote_ttl))
+    escribir(archivo, "QUOTE_TTL=90\n")
+    assert settings.recargar()
+    assert vistos == [90]
+
+
+def test_sighup_recarga(archivo, monkeypatch):
+    monkeypatch.setattr(settings, "SETTINGS_WATCH_INTERVAL", 0)
+    previo = signal.getsignal(signal.SIGHUP)
+    try:
+        settings.instalar_recarga()
+        escribir(archivo, "QUOTE_TTL=240\n")
+        os.kill(os.getpid(), signal.SIGHUP)
+        limite = time.monotonic() + 5
+        while settings.actual().quote_ttl != 240 and time.monotonic() < limite:
+            time.sleep(0.01)
+    finally:
+        signal.signal(signal.SIGHUP, previo)
+    assert settings.actual().quote_ttl == 240
+
+
+def test_vigilancia_por_cambio_de_archivo(archivo, monkeypatch):
+    class Fin(Exception):
+        pass
+
+    vueltas = []
+
+    def dormir(intervalo):
+        vueltas.append(intervalo)
+        if len(vueltas) == 2:
+            escribir(archivo, "QUOTE_TTL=180\n")
+        if len(vueltas) > 3:
+            raise Fin
+
+    monkeypatch.setattr(settings, "time", types.SimpleNamespace(sleep=dormir))
+    recargar = settings.recargar
+    recargas = []
+
+    def espia():
+        recargas.append(settings.actual().quote_ttl)
+        return recargar()
+
+    monkeypatch.setattr(settings, "recargar", espia)
+    with pytest.raises(Fin):
+        settings._loop_vigilar(5)
+    # Sin cambios no relee; tras el cambio relee una sola vez
+    assert vueltas == [5, 5, 5, 5]
+    assert recargas == [60]
+    assert settings.actual().quote_ttl == 180
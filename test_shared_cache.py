@@ -0,0 +1,161 @@
+import threading
+
+import pytest
+
+import shared_cache
+
+
+@pytest.fixture(autouse=True)
+def cache(monkeypatch, tmp_path):
+    monkeypatch.setattr(shared_cache, "SHARED_CACHE_DB", str(tmp_path / "shared_cache.sqlite3"))
+    monkeypatch.setattr(shared_cache, "_local", threading.local())
+
+
+def test_get_set_y_ttl():
+    assert shared_cache.get("dane", "k") is shared_cache.FALTA
+    shared_cache.set("dane", "k", {"ciudad": "05001000"}, 60)
+    assert shared_cache.get("dane", "k") == {"ciudad": "05001000"}
+    # None también se cachea (resultado negativo)
+    shared_cache.set("dane", "n", None, 60)
+    assert shared_cache.get("dane", "n") is None
+    shared_cache.reclamar("dane", "v", 1, -1)
+    assert shared_cache.get("dane", "v") is shared_cache.FALTA
+    shared_cache.delete("dane", "k")
+    assert shared_cache.get("dane", "k") is shared_cache.FALTA
+
+
+def test_set_max_nunca_retrocede():
+    shared_cache.set_max("write_date", "p1", "2026-01-02 00:00:00", 60)
+    shared_cache.set_max("write_date", "p1", "2026-01-01 00:00:00", 60)
+    assert shared_cache.get("write_date", "p1") == "2026-01-02 00:00:00"
+    shared_cache.set_max("write_date", "p1", "2026-01-03 00:00:00", 60)
+    assert shared_cache.get("write_date", "p1") == "2026-01-03 00:00:00"
+
+
+def test_set_max_reemplaza_vencido(monkeypatch):
+    shared_cache.set("write_date", "p1", "2026-01-09 00:00:00", 60)
+    t = shared_cache.time.time()
+    monkeypatch.setattr(shared_cache.time, "time", lambda: t + 120)
+    shared_cache.set_max("write_date", "p1", "2026-01-01 00:00:00", 60)
+    assert shared_cache.get("write_date", "p1") == "2026-01-01 00:00:00"
+
+
+def test_reclamar_una_sola_vez():
+    assert shared_cache.reclamar("guia", "acme|241", "en_curso", 60)
+    assert not shared_cache.reclamar("guia", "acme|241", "en_curso", 60)
+    assert shared_cache.get("guia", "acme|241") == "en_curso"
+    shared_cache.set("guia", "acme|241", "2130000001", 60)
+    assert not shared_cache.reclamar("guia", "acme|241", "en_curso", 60)
+    shared_cache.delete("guia", "acme|241")
+    assert shared_cache.reclamar("guia", "acme|241", "en_curso", 60)
+
+
+def test_reclamar_vencido():
+    assert shared_cache.reclamar("guia", "p", "en_curso", -1)
+    assert shared_cache.reclamar("guia", "p", "otro", 60)
+    assert shared_cache.get("guia", "p") == "otro"
+
+
+def test_reclamar_concurrente():
+    ganadores = []
+    barrera = threading.Barrier(8)
+
+    def intentar(n):
+        barrera.wait()
+        if shared_cache.reclamar("guia", "p", n, 60):
+            ganadores.append(n)
+
+    hilos = [threading.Thread(target=intentar, args=(n,)) for n in range(8)]
+    for h in hilos:
+        h.start()
+    for h in hilos:
+        h.join()
+    assert len(ganadores) == 1
+    assert shared_cache.get("guia", "p") == ganadores[0]
+
+
+def test_desactivada(monkeypatch):
+    monkeypatch.setattr(shared_cache, "SHARED_CACHE_DB", "")
+    shared_cache.set("dane", "k", 1, 60)
+    assert shared_cache.get("dane", "k") is shared_cache.FALTA
+    assert shared_cache.reclamar("guia", "p", "en_curso", 60)
+
+
+def test_purgar_respeta_tope(monkeypatch):
+    monkeypatch.setattr(shared_cache, "SHARED_CACHE_MAX_ROWS", 3)
+    for n in range(5):
+        shared_cache.set("dane", str(n), n, 60 + n)
+    shared_cache.reclamar("dane", "vencida", 0, -1)
+    assert shared_cache.purgar() == 3
+    # Se desaloja lo más próximo a vencer
+    assert [shared_cache.get("dane", str(n)) for n in range(5)][2:] == [2, 3, 4]
+
+
+def test_purgar_no_desaloja_guias(monkeypatch):
+    monkeypatch.setattr(shared_cache, "SHARED_CACHE_MAX_ROWS", 2)
+    assert shared_cache.reclamar("guia", "acme|1", "en_curso", 1)
+    shared_cache.set("guia", "acme|2", "2130000001", 2)
+    for n in range(3):
+        shared_cache.set("dane", str(n), n, 600)
+    # Las entradas "guia" son las más próximas a vencer, pero solo se desaloja fuera de ese ns
+    assert shared_cache.purgar() == 3
+    assert shared_cache.get("guia", "acme|1") == "en_curso"
+    assert shared_cache.get("guia", "acme|2") == "2130000001"
+
+
+@pytest.fixture
+def produccion(webhook, monkeypatch):
+    """Tenant stub en producción (idempotencia activa) y conteo de llamadas a CargueMasivoExterno."""
+    import tenants
+
+    monkeypatch.setattr(tenants._TENANTS["stub"], "servi_produccion", True)
+    llamadas = []
+    enviar = webhook.enviar_ws22_test
+
+    def contar(payload, picking_id=None):
+        llamadas.append(picking_id)
+        return enviar(payload, picking_id)
+
+    monkeypatch.setattr(webhook, "enviar_ws22_test", contar)
+    return llamadas
+
+
+def _post(webhook, picking_id):
+    resp = webhook.app.test_client().post("/webhook", json={"id": picking_id}, headers={"X-Tenant": "stub"})
+    return resp.status_code, resp.get_json()
+
+
+def test_guia_no_persistida_se_completa_en_el_reintento(webhook, produccion, monkeypatch):
+    import dead_letter
+
+    persistir = webhook.persistir_resultado_ws22
+    monkeypatch.setattr(webhook, "persistir_resultado_ws22", lambda *a, **k: False)
+    codigo, body = _post(webhook, 501)
+    assert codigo == 502 and body["detail"]["error"] == "odoo_persist"
+    assert dead_letter.listar(tenant="stub")[0]["etapa"] == dead_letter.ETAPA_PERSISTENCIA
+
+    escritas = []
+    monkeypatch.setattr(
+        webhook, "persistir_resultado_ws22", lambda p, g, *a, **k: escritas.append(g) or persistir(p, g, *a, **k)
+    )
+    codigo, reintento = _post(webhook, 501)
+    # Misma guía, escrita en Odoo, sin segunda llamada a CargueMasivoExterno
+    assert (codigo, reintento["guia"]) == (200, body["guia"])
+    assert escritas == [body["guia"]]
+    assert produccion == [501]
+    assert dead_letter.listar(tenant="stub") == []
+
+
+def test_reclamo_en_curso_responde_409(webhook, produccion):
+    assert shared_cache.reclamar("guia", shared_cache.clave("stub", 502), "en_curso", 60)
+    codigo, body = _post(webhook, 502)
+    assert (codigo, body["error"]) == (409, "guia_en_curso")
+    assert produccion == []
+
+
+def test_rechazo_ws22_libera_el_reclamo(webhook, produccion, monkeypatch):
+    monkeypatch.setattr(
+        webhook, "parsear_respuesta_ws22_xml", lambda raw: {"ok": False, "mensaje": "Ciudad destino no existe"}
+    )
+    assert _post(webhook, 503)[0] == 502
+    assert shared_cache.get("guia", shared_cache.clave("stub", 503)) is shared_cache.FALTA
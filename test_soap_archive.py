@@ -0,0 +1,81 @@
+import gzip
+import queue
+
+import pytest
+
+import soap_archive
+
+REQUEST = "<soap:Envelope><tem:AuthHeader><tem:login>u</tem:login><tem:pwd>secreta</tem:pwd></tem:AuthHeader></soap:Envelope>"
+
+
+@pytest.fixture(autouse=True)
+def archivo(monkeypatch, tmp_path):
+    monkeypatch.setattr(soap_archive, "SOAP_ARCHIVE_ENABLED", True)
+    monkeypatch.setattr(soap_archive, "SOAP_ARCHIVE_DIR", str(tmp_path / "soap"))
+    return tmp_path / "soap"
+
+
+def registrar(n, **extra):
+    for i in range(n):
+        assert soap_archive.registrar(
+            "CargueMasivoExterno", REQUEST, f"<resp>{i}</resp>", picking_id=241 + i, guia=f"21300000{i:02d}", **extra
+        )
+    soap_archive.flush()
+
+
+def test_ida_y_vuelta_por_guia_y_picking(archivo):
+    registrar(3, http_status=200)
+    (entrada,) = soap_archive.buscar(guia="2130000001")
+    assert (entrada["picking_id"], entrada["op"], entrada["seg"]) == (242, "CargueMasivoExterno", "seg-000001.gz")
+    intercambio = soap_archive.leer(entrada)
+    assert intercambio["response"] == "<resp>1</resp>" and intercambio["http_status"] == 200
+    # La contraseña del AuthHeader nunca llega al disco
+    assert "<tem:pwd>***</tem:pwd>" in intercambio["request"]
+    assert b"secreta" not in gzip.decompress((archivo / "seg-000001.gz").read_bytes())
+    assert [i["response"] for i in soap_archive.intercambios(picking_id=243)] == ["<resp>2</resp>"]
+
+
+def test_filtro_por_tiempo(archivo):
+    registrar(2)
+    entradas = soap_archive.buscar(desde=0)
+    assert len(entradas) == 2
+    assert soap_archive.buscar(desde=entradas[1]["ts"]) == entradas[1:]
+    assert soap_archive.buscar(hasta=entradas[0]["ts"] - 1) == []
+
+
+def test_segmentos_rotan_por_tamano(archivo, monkeypatch):
+    monkeypatch.setattr(soap_archive, "SOAP_ARCHIVE_SEGMENT_MB", 0)
+    registrar(3)
+    segs = [e["seg"] for e in soap_archive.buscar(desde=0)]
+    assert segs == ["seg-000001.gz", "seg-000002.gz", "seg-000003.gz"]
+    assert all(soap_archive.leer(e)["op"] == "CargueMasivoExterno" for e in soap_archive.buscar(desde=0))
+
+
+def test_cola_llena_descarta_sin_bloquear(monkeypatch):
+    monkeypatch.setattr(soap_archive, "_queue", queue.Queue(maxsize=1))
+    monkeypatch.setattr(soap_archive, "_arrancar_writer", lambda: None)
+    assert soap_archive.registrar("GenerarGuiaSticker", REQUEST, "<r/>")
+    assert not soap_archive.registrar("GenerarGuiaSticker", REQUEST, "<r/>")
+
+
+def test_desactivado_no_encola(monkeypatch):
+    monkeypatch.setattr(soap_archive, "SOAP_ARCHIVE_ENABLED", False)
+    assert not soap_archive.registrar("GenerarGuiaSticker", REQUEST, "<r/>")
+    assert soap_archive.buscar(desde=0) == []
+
+
+def test_cli(capsys):
+    registrar(1)
+    assert soap_archive.main(["--guia", "2130000000", "--index-only"]) == 0
+    assert '"seg": "seg-000001.gz"' in capsys.readouterr().out
+    assert soap_archive.main(["--guia", "2130000000", "--op", "GenerarGuiaSticker"]) == 1
+
+
+def test_webhook_archiva_cargue_y_sticker(webhook, monkeypatch, archivo):
+    monkeypatch.setattr(soap_archive, "SOAP_ARCHIVE_ENABLED", True)
+    resp = webhook.app.test_client().post("/webhook", json={"id": 241}, headers={"X-Tenant": "stub"})
+    guia = resp.get_json()["guia"]
+    soap_archive.flush()
+    ops = sorted(e["op"] for e in soap_archive.buscar(guia=guia))
+    assert ops == ["CargueMasivoExterno", "GenerarGuiaSticker"]
+    assert all(e["picking_id"] == 241 for e in soap_archive.buscar(guia=guia) if e["op"] == "CargueMasivoExterno")
@@ -0,0 +1,84 @@
+import pytest
+
+import dead_letter
+
+
+class ColaManual:
+    """Executor que guarda las tareas para correrlas cuando el test lo decida."""
+
+    def __init__(self):
+        self.tareas = []
+
+    def submit(self, fn, *args):
+        self.tareas.append((fn, args))
+
+    def correr(self):
+        while self.tareas:
+            fn, args = self.tareas.pop(0)
+            fn(*args)
+
+
+@pytest.fixture
+def diferido(webhook, monkeypatch):
+    import settings
+
+    cola = ColaManual()
+    monkeypatch.setattr(webhook, "_executor_etiquetas", lambda: cola)
+    monkeypatch.setattr(
+        settings,
+        "_actual",
+        settings.actual()._replace(label_async=True, label_async_retries=2, label_async_backoff=0.0),
+    )
+    return cola
+
+
+def crear_guia(webhook):
+    resp = webhook.app.test_client().post("/webhook", json={"id": 241}, headers={"X-Tenant": "stub"})
+    body = resp.get_json()
+    assert resp.status_code == 200 and body["label_status"] == "pendiente"
+    return body["guia"]
+
+
+def estado(webhook, guia):
+    resp = webhook.app.test_client().get(f"/labels/{guia}/status", headers={"X-Tenant": "stub"})
+    return resp.get_json()
+
+
+def test_pendiente_a_adjunta(webhook, diferido):
+    guia = crear_guia(webhook)
+    assert estado(webhook, guia)["estado"] == "pendiente"
+    # Encolado = dead letter pendiente hasta adjuntar (la cola vive en memoria)
+    (entrada,) = dead_letter.listar(tenant="stub")
+    assert (entrada["etapa"], entrada["error_class"]) == (dead_letter.ETAPA_STICKER, dead_letter.CLASE_STICKER_EN_COLA)
+
+    diferido.correr()
+    assert estado(webhook, guia)["estado"] == "adjunta"
+    assert dead_letter.listar(tenant="stub") == []
+
+
+def test_pendiente_a_error(webhook, diferido, monkeypatch):
+    guia = crear_guia(webhook)
+    intentos = []
+
+    def sticker_caido(num_guia):
+        intentos.append(num_guia)
+        return {"ok": False, "error": "GenerarGuiaSticker timeout"}
+
+    monkeypatch.setattr(webhook, "generar_pdf_guia", sticker_caido)
+    diferido.correr()
+    assert intentos == [guia, guia]
+    final = estado(webhook, guia)
+    assert (final["estado"], final["intentos"], final["error"]) == ("error", 2, "GenerarGuiaSticker timeout")
+    (entrada,) = dead_letter.listar(tenant="stub")
+    assert (entrada["error_class"], entrada["inputs"]) == ("ws22_timeout", {"guia": guia})
+
+
+def test_reinicio_con_sticker_en_cola_se_recupera_por_reproceso(webhook, diferido):
+    guia = crear_guia(webhook)
+    # El proceso muere antes de correr la tarea: la cola en memoria se pierde
+    diferido.tareas.clear()
+
+    out = webhook.reprocesar_dead_letters(etapa=dead_letter.ETAPA_STICKER, tenant="stub", por_segundo=0)
+    assert (out["total"], out["ok"]) == (1, 1)
+    assert out["resultados"][0]["detail"] == {"guia": guia}
+    assert dead_letter.listar(tenant="stub") == []
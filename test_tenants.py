@@ -0,0 +1,120 @@
+import contextvars
+import json
+import threading
+
+import pytest
+
+pytest.importorskip("requests")
+pytest.importorskip("dotenv")
+
+import label_store  # noqa: E402
+import odoo_rpc  # noqa: E402
+import servientrega_ws22  # noqa: E402
+import tenants  # noqa: E402
+
+PDF_ACME = b"%PDF-1.4 acme"
+PDF_GLOBEX = b"%PDF-1.4 globex"
+
+
+def config(nombre):
+    return {
+        "odoo": {"jsonrpc": f"http://127.0.0.1:9/{nombre}/jsonrpc", "db": nombre, "uid": 2, "password": "x"},
+        "servientrega": {"url": f"http://127.0.0.1:9/{nombre}/ws22", "login": "u", "pwd_enc": "p", "cod_fact": f"SER-{nombre}"},
+    }
+
+
+@pytest.fixture
+def registro(monkeypatch, tmp_path):
+    path = tmp_path / "tenants.json"
+    path.write_text(json.dumps({"acme": config("acme"), "globex": config("globex")}), encoding="utf-8")
+    monkeypatch.setattr(tenants, "_TENANTS", {})
+    tenants.cargar(str(path))
+    monkeypatch.setattr(label_store, "LABEL_CACHE_DIR", str(tmp_path / "labels"))
+    return tenants._TENANTS
+
+
+def test_cargar_agrega_default(registro):
+    assert sorted(registro) == ["acme", "default", "globex"]
+    assert registro["acme"].ws22.cod_fact == "SER-acme"
+    assert tenants.obtener(None) is registro["default"]
+    assert tenants.obtener("otro") is None
+
+
+def test_tenant_aislado_por_hilo(registro):
+    """Cada hilo ve su tenant y sus clientes; ninguno se filtra al otro ni al hilo principal."""
+    listos = threading.Barrier(2)
+    vistos = {}
+
+    def atender(nombre):
+        with tenants.activar(tenants.obtener(nombre)):
+            listos.wait()
+            vistos[nombre] = (tenants.actual().nombre, odoo_rpc.cliente().db, servientrega_ws22.cliente().cod_fact)
+
+    hilos = [threading.Thread(target=atender, args=(n,)) for n in ("acme", "globex")]
+    for h in hilos:
+        h.start()
+    for h in hilos:
+        h.join()
+    assert vistos == {"acme": ("acme", "acme", "SER-acme"), "globex": ("globex", "globex", "SER-globex")}
+    assert tenants.actual().nombre == "default"
+    assert servientrega_ws22.cliente() is servientrega_ws22.cliente_por_defecto()
+
+
+def test_contexto_copiado_viaja_con_la_tarea(registro):
+    """Como el sticker diferido: la tarea corre en otro hilo con el tenant del request."""
+    with tenants.activar(registro["acme"]):
+        ctx = contextvars.copy_context()
+    vistos = []
+    hilo = threading.Thread(target=ctx.run, args=(lambda: vistos.append(tenants.actual().nombre),))
+    hilo.start()
+    hilo.join()
+    assert vistos == ["acme"]
+
+
+def test_stickers_separados_por_tenant(registro):
+    with tenants.activar(registro["acme"]):
+        label_store.guardar("2130000001", PDF_ACME)
+        assert label_store.leer("2130000001") == PDF_ACME
+    with tenants.activar(registro["globex"]):
+        # Mismo número de guía en otro código de facturación: no se comparte
+        assert label_store.leer("2130000001") is None
+        label_store.guardar("2130000001", PDF_GLOBEX)
+    assert label_store.leer("2130000001", tenant="acme") == PDF_ACME
+    assert label_store.leer("2130000001", tenant="globex") == PDF_GLOBEX
+    assert label_store.leer("2130000001") is None  # default
+
+
+def test_referencias_sin_tenant_son_del_default(registro):
+    label_store.guardar("2130000002", PDF_ACME, tenant="acme")
+    _, refs = label_store._dirs()
+    with open(f"{refs}/acme/2130000002") as origen, open(f"{refs}/2130000002", "w") as legado:
+        legado.write(origen.read())
+    assert label_store.leer("2130000002") == PDF_ACME
+    assert label_store.leer("2130000002", tenant="globex") is None
+
+
+def test_precalentar_recorre_cada_tenant(registro, monkeypatch):
+    vistos = []
+
+    def precalentar_tenant(limit):
+        vistos.append((tenants.actual().nombre, odoo_rpc.cliente().db))
+        if tenants.actual().nombre == "acme":
+            raise RuntimeError("Odoo caído")
+        return 2
+
+    monkeypatch.setattr(label_store, "_precalentar_tenant", precalentar_tenant)
+    assert label_store.precalentar(10) == 4
+    assert sorted(vistos) == [("acme", "acme"), ("default", odoo_rpc.cliente_por_defecto().db), ("globex", "globex")]
+    assert tenants.actual().nombre == "default"
+
+
+def test_labels_por_header_de_tenant(webhook, monkeypatch):
+    monkeypatch.setattr(webhook, "generar_pdf_guia", lambda guia: {"ok": False, "error": "sin_red"})
+    label_store.guardar("2130000003", PDF_ACME, tenant="stub")
+    cliente = webhook.app.test_client()
+
+    resp = cliente.get("/labels/2130000003", headers={"X-Tenant": "stub"})
+    assert resp.status_code == 200 and resp.data == PDF_ACME
+    resp.close()
+    # Otro tenant no recibe el sticker cacheado del primero
+    assert cliente.get("/labels/2130000003").status_code == 502
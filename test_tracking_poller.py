@@ -0,0 +1,104 @@
+import socket
+import threading
+import time
+
+import pytest
+
+pytest.importorskip("requests")
+pytest.importorskip("dotenv")
+
+import odoo_rpc  # noqa: E402
+import tracking_poller  # noqa: E402
+
+
+def _puerto_libre():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+@pytest.fixture
+def stand_in(monkeypatch):
+    """Stand-in de ConsultarGuia: cada guía avanza un estado por consulta."""
+    port = _puerto_libre()
+    threading.Thread(target=tracking_poller.servir_stand_in, args=(port, 1), daemon=True).start()
+    url = f"http://127.0.0.1:{port}/"
+    for _ in range(50):
+        try:
+            socket.create_connection(("127.0.0.1", port), timeout=0.1).close()
+            break
+        except OSError:
+            time.sleep(0.05)
+    monkeypatch.setattr(tracking_poller, "SERVI_TRACKING_URL", url)
+    return url
+
+
+@pytest.fixture
+def odoo(monkeypatch, tmp_path):
+    """Odoo sin el campo de estado: todo lo que se publica queda en `chatter`."""
+    chatter = []
+    monkeypatch.setattr(tracking_poller, "TRACKING_DB", str(tmp_path / "tracking.sqlite3"))
+    monkeypatch.setattr(tracking_poller, "_local", threading.local())
+    monkeypatch.setattr(odoo_rpc, "fields_get", lambda model: (True, {"name": {}}))
+    monkeypatch.setattr(
+        odoo_rpc,
+        "search_read",
+        lambda *a, **k: (
+            True,
+            {"result": [{"id": 7, "carrier_tracking_ref": "G7"}, {"id": 8, "carrier_tracking_ref": "G8"}]},
+        ),
+    )
+
+    def message_post_many(model, mensajes):
+        chatter.extend(mensajes)
+        return True, [{"ok": True} for _ in mensajes]
+
+    monkeypatch.setattr(odoo_rpc, "message_post_many", message_post_many)
+    return chatter
+
+
+def _ciclo(poller):
+    for a in poller.agenda.values():
+        a["proximo"] = 0
+    return poller.ciclo()
+
+
+def test_consultar_guia_stand_in(stand_in):
+    estados = [tracking_poller.consultar_guia("123")[1]["estado"] for _ in range(5)]
+    assert estados == tracking_poller.ESTADOS_STAND_IN + ["ENTREGADO"]
+
+
+def test_primera_observacion_no_publica(stand_in, odoo):
+    poller = tracking_poller.TrackingPoller(concurrencia=2)
+    assert poller.campo_estado is None
+    assert poller.cargar_guias_abiertas() == 2
+
+    assert _ciclo(poller)["consultadas"] == 2
+    assert odoo == []
+    assert tracking_poller.estados_guardados("default") == {"G7": "GUIA GENERADA", "G8": "GUIA GENERADA"}
+
+    _ciclo(poller)
+    assert sorted(odoo) == [(7, "🚚 Servientrega guía G7: EN TRANSITO"), (8, "🚚 Servientrega guía G8: EN TRANSITO")]
+
+
+def test_reinicio_no_republica(stand_in, odoo):
+    poller = tracking_poller.TrackingPoller()
+    poller.cargar_guias_abiertas()
+    _ciclo(poller)
+    _ciclo(poller)
+    assert len(odoo) == 2
+
+    # Reinicio: agenda vacía, el estado previo sale del SQLite local
+    reiniciado = tracking_poller.TrackingPoller()
+    reiniciado.cargar_guias_abiertas()
+    assert {g: a["estado"] for g, a in reiniciado.agenda.items()} == {"G7": "EN TRANSITO", "G8": "EN TRANSITO"}
+    _ciclo(reiniciado)
+    assert len(odoo) == 4
+    assert odoo[-1][1].endswith("EN REPARTO")
+
+
+def test_estado_final_sale_de_la_agenda(stand_in, odoo):
+    tracking_poller.guardar_estados("default", [("G7", "ENTREGADO")])
+    poller = tracking_poller.TrackingPoller()
+    assert poller.cargar_guias_abiertas() == 1
+    assert list(poller.agenda) == ["G8"]
@@ -0,0 +1,69 @@
+import pytest
+
+from validacion_ws22 import PESO_MAX_KG, PESO_MIN_PIEZA_KG, validar_envio
+
+PICKING = {"name": "WH/OUT/00241", "weight": 3.0, "shipping_weight": 0.0}
+PARTNER = {
+    "name": "Distribuidora El Progreso S.A.S.",
+    "street": "Calle 10 # 43A-25",
+    "phone": "+57 604 444 1234",
+    "vat": "900123456-7",
+    "city": "Medellín",
+    "state_id": [1, "Antioquia (CO)"],
+}
+
+
+def paquete(nombre, peso, alto=10, ancho=10, largo=10):
+    return {"name": nombre, "peso": peso, "alto": alto, "ancho": ancho, "largo": largo}
+
+
+def test_envio_valido():
+    assert validar_envio(PICKING, PARTNER, "Camisetas", [paquete("PACK1", 1.5)], 100000, 1) == []
+
+
+def test_todos_los_errores_en_una_pasada():
+    partner = {**PARTNER, "street": "", "phone": "123", "vat": "9" * 25, "city": "Mosquera"}
+    paquetes = [paquete("PACK1", PESO_MAX_KG + 1), paquete("PACK2", 1, alto=0)]
+    errores = validar_envio({**PICKING, "name": False}, partner, "x" * 60, paquetes, -1, 3)
+    campos = [e.split(":")[0] for e in errores]
+    assert campos == [
+        "Doc_Relacionado",
+        "Des_Direccion",
+        "Des_Telefono",
+        "Ide_Num_Identific_Dest",
+        "Des_DiceContener",
+        "Num_ValorDeclaradoTotal",
+        "Des_Ciudad",
+        "Num_Piezas",
+        "Num_Peso (caja PACK1)",
+        "Num_Alto (caja PACK2)",
+    ]
+
+
+def test_regla_con_valor_invalido_no_corta_la_validacion():
+    errores = validar_envio({"name": "WH/OUT/1", "weight": "abc"}, PARTNER, "Camisetas", None, 1000)
+    assert errores == ["Num_PesoTotal: valor inválido (could not convert string to float: 'abc')"]
+
+
+def test_ciudad_sin_codigo_dane_es_error_de_validacion():
+    """Sin código DANE no hay ciudad por defecto: el envío no sale hacia WS22."""
+    sin_resolver = {**PARTNER, "id": 901, "city": "Mosquera"}
+    assert validar_envio(PICKING, sin_resolver, "Camisetas", None, 1000) == [
+        "Des_Ciudad: no se encontró el código DANE de 'Mosquera' (Antioquia)"
+    ]
+    sin_ciudad = {**PARTNER, "id": 902, "city": False}
+    assert validar_envio(PICKING, sin_ciudad, "Camisetas", None, 1000) == ["Des_Ciudad: campo requerido vacío"]
+
+
+@pytest.mark.parametrize("peso", [0.01, PESO_MIN_PIEZA_KG / 2, None])
+def test_pieza_liviana_o_sin_peso_se_acepta_y_el_payload_usa_el_minimo(peso):
+    """Validación y payload coinciden: lo que se acepta aquí sale con peso >= PESO_MIN_PIEZA_KG."""
+    pytest.importorskip("flask")
+    import webhook_servientrega_ws22 as webhook
+
+    paquetes = [paquete("PACK1", peso), paquete("PACK2", 5.0)]
+    picking = {**PICKING, "weight": 5.0}
+    assert validar_envio(picking, PARTNER, "Camisetas", paquetes, 100000, 2) == []
+
+    envio = webhook.construir_payload_ws22(picking, PARTNER, 100000, "Camisetas", paquetes)["envios"][0]
+    assert [e["peso"] for e in envio["empaques"]] == [PESO_MIN_PIEZA_KG, 5.0]
@@ -0,0 +1,92 @@
+import json
+import threading
+
+import pytest
+
+import webhook_capture
+
+
+def test_sanitizar_credenciales_y_contacto():
+    payload = {
+        "id": 241,
+        "password": "secreto",
+        "x_studio_api_key": "k",
+        "partner_id": [9, "Ana Ruiz"],
+        "carrier_id": [3, "SERVIENTREGA"],
+        "name": "WH/OUT/00012",
+        "city": "Rionegro",
+        "street": "",
+        "lineas": [{"email": "ana@example.com", "product_id": [5, "Caja"]}],
+        "phone": False,
+    }
+    out = webhook_capture.sanitizar(payload)
+    assert out["id"] == 241
+    assert out["password"] == out["x_studio_api_key"] == out["name"] == out["city"] == "***"
+    # many2one: se conserva el id y se enmascara el nombre
+    assert out["partner_id"] == [9, "***"]
+    assert out["carrier_id"] == [3, "SERVIENTREGA"]
+    assert out["lineas"] == [{"email": "***", "product_id": [5, "Caja"]}]
+    # Vacíos se dejan como vienen (el replay distingue "sin dato" de "dato enmascarado")
+    assert out["street"] == "" and out["phone"] is False
+    assert payload["partner_id"] == [9, "Ana Ruiz"]
+
+
+def test_captura_en_lotes(monkeypatch, tmp_path):
+    archivo = tmp_path / "captura" / "webhooks.jsonl"
+    monkeypatch.setattr(webhook_capture, "WEBHOOK_CAPTURE_FILE", str(archivo))
+    monkeypatch.setattr(webhook_capture, "WEBHOOK_CAPTURE_FLUSH", 0.05)
+    monkeypatch.setattr(webhook_capture, "_writer", None)
+    monkeypatch.setattr(webhook_capture, "_writer_lock", threading.Lock())
+
+    headers = {"Content-Type": "application/json", "X-Tenant": "acme", "Authorization": "Bearer x"}
+    assert webhook_capture.capturar("/webhook", b'{"id": 7, "partner_id": [1, "Ana"]}', headers)
+    assert webhook_capture.capturar("/webhook", b"no es json", {})
+    webhook_capture.flush()
+
+    registros = [json.loads(linea) for linea in archivo.read_text(encoding="utf-8").splitlines()]
+    assert registros[0]["payload"] == {"id": 7, "partner_id": [1, "***"]}
+    assert registros[0]["headers"] == {"Content-Type": "application/json", "X-Tenant": "acme"}
+    assert registros[1]["payload"] == {"_raw": "no es json"}
+    assert registros[0]["ts"] <= registros[1]["ts"]
+
+
+def test_replay_ordena_por_ts(monkeypatch):
+    pytest.importorskip("requests")
+    import webhook_replay
+
+    enviados = []
+    monkeypatch.setattr(webhook_replay, "_enviar", lambda s, u, r, t, res: enviados.append(r["ts"]))
+    registros = [{"ts": 10.02}, {"ts": 10.0}, {"ts": 10.01}]
+    webhook_replay.reproducir(registros, "http://127.0.0.1:9", speed=1, concurrency=1)
+    assert enviados == [10.0, 10.01, 10.02]
+
+
+def test_replay_contra_stubs_crea_guias(webhook, tmp_path):
+    """Captura → replay contra la instancia con los stubs: el flujo completo, no el rechazo."""
+    from werkzeug.serving import make_server
+
+    import webhook_replay
+    from conftest import esperar_puerto, puerto_libre
+
+    port = puerto_libre()
+    servidor = make_server("127.0.0.1", port, webhook.app, threaded=True)
+    threading.Thread(target=servidor.serve_forever, daemon=True).start()
+    esperar_puerto(port)
+
+    captura = tmp_path / "webhooks.jsonl"
+    captura.write_text(
+        "\n".join(
+            json.dumps({"ts": 100.0 + i / 100, "path": "/webhook", "headers": {"X-Tenant": "stub"}, "payload": {"id": 240 + i}})
+            for i in range(3)
+        )
+        + "\n",
+        encoding="utf-8",
+    )
+    try:
+        reporte = webhook_replay.reproducir(
+            list(webhook_replay.leer_captura(str(captura))), f"http://127.0.0.1:{port}", speed=0, concurrency=2
+        )
+    finally:
+        servidor.shutdown()
+    assert reporte["codigos"] == {"200": 3}
+    assert reporte["con_guia"] == 3
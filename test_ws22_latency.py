@@ -0,0 +1,100 @@
+import time
+
+import pytest
+
+pytest.importorskip("requests")
+pytest.importorskip("dotenv")
+
+import settings  # noqa: E402
+import ws22_latency  # noqa: E402
+
+STICKER = "GenerarGuiaSticker"
+CARGUE = "CargueMasivoExterno"
+
+
+@pytest.fixture(autouse=True)
+def aislado(monkeypatch):
+    monkeypatch.setattr(ws22_latency, "_OPERACIONES", {})
+    configurar(monkeypatch)
+
+
+def configurar(monkeypatch, **cambios):
+    base = dict(
+        ws22_latency_min_samples=5,
+        ws22_timeout_factor=3.0,
+        ws22_timeout_min=0.5,
+        ws22_hedge_enabled=True,
+        ws22_hedge_max_ratio=1.0,
+    )
+    monkeypatch.setattr(settings, "_actual", settings.actual()._replace(**{**base, **cambios}))
+
+
+def con_muestras(nombre, segundos, n=5):
+    op = ws22_latency.operacion(nombre)
+    for _ in range(n):
+        op.registrar(segundos)
+    return op
+
+
+def lento_la_primera_vez():
+    llamadas = []
+
+    def fn(timeout):
+        llamadas.append(timeout)
+        if len(llamadas) == 1:
+            time.sleep(0.5)
+            return "primero"
+        return "segundo"
+
+    return fn, llamadas
+
+
+def test_timeout_adaptativo_solo_en_idempotentes():
+    con_muestras(STICKER, 1.0)
+    con_muestras(CARGUE, 1.0)
+    assert ws22_latency.operacion(STICKER).timeout(60) == 3.0
+    assert ws22_latency.operacion(CARGUE).timeout(60) == 60
+    # Sin muestras suficientes: timeout base
+    assert ws22_latency.operacion("Otra").timeout(60) == 60
+
+
+def test_timeout_sigue_la_configuracion_vigente(monkeypatch):
+    op = con_muestras(STICKER, 0.1)
+    assert op.timeout(60) == 0.5  # p95 x 3 = 0.3 → mínimo
+    configurar(monkeypatch, ws22_timeout_min=0.1, ws22_timeout_factor=2.0)
+    assert op.timeout(60) == pytest.approx(0.2)
+
+
+def test_hedge_en_operacion_idempotente():
+    con_muestras(STICKER, 0.05)
+    fn, llamadas = lento_la_primera_vez()
+    assert ws22_latency.ejecutar(STICKER, fn, 60) == "segundo"
+    assert len(llamadas) == 2
+    m = ws22_latency.metricas()[STICKER]
+    assert (m["hedge"], m["hedges"], m["hedges_ganados"]) == (True, 1, 1)
+
+
+def test_cargue_nunca_se_repite():
+    con_muestras(CARGUE, 0.05)
+    fn, llamadas = lento_la_primera_vez()
+    assert ws22_latency.ejecutar(CARGUE, fn, 60) == "primero"
+    assert llamadas == [60]
+    m = ws22_latency.metricas()[CARGUE]
+    assert (m["hedge"], m["hedges"]) == (False, 0)
+
+
+def test_hedge_desactivado_por_configuracion(monkeypatch):
+    configurar(monkeypatch, ws22_hedge_enabled=False)
+    con_muestras(STICKER, 0.05)
+    fn, llamadas = lento_la_primera_vez()
+    assert ws22_latency.ejecutar(STICKER, fn, 60) == "primero"
+    assert len(llamadas) == 1
+
+
+def test_recarga_de_workers_reemplaza_el_pool(monkeypatch):
+    monkeypatch.setattr(ws22_latency, "_pool", None)
+    viejo = ws22_latency._executor()
+    anterior = settings.actual()
+    ws22_latency._redimensionar_executor(anterior, anterior._replace(ws22_hedge_workers=2))
+    assert ws22_latency._pool is None
+    assert ws22_latency._executor() is not viejo
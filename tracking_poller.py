@@ -0,0 +1,381 @@
+import os
+import sys
+import time
+import sqlite3
+import logging
+import argparse
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Dict, List, Optional, Tuple
+from xml.sax.saxutils import escape
+
+import requests
+
+import odoo_rpc
+from servientrega_ws22 import session, _parse_xml, _find_first_text_by_localname
+
+log = logging.getLogger("tracking_poller")
+
+# Servicio de rastreo de Servientrega (ConsultarGuia). Apuntar a un stand-in local para pruebas.
+SERVI_TRACKING_URL = os.getenv(
+    "SERVI_TRACKING_URL",
+    "http://sismilenio.servientrega.com/wsrastreoenvios/wsrastreoenvios.asmx",
+)
+SERVI_TRACKING_NS = os.getenv("SERVI_TRACKING_NS", "http://servientrega.com/")
+SERVI_TRACKING_TIMEOUT = int(os.getenv("SERVI_TRACKING_TIMEOUT", "20"))
+
+# Campo Studio donde se guarda el último estado de Servientrega en el picking
+TRACKING_STATE_FIELD = os.getenv("TRACKING_STATE_FIELD", "x_studio_estado_servientrega")
+TRACKING_CONCURRENCY = int(os.getenv("TRACKING_CONCURRENCY", "8"))
+TRACKING_LOOKBACK_DAYS = int(os.getenv("TRACKING_LOOKBACK_DAYS", "30"))
+TRACKING_TICK = int(os.getenv("TRACKING_TICK", "60"))
+# Último estado publicado por guía (SQLite local). Sin el campo en Odoo es lo único que evita
+# que un reinicio vuelva a publicar en el chatter los estados de todo el lookback.
+# Vacío = solo en memoria
+TRACKING_DB = os.getenv("TRACKING_DB", "tracking_state.sqlite3")
+
+# Intervalos adaptativos (segundos) según la fase del envío
+INTERVALO_NUEVA = int(os.getenv("TRACKING_INTERVAL_NEW", "1800"))
+INTERVALO_TRANSITO = int(os.getenv("TRACKING_INTERVAL_TRANSIT", "14400"))
+INTERVALO_REPARTO = int(os.getenv("TRACKING_INTERVAL_DELIVERY", "1800"))
+INTERVALO_MAX = int(os.getenv("TRACKING_INTERVAL_MAX", "86400"))
+BACKOFF_SIN_CAMBIO = 1.5
+
+FASE_FINAL = "final"
+FASE_REPARTO = "reparto"
+FASE_TRANSITO = "transito"
+FASE_NUEVA = "nueva"
+
+
+def fase(estado: Optional[str]) -> str:
+    e = (estado or "").upper()
+    if "ENTREGAD" in e or "DEVUELT" in e or "ANULAD" in e:
+        return FASE_FINAL
+    if "REPARTO" in e or "DISTRIBUCI" in e:
+        return FASE_REPARTO
+    if "TRANSITO" in e or "TRÁNSITO" in e or "VIAJA" in e or "CENTRO" in e:
+        return FASE_TRANSITO
+    return FASE_NUEVA
+
+
+def intervalo_base(estado: Optional[str]) -> int:
+    return {
+        FASE_REPARTO: INTERVALO_REPARTO,
+        FASE_TRANSITO: INTERVALO_TRANSITO,
+    }.get(fase(estado), INTERVALO_NUEVA)
+
+
+# ---------- estado persistido ----------
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS estados (
+    tenant TEXT NOT NULL,
+    guia TEXT NOT NULL,
+    estado TEXT NOT NULL,
+    actualizado REAL NOT NULL,
+    PRIMARY KEY (tenant, guia)
+) WITHOUT ROWID;
+"""
+
+_local = threading.local()
+
+
+def _conn() -> sqlite3.Connection:
+    conn = getattr(_local, "conn", None)
+    if conn is None:
+        conn = sqlite3.connect(TRACKING_DB, timeout=10, isolation_level=None)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.executescript(_SCHEMA)
+        _local.conn = conn
+    return conn
+
+
+def estados_guardados(tenant: str) -> Dict[str, str]:
+    """guía → último estado publicado. Purga lo que ya salió del lookback."""
+    if not TRACKING_DB:
+        return {}
+    conn = _conn()
+    conn.execute(
+        "DELETE FROM estados WHERE actualizado<?",
+        (time.time() - (TRACKING_LOOKBACK_DAYS + 1) * 86400,),
+    )
+    return dict(conn.execute("SELECT guia, estado FROM estados WHERE tenant=?", (tenant,)))
+
+
+def guardar_estados(tenant: str, estados: List[Tuple[str, str]]) -> None:
+    if not TRACKING_DB or not estados:
+        return
+    ahora = time.time()
+    _conn().executemany(
+        "INSERT OR REPLACE INTO estados (tenant, guia, estado, actualizado) VALUES (?, ?, ?, ?)",
+        [(tenant, guia, estado, ahora) for guia, estado in estados],
+    )
+
+
+# ---------- cliente ConsultarGuia ----------
+def consultar_guia(num_guia: str) -> Tuple[bool, Dict[str, Any]]:
+    xml = (
+        '<?xml version="1.0" encoding="utf-8"?>'
+        '<soap:Envelope xmlns:soap="http://schemas.xmlsoap.org/soap/envelope/">'
+        f'<soap:Body><ConsultarGuia xmlns="{SERVI_TRACKING_NS}">'
+        f"<NumeroGuia>{escape(str(num_guia))}</NumeroGuia>"
+        "</ConsultarGuia></soap:Body></soap:Envelope>"
+    )
+    headers = {
+        "Content-Type": "text/xml; charset=utf-8",
+        "SOAPAction": f'"{SERVI_TRACKING_NS}ConsultarGuia"',
+    }
+    try:
+        r = session.post(
+            SERVI_TRACKING_URL,
+            data=xml.encode("utf-8"),
+            headers=headers,
+            timeout=SERVI_TRACKING_TIMEOUT,
+        )
+        r.raise_for_status()
+        root = _parse_xml(r.text)
+    except (requests.RequestException, ValueError) as e:
+        return False, {"error": "tracking_failed", "detail": str(e)}
+
+    estado = _find_first_text_by_localname(root, ["EstAct", "Estado", "EstadoActual"])
+    if not estado:
+        return False, {"error": "no_estado", "raw_xml": r.text}
+    fecha = _find_first_text_by_localname(root, ["FecEst", "FechaEstado", "Fec_Est"])
+    return True, {"estado": estado.strip().upper(), "fecha": fecha}
+
+
+# ---------- poller ----------
+class TrackingPoller:
+    """
+    Sigue las guías abiertas con intervalos adaptativos y escribe los cambios
+    de estado en stock.picking + chatter en lote.
+    """
+
+    def __init__(self, concurrencia: int = TRACKING_CONCURRENCY, tenant: str = "default"):
+        self.concurrencia = concurrencia
+        self.tenant = tenant
+        # guia → {"picking_id", "estado", "proximo", "intervalo"}
+        self.agenda: Dict[str, Dict[str, Any]] = {}
+        # Guías ya finalizadas (por si el estado no se puede guardar en Odoo)
+        self.finalizadas: set = set()
+        self.lock = threading.Lock()
+        ok, campos = odoo_rpc.fields_get("stock.picking")
+        self.campo_estado = TRACKING_STATE_FIELD if ok and TRACKING_STATE_FIELD in campos else None
+        if not self.campo_estado:
+            log.warning(
+                "⚠️ Campo %s no existe en stock.picking: el estado solo se publicará en el chatter",
+                TRACKING_STATE_FIELD,
+            )
+
+    def cargar_guias_abiertas(self) -> int:
+        """Una sola búsqueda en Odoo: pickings con guía Servientrega aún no finalizados."""
+        desde = time.strftime(
+            "%Y-%m-%d %H:%M:%S", time.gmtime(time.time() - TRACKING_LOOKBACK_DAYS * 86400)
+        )
+        domain = [
+            ["carrier_tracking_ref", "!=", False],
+            ["carrier_tracking_url", "ilike", "servientrega"],
+            ["date_done", ">=", desde],
+        ]
+        campos = ["carrier_tracking_ref"]
+        if self.campo_estado:
+            campos.append(self.campo_estado)
+        ok, resp = odoo_rpc.search_read("stock.picking", domain, campos, limit=5000)
+        if not ok:
+            log.error("❌ No se pudieron leer las guías abiertas: %s", resp)
+            return 0
+
+        try:
+            guardados = estados_guardados(self.tenant)
+        except sqlite3.Error as e:
+            log.warning("⚠️ No se pudo leer el estado local de rastreo: %s", str(e))
+            guardados = {}
+        ahora = time.time()
+        nuevas = 0
+        with self.lock:
+            for p in resp.get("result", []):
+                guia = p["carrier_tracking_ref"]
+                estado = (p.get(self.campo_estado) if self.campo_estado else None) or guardados.get(guia)
+                if fase(estado) == FASE_FINAL or guia in self.agenda or guia in self.finalizadas:
+                    continue
+                self.agenda[guia] = {
+                    "picking_id": p["id"],
+                    "estado": estado or None,
+                    "proximo": ahora,
+                    "intervalo": intervalo_base(estado),
+                }
+                nuevas += 1
+        return nuevas
+
+    def pendientes(self, ahora: Optional[float] = None) -> List[str]:
+        ahora = ahora or time.time()
+        with self.lock:
+            return [g for g, a in self.agenda.items() if a["proximo"] <= ahora]
+
+    def _reagendar(self, guia: str, estado: Optional[str], cambio: bool) -> None:
+        a = self.agenda[guia]
+        if fase(estado) == FASE_FINAL:
+            del self.agenda[guia]
+            self.finalizadas.add(guia)
+            return
+        if cambio:
+            a["intervalo"] = intervalo_base(estado)
+        else:
+            a["intervalo"] = min(int(a["intervalo"] * BACKOFF_SIN_CAMBIO), INTERVALO_MAX)
+        a["estado"] = estado
+        a["proximo"] = time.time() + a["intervalo"]
+
+    def ciclo(self) -> Dict[str, Any]:
+        """Consulta en paralelo las guías vencidas y persiste los cambios en lote."""
+        guias = self.pendientes()
+        if not guias:
+            return {"consultadas": 0, "cambios": 0}
+
+        with ThreadPoolExecutor(max_workers=self.concurrencia, thread_name_prefix="tracking") as ex:
+            respuestas = list(zip(guias, ex.map(consultar_guia, guias)))
+
+        cambios: List[Tuple[int, str, str]] = []
+        # Primera observación de una guía sin estado previo conocido: solo fija la línea base
+        # (la creación de la guía ya quedó en el chatter)
+        iniciales: List[Tuple[int, str, str]] = []
+        errores = 0
+        with self.lock:
+            for guia, (ok, data) in respuestas:
+                if guia not in self.agenda:
+                    continue
+                anterior = self.agenda[guia]["estado"]
+                if not ok:
+                    errores += 1
+                    self._reagendar(guia, anterior, cambio=False)
+                    continue
+                estado = data["estado"]
+                cambio = estado != anterior
+                if cambio:
+                    destino = cambios if anterior else iniciales
+                    destino.append((self.agenda[guia]["picking_id"], guia, estado))
+                self._reagendar(guia, estado, cambio)
+
+        if cambios or iniciales:
+            self.persistir(cambios, iniciales)
+        log.info(
+            "🚚 Rastreo: %s guías consultadas, %s cambios, %s errores, %s en agenda",
+            len(guias),
+            len(cambios),
+            errores,
+            len(self.agenda),
+        )
+        return {"consultadas": len(guias), "cambios": len(cambios), "errores": errores}
+
+    def persistir(
+        self, cambios: List[Tuple[int, str, str]], iniciales: Optional[List[Tuple[int, str, str]]] = None
+    ) -> None:
+        """Escribe el campo de estado (cambios e iniciales) y publica en el chatter solo los cambios."""
+        todos = cambios + (iniciales or [])
+        if self.campo_estado:
+            ok, res = odoo_rpc.write_many(
+                "stock.picking", [(pid, {self.campo_estado: estado}) for pid, _, estado in todos]
+            )
+            if not ok:
+                log.error("❌ Errores escribiendo estados: %s", [r for r in res if not r["ok"]])
+        if cambios:
+            ok, res = odoo_rpc.message_post_many(
+                "stock.picking",
+                [(pid, f"🚚 Servientrega guía {guia}: {estado}") for pid, guia, estado in cambios],
+            )
+            if not ok:
+                log.error("❌ Errores publicando estados en chatter: %s", res)
+        try:
+            guardar_estados(self.tenant, [(guia, estado) for _, guia, estado in todos])
+        except sqlite3.Error as e:
+            log.warning("⚠️ No se pudo guardar el estado local de rastreo: %s", str(e))
+
+    def run(self, tick: int = TRACKING_TICK, refresco: int = 900) -> None:
+        ultimo_refresco = 0.0
+        while True:
+            if time.time() - ultimo_refresco >= refresco:
+                nuevas = self.cargar_guias_abiertas()
+                ultimo_refresco = time.time()
+                log.info("🚚 %s guías nuevas en seguimiento", nuevas)
+            self.ciclo()
+            time.sleep(tick)
+
+
+# ---------- stand-in local del servicio de rastreo ----------
+ESTADOS_STAND_IN = ["GUIA GENERADA", "EN TRANSITO", "EN REPARTO", "ENTREGADO"]
+
+
+def servir_stand_in(port: int = 8099, avance: int = 2) -> None:
+    """
+    Servicio ConsultarGuia falso: cada guía avanza un estado cada `avance` consultas.
+    Uso: SERVI_TRACKING_URL=http://127.0.0.1:8099/ python tracking_poller.py once
+    """
+    consultas: Dict[str, int] = {}
+
+    class Handler(BaseHTTPRequestHandler):
+        def do_POST(self):
+            body = self.rfile.read(int(self.headers.get("Content-Length", "0")))
+            guia = _find_first_text_by_localname(_parse_xml(body), ["NumeroGuia"]) or ""
+            consultas[guia] = consultas.get(guia, 0) + 1
+            idx = min((consultas[guia] - 1) // max(avance, 1), len(ESTADOS_STAND_IN) - 1)
+            xml = (
+                '<?xml version="1.0" encoding="utf-8"?>'
+                '<soap:Envelope xmlns:soap="http://schemas.xmlsoap.org/soap/envelope/"><soap:Body>'
+                f'<ConsultarGuiaResponse xmlns="{SERVI_TRACKING_NS}"><ConsultarGuiaResult>'
+                f"<NumGui>{escape(guia)}</NumGui><EstAct>{ESTADOS_STAND_IN[idx]}</EstAct>"
+                f"<FecEst>{time.strftime('%Y-%m-%dT%H:%M:%S')}</FecEst>"
+                "</ConsultarGuiaResult></ConsultarGuiaResponse></soap:Body></soap:Envelope>"
+            ).encode("utf-8")
+            self.send_response(200)
+            self.send_header("Content-Type", "text/xml; charset=utf-8")
+            self.send_header("Content-Length", str(len(xml)))
+            self.end_headers()
+            self.wfile.write(xml)
+
+        def log_message(self, fmt, *args):
+            log.debug("stand-in: " + fmt, *args)
+
+    log.info("🧪 Stand-in de rastreo en http://127.0.0.1:%s/", port)
+    ThreadingHTTPServer(("127.0.0.1", port), Handler).serve_forever()
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Seguimiento de guías Servientrega")
+    parser.add_argument("--tenant", default="default", help="tenant de TENANTS_FILE (un poller por tenant)")
+    sub = parser.add_subparsers(dest="cmd", required=True)
+    p_run = sub.add_parser("run", help="poller continuo")
+    p_run.add_argument("--tick", type=int, default=TRACKING_TICK)
+    sub.add_parser("once", help="un solo ciclo con todas las guías abiertas")
+    p_guia = sub.add_parser("guia", help="consultar una guía")
+    p_guia.add_argument("numero")
+    p_stand = sub.add_parser("stand-in", help="servicio de rastreo falso para pruebas")
+    p_stand.add_argument("--port", type=int, default=8099)
+    p_stand.add_argument("--avance", type=int, default=2)
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s | %(levelname)s | %(name)s | %(message)s")
+
+    if args.cmd == "stand-in":
+        servir_stand_in(args.port, args.avance)
+    elif args.cmd == "guia":
+        ok, data = consultar_guia(args.numero)
+        print(data)
+        return 0 if ok else 1
+    else:
+        import tenants
+
+        tenant = tenants.obtener(args.tenant)
+        if not tenant:
+            parser.error(f"tenant desconocido: {args.tenant}")
+        # Las escrituras a Odoo corren en el hilo principal: basta activar el tenant aquí
+        with tenants.activar(tenant):
+            poller = TrackingPoller(tenant=tenant.nombre)
+            if args.cmd == "once":
+                poller.cargar_guias_abiertas()
+                print(poller.ciclo())
+            else:
+                poller.run(tick=args.tick)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,155 @@
+import re
+import logging
+from typing import Any, Callable, Dict, List, NamedTuple, Optional
+
+import dane
+
+log = logging.getLogger("validacion_ws22")
+
+# Límites de campos WS22 (CargueMasivoExterno)
+MAX_DICE_CONTENER = 50
+MAX_DIRECCION = 150
+MAX_NOMBRE_CONTACTO = 100
+MAX_DOC_RELACIONADO = 50
+MAX_IDENTIFICACION = 20
+MIN_TELEFONO = 7
+MAX_TELEFONO = 15
+PESO_MAX_KG = 1000.0
+PESO_MIN_PIEZA_KG = 0.1  # construir_payload_ws22 lleva las piezas más livianas a este mínimo
+MAX_PIEZAS = 500
+
+
+class Regla(NamedTuple):
+    """Regla declarativa sobre un campo WS22: de dónde sale el valor y qué se exige."""
+
+    campo: str
+    valor: Callable[[Dict[str, Any]], Any]
+    requerido: bool = False
+    max_len: Optional[int] = None
+    minimo: Optional[float] = None
+    maximo: Optional[float] = None
+    patron: Optional[str] = None
+
+
+def _telefono(ctx: Dict[str, Any]) -> str:
+    p = ctx["partner"]
+    tel = p.get("phone") or p.get("mobile") or ""
+    return re.sub(r"[\s\-\(\)\+\.]", "", str(tel))
+
+
+def _peso_total(ctx: Dict[str, Any]) -> float:
+    pk = ctx["picking"]
+    return float(pk.get("weight") or 0.0) or float(pk.get("shipping_weight") or 0.0)
+
+
+REGLAS_WS22: List[Regla] = [
+    Regla("Doc_Relacionado", lambda c: c["picking"].get("name"), True, MAX_DOC_RELACIONADO),
+    Regla("Nom_Contacto", lambda c: c["partner"].get("name"), True, MAX_NOMBRE_CONTACTO),
+    Regla("Des_Direccion", lambda c: c["partner"].get("street"), True, MAX_DIRECCION),
+    Regla("Des_Telefono", _telefono, True, patron=rf"^\d{{{MIN_TELEFONO},{MAX_TELEFONO}}}$"),
+    Regla("Ide_Num_Identific_Dest", lambda c: c["partner"].get("vat"), max_len=MAX_IDENTIFICACION),
+    Regla("Des_DiceContener", lambda c: c["contenido"], True, MAX_DICE_CONTENER),
+    Regla("Num_PesoTotal", _peso_total, minimo=0.0, maximo=PESO_MAX_KG),
+    Regla("Num_ValorDeclaradoTotal", lambda c: c["valor_declarado"], minimo=0.0),
+    Regla(
+        "Num_Piezas",
+        lambda c: len(c["paquetes_info"]) if c["paquetes_info"] else 1,
+        minimo=1,
+        maximo=MAX_PIEZAS,
+    ),
+]
+
+
+def _vacio(v: Any) -> bool:
+    return v is None or v is False or (isinstance(v, str) and not v.strip())
+
+
+def aplicar_regla(regla: Regla, ctx: Dict[str, Any]) -> List[str]:
+    try:
+        v = regla.valor(ctx)
+    except (TypeError, ValueError, KeyError) as e:
+        return [f"{regla.campo}: valor inválido ({e})"]
+
+    if _vacio(v):
+        return [f"{regla.campo}: campo requerido vacío"] if regla.requerido else []
+
+    errores = []
+    if regla.max_len is not None and len(str(v)) > regla.max_len:
+        errores.append(f"{regla.campo}: longitud {len(str(v))} supera el máximo de {regla.max_len}")
+    if regla.patron is not None and not re.match(regla.patron, str(v)):
+        errores.append(f"{regla.campo}: formato inválido '{v}'")
+    if regla.minimo is not None or regla.maximo is not None:
+        try:
+            n = float(v)
+        except (TypeError, ValueError):
+            return errores + [f"{regla.campo}: debe ser numérico ('{v}')"]
+        if regla.minimo is not None and n < regla.minimo:
+            errores.append(f"{regla.campo}: {n} es menor que {regla.minimo}")
+        if regla.maximo is not None and n > regla.maximo:
+            errores.append(f"{regla.campo}: {n} es mayor que {regla.maximo}")
+    return errores
+
+
+def _validar_destino(ctx: Dict[str, Any]) -> List[str]:
+    """Des_Ciudad: sin código DANE no se envía (antes se usaba una ciudad por defecto)."""
+    partner = ctx["partner"]
+    ciudad = partner.get("city")
+    if _vacio(ciudad):
+        return ["Des_Ciudad: campo requerido vacío"]
+    if dane.resolver_partner(partner):
+        return []
+    state = partner.get("state_id")
+    depto = state[1] if isinstance(state, (list, tuple)) and len(state) > 1 else None
+    if depto:
+        depto = re.sub(r"\s*\([A-Z]{2}\)$", "", depto)  # "Antioquia (CO)" → "Antioquia"
+    donde = f"'{ciudad}' ({depto})" if depto else f"'{ciudad}'"
+    return [f"Des_Ciudad: no se encontró el código DANE de {donde}"]
+
+
+def _validar_empaques(ctx: Dict[str, Any]) -> List[str]:
+    errores = []
+    paquetes = ctx["paquetes_info"] or []
+    esperado = ctx.get("num_paquetes") or 0
+    if esperado and paquetes and esperado != len(paquetes):
+        errores.append(
+            f"Num_Piezas: {len(paquetes)} empaques no coinciden con el contador de paquetes ({esperado})"
+        )
+    for idx, pkg in enumerate(paquetes):
+        nombre = pkg.get("name") or idx + 1
+        peso = pkg.get("peso")
+        # Sin peso o por debajo de PESO_MIN_PIEZA_KG no es error: el payload reparte el
+        # peso del picking o usa el mínimo; solo se rechaza lo que WS22 no acepta
+        if peso and float(peso) > PESO_MAX_KG:
+            errores.append(f"Num_Peso (caja {nombre}): peso fuera de rango ({peso})")
+        for dim in ("alto", "ancho", "largo"):
+            if pkg.get(dim) is not None and float(pkg[dim]) <= 0:
+                errores.append(f"Num_{dim.capitalize()} (caja {nombre}): debe ser mayor que 0")
+    return errores
+
+
+def validar_envio(
+    picking: Dict[str, Any],
+    partner: Dict[str, Any],
+    contenido: str,
+    paquetes_info: Optional[List[Dict[str, Any]]],
+    valor_declarado: float,
+    num_paquetes: int = 0,
+) -> List[str]:
+    """
+    Valida en una sola pasada los datos hidratados contra las reglas de campos WS22.
+    Retorna la lista completa de errores (vacía si el envío es válido).
+    """
+    ctx = {
+        "picking": picking,
+        "partner": partner,
+        "contenido": contenido,
+        "paquetes_info": paquetes_info,
+        "valor_declarado": valor_declarado,
+        "num_paquetes": num_paquetes,
+    }
+    errores: List[str] = []
+    for regla in REGLAS_WS22:
+        errores.extend(aplicar_regla(regla, ctx))
+    errores.extend(_validar_destino(ctx))
+    errores.extend(_validar_empaques(ctx))
+    return errores
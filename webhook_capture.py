@@ -0,0 +1,143 @@
+import os
+import re
+import json
+import time
+import fcntl
+import queue
+import atexit
+import logging
+import threading
+from typing import Any, Dict, Optional
+
+log = logging.getLogger("webhook_capture")
+
+# Captura de webhooks entrantes (JSONL) para reproducir tráfico real con webhook_replay.py.
+# Vacío = desactivado. El request solo encola el body crudo; parseo, sanitizado y escritura
+# ocurren en un hilo aparte, en lotes.
+WEBHOOK_CAPTURE_FILE = os.getenv("WEBHOOK_CAPTURE_FILE", "")
+WEBHOOK_CAPTURE_BATCH = int(os.getenv("WEBHOOK_CAPTURE_BATCH", "200"))
+WEBHOOK_CAPTURE_FLUSH = float(os.getenv("WEBHOOK_CAPTURE_FLUSH", "2"))
+WEBHOOK_CAPTURE_QUEUE = int(os.getenv("WEBHOOK_CAPTURE_QUEUE", "10000"))
+# Claves cuyo valor se enmascara (credenciales, nombre, dirección y contacto del destinatario).
+# En los many2one de Odoo ([id, "display_name"], p. ej. partner_id) solo se enmascara el nombre
+WEBHOOK_CAPTURE_REDACT = os.getenv(
+    "WEBHOOK_CAPTURE_REDACT",
+    r"pass|pwd|token|secret|api_?key|authorization|email|phone|mobile|vat|street|name|city|zip"
+    r"|address|partner|contact",
+)
+
+_REDACT_RE = re.compile(WEBHOOK_CAPTURE_REDACT, re.I) if WEBHOOK_CAPTURE_REDACT else None
+HEADERS_CAPTURADOS = ["Content-Type", "X-Tenant", "User-Agent"]
+
+_queue: "queue.Queue[Dict[str, Any]]" = queue.Queue(maxsize=WEBHOOK_CAPTURE_QUEUE)
+_writer: Optional[threading.Thread] = None
+_writer_lock = threading.Lock()
+_descartados = 0
+
+
+def activo() -> bool:
+    return bool(WEBHOOK_CAPTURE_FILE)
+
+
+def capturar(path: str, body: bytes, headers: Dict[str, str]) -> bool:
+    """Encola un webhook recibido. Nunca bloquea: con la cola llena se descarta y se cuenta."""
+    global _descartados
+    if not WEBHOOK_CAPTURE_FILE:
+        return False
+    _arrancar_writer()
+    try:
+        _queue.put_nowait({"ts": time.time(), "path": path, "headers": headers, "body": body})
+        return True
+    except queue.Full:
+        _descartados += 1
+        if _descartados % 1000 == 1:
+            log.warning("⚠️ Captura de webhooks saturada: %s descartados", _descartados)
+        return False
+
+
+def _enmascarar(valor: Any) -> Any:
+    # many2one [id, "display_name"]: el id se conserva para que el replay siga apuntando al registro
+    if isinstance(valor, list) and len(valor) == 2 and isinstance(valor[0], int) and isinstance(valor[1], str):
+        return [valor[0], "***"]
+    return "***"
+
+
+def sanitizar(valor: Any) -> Any:
+    if _REDACT_RE is None:
+        return valor
+    if isinstance(valor, dict):
+        return {
+            k: (_enmascarar(v) if _REDACT_RE.search(str(k)) and v not in (None, False, "") else sanitizar(v))
+            for k, v in valor.items()
+        }
+    if isinstance(valor, list):
+        return [sanitizar(v) for v in valor]
+    return valor
+
+
+def _registro(item: Dict[str, Any]) -> str:
+    try:
+        payload = json.loads(item["body"] or b"{}")
+    except ValueError:
+        payload = {"_raw": item["body"].decode("utf-8", "replace")[:2000]}
+    headers = {h: v for h, v in item["headers"].items() if h in HEADERS_CAPTURADOS}
+    return json.dumps(
+        {"ts": item["ts"], "path": item["path"], "headers": headers, "payload": sanitizar(payload)},
+        ensure_ascii=False,
+        default=str,
+    )
+
+
+def _escribir(lineas: list) -> None:
+    carpeta = os.path.dirname(WEBHOOK_CAPTURE_FILE)
+    if carpeta:
+        os.makedirs(carpeta, exist_ok=True)
+    # Lock: varios workers (procesos) pueden compartir el archivo
+    with open(WEBHOOK_CAPTURE_FILE, "a", encoding="utf-8") as fh:
+        fcntl.flock(fh, fcntl.LOCK_EX)
+        try:
+            fh.write("\n".join(lineas) + "\n")
+            fh.flush()
+        finally:
+            fcntl.flock(fh, fcntl.LOCK_UN)
+
+
+def _loop_writer() -> None:
+    lote = []
+    limite = time.monotonic() + WEBHOOK_CAPTURE_FLUSH
+    while True:
+        try:
+            item = _queue.get(timeout=max(0.05, limite - time.monotonic()))
+            lote.append(item)
+        except queue.Empty:
+            pass
+        if lote and (len(lote) >= WEBHOOK_CAPTURE_BATCH or time.monotonic() >= limite):
+            try:
+                _escribir([_registro(i) for i in lote])
+            except Exception as e:
+                log.error("❌ Error escribiendo captura de webhooks: %s", str(e))
+            finally:
+                for _ in lote:
+                    _queue.task_done()
+                lote = []
+        if time.monotonic() >= limite:
+            limite = time.monotonic() + WEBHOOK_CAPTURE_FLUSH
+
+
+def _arrancar_writer() -> None:
+    global _writer
+    if _writer and _writer.is_alive():
+        return
+    with _writer_lock:
+        if _writer and _writer.is_alive():
+            return
+        _writer = threading.Thread(target=_loop_writer, name="webhook-capture", daemon=True)
+        _writer.start()
+        atexit.register(flush)
+
+
+def flush(timeout: float = 5.0) -> None:
+    """Espera a que lo encolado llegue al archivo (apagado/pruebas; el request path no lo usa)."""
+    limite = time.time() + timeout
+    while _queue.unfinished_tasks and time.time() < limite:
+        time.sleep(0.01)
@@ -0,0 +1,331 @@
+"""
+Reproduce una captura de webhooks (WEBHOOK_CAPTURE_FILE) contra una instancia en marcha
+y reporta throughput y percentiles de latencia.
+
+    python webhook_replay.py stubs --port 8098                      # Odoo + WS22 falsos
+    python webhook_replay.py run captures/webhooks.jsonl --speed 1  # ritmo original
+    python webhook_replay.py run captures/webhooks.jsonl --speed 10 --concurrency 16
+    python webhook_replay.py run captures/webhooks.jsonl --max --concurrency 32
+
+⚠️ Los payloads traen IDs de pickings reales: la instancia destino debe apuntar a los stubs
+(o a QA), nunca a producción. Por eso solo se aceptan URLs locales salvo --allow-remote.
+"""
+import sys
+import math
+import json
+import time
+import base64
+import logging
+import argparse
+import threading
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Dict, Iterator, List, Optional
+from urllib.parse import urlparse
+
+import requests
+
+log = logging.getLogger("webhook_replay")
+
+HOSTS_LOCALES = {"127.0.0.1", "localhost", "::1"}
+PERCENTILES = [50, 90, 95, 99]
+
+
+# ---------- lectura de la captura ----------
+def leer_captura(path: str, limite: Optional[int] = None) -> Iterator[Dict[str, Any]]:
+    with open(path, encoding="utf-8") as fh:
+        for n, linea in enumerate(fh, 1):
+            if limite is not None and n > limite:
+                return
+            linea = linea.strip()
+            if not linea:
+                continue
+            try:
+                yield json.loads(linea)
+            except ValueError:
+                log.warning("⚠️ Línea %s inválida en %s; se omite", n, path)
+
+
+# ---------- envío ----------
+class Resultados:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.latencias: List[float] = []
+        self.codigos: Counter = Counter()
+        # Respuestas con guía: distingue el camino completo de los rechazos rápidos (400/409)
+        self.con_guia = 0
+
+    def agregar(self, codigo: str, latencia: float, guia: bool = False) -> None:
+        with self.lock:
+            self.latencias.append(latencia)
+            self.codigos[codigo] += 1
+            self.con_guia += guia
+
+
+def percentil(valores: List[float], p: float) -> float:
+    """Nearest-rank sobre una lista ordenada."""
+    if not valores:
+        return 0.0
+    idx = max(0, math.ceil(p / 100.0 * len(valores)) - 1)
+    return valores[min(idx, len(valores) - 1)]
+
+
+def _enviar(session: requests.Session, url: str, registro: Dict[str, Any], timeout: float, res: Resultados) -> None:
+    headers = {"Content-Type": "application/json"}
+    headers.update({k: v for k, v in (registro.get("headers") or {}).items() if k != "Content-Length"})
+    inicio = time.perf_counter()
+    try:
+        r = session.post(
+            url.rstrip("/") + (registro.get("path") or "/webhook"),
+            data=json.dumps(registro.get("payload") or {}),
+            headers=headers,
+            timeout=timeout,
+        )
+        codigo = str(r.status_code)
+        guia = r.headers.get("Content-Type", "").startswith("application/json") and bool(
+            (r.json() or {}).get("guia")
+        )
+    except requests.RequestException as e:
+        codigo, guia = type(e).__name__, False
+    except ValueError:
+        guia = False
+    res.agregar(codigo, time.perf_counter() - inicio, guia)
+
+
+def reproducir(
+    registros: List[Dict[str, Any]],
+    url: str,
+    speed: float = 1.0,
+    concurrency: int = 8,
+    timeout: float = 120.0,
+) -> Dict[str, Any]:
+    """
+    speed=1 respeta los intervalos originales, speed=N los divide por N y speed=0 envía
+    todo tan rápido como permite `concurrency`.
+    """
+    res = Resultados()
+    session = requests.Session()
+    adapter = requests.adapters.HTTPAdapter(pool_connections=1, pool_maxsize=concurrency)
+    session.mount("http://", adapter)
+    session.mount("https://", adapter)
+
+    # Varios workers escriben la captura en lotes: las líneas no quedan en orden de llegada
+    registros = sorted(registros, key=lambda r: r.get("ts", 0))
+    ts0 = registros[0].get("ts", 0) if registros else 0
+    inicio = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency, thread_name_prefix="replay") as pool:
+        for registro in registros:
+            if speed > 0:
+                espera = (registro.get("ts", ts0) - ts0) / speed - (time.perf_counter() - inicio)
+                if espera > 0:
+                    time.sleep(espera)
+            pool.submit(_enviar, session, url, registro, timeout, res)
+    duracion = time.perf_counter() - inicio
+
+    lat = sorted(res.latencias)
+    return {
+        "total": len(lat),
+        "codigos": dict(res.codigos),
+        "con_guia": res.con_guia,
+        "duracion_s": round(duracion, 3),
+        "req_s": round(len(lat) / duracion, 2) if duracion else 0.0,
+        "latencia_ms": {
+            **{f"p{p}": round(percentil(lat, p) * 1000, 1) for p in PERCENTILES},
+            "max": round(lat[-1] * 1000, 1) if lat else 0.0,
+        },
+    }
+
+
+# ---------- stubs de Odoo y WS22 ----------
+STICKER_STUB = base64.b64encode(b"%PDF-1.4\n% stub\n%%EOF\n").decode("ascii")
+
+REGISTROS_STUB: Dict[str, Dict[str, Any]] = {
+    "stock.picking": {
+        "name": "WH/OUT/STUB",
+        "state": "done",
+        "carrier_tracking_ref": False,
+        "carrier_id": [1, "Servientrega"],
+        "partner_id": [1, "Cliente Stub"],
+        "weight": 2.5,
+        "shipping_weight": 0.0,
+        "move_ids": [1, 2],
+        # Sin líneas la pre-validación responde 400 y el replay solo mediría el rechazo
+        "move_line_ids": [1],
+        "x_studio_servientrega": True,
+        "x_studio_numero_de_paquetes": 1,
+        "packages_count": 1,
+    },
+    "res.partner": {
+        "name": "Cliente Stub",
+        "street": "Calle 10 # 43A-25",
+        "city": "Medellín",
+        "state_id": [1, "Antioquia (CO)"],
+        "phone": "6044441234",
+        "mobile": "3001234567",
+        "vat": "900123456",
+    },
+    "stock.move.line": {
+        "product_id": [1, "[SKU-00001] Producto Stub"],
+        "quantity": 1,
+        "result_package_id": False,
+    },
+    "stock.move": {
+        "product_id": [1, "[SKU-00001] Producto Stub"],
+        "product_uom_qty": 1,
+        "price_unit": 50000,
+    },
+}
+
+
+def _registro_stub(model: str, rid: int, fields: List[str]) -> Dict[str, Any]:
+    base = REGISTROS_STUB.get(model, {})
+    return {"id": rid, **{f: base.get(f, False) for f in fields}}
+
+
+def _respuesta_odoo(params: Dict[str, Any]) -> Any:
+    if params.get("service") == "common":
+        return {"server_version": "stub", "server_version_info": [17, 0, 0, "final", 0, ""]}
+    args = params.get("args") or []
+    model, method = args[3], args[4]
+    margs = args[5] if len(args) > 5 else []
+    kwargs = args[6] if len(args) > 6 else {}
+    if method == "read":
+        ids = margs[0] if margs else []
+        fields = kwargs.get("fields") or (margs[1] if len(margs) > 1 else [])
+        return [_registro_stub(model, rid, fields) for rid in ids]
+    if method == "fields_get":
+        # Esquema vacío: el cliente no descarta campos de antemano
+        return {}
+    if method in ["search_read", "search"]:
+        return []
+    if method == "search_count":
+        return 0
+    if method == "create":
+        return 1
+    return True
+
+
+def servir_stubs(port: int = 8098, latencia_ms: int = 0) -> None:
+    """
+    Odoo JSON-RPC (/jsonrpc) y WS22 (/ws22) falsos en el mismo puerto, con latencia opcional.
+    Ninguna llamada sale de la máquina.
+    """
+    contador = {"guia": 2100000000}
+    lock = threading.Lock()
+
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def _responder(self, cuerpo: bytes, tipo: str) -> None:
+            if latencia_ms:
+                time.sleep(latencia_ms / 1000.0)
+            self.send_response(200)
+            self.send_header("Content-Type", tipo)
+            self.send_header("Content-Length", str(len(cuerpo)))
+            self.end_headers()
+            self.wfile.write(cuerpo)
+
+        def do_GET(self):
+            # ?WSDL del warm-up/keep-alive
+            self._responder(b"<definitions/>", "text/xml; charset=utf-8")
+
+        def do_POST(self):
+            body = self.rfile.read(int(self.headers.get("Content-Length", "0")))
+            if self.path.startswith("/jsonrpc"):
+                data = json.loads(body or b"{}")
+                resp = {"jsonrpc": "2.0", "id": data.get("id"), "result": _respuesta_odoo(data.get("params") or {})}
+                self._responder(json.dumps(resp).encode("utf-8"), "application/json")
+                return
+            if b"GenerarGuiaSticker" in body:
+                inner = (
+                    "<GenerarGuiaStickerResponse xmlns=\"http://tempuri.org/\">"
+                    "<GenerarGuiaStickerResult>true</GenerarGuiaStickerResult>"
+                    f"<bytesReport>{STICKER_STUB}</bytesReport></GenerarGuiaStickerResponse>"
+                )
+            else:
+                with lock:
+                    contador["guia"] += 1
+                    guia = contador["guia"]
+                inner = (
+                    "<CargueMasivoExternoResponse xmlns=\"http://tempuri.org/\">"
+                    "<CargueMasivoExternoResult>true</CargueMasivoExternoResult>"
+                    "<envios><CargueMasivoExternoDTO><objEnvios><EnviosExterno>"
+                    f"<Num_Guia>{guia}</Num_Guia></EnviosExterno></objEnvios></CargueMasivoExternoDTO></envios>"
+                    "<arrayGuias><string>OK</string></arrayGuias></CargueMasivoExternoResponse>"
+                )
+            xml = (
+                '<?xml version="1.0" encoding="utf-8"?>'
+                '<soap:Envelope xmlns:soap="http://schemas.xmlsoap.org/soap/envelope/">'
+                f"<soap:Body>{inner}</soap:Body></soap:Envelope>"
+            )
+            self._responder(xml.encode("utf-8"), "text/xml; charset=utf-8")
+
+        def log_message(self, fmt, *args):
+            log.debug("stub: " + fmt, *args)
+
+    log.info("🧪 Stubs en http://127.0.0.1:%s (latencia %s ms). Arrancar la instancia con:", port, latencia_ms)
+    log.info("   TEST_ODOO_JSONRPC=http://127.0.0.1:%s/jsonrpc SERVI_URL_QA=http://127.0.0.1:%s/ws22", port, port)
+    log.info("   USE_PRODUCTION=false SERVI_USE_PRODUCTION=false")
+    ThreadingHTTPServer(("127.0.0.1", port), Handler).serve_forever()
+
+
+def _imprimir(reporte: Dict[str, Any]) -> None:
+    lat = reporte["latencia_ms"]
+    print(f"Requests:    {reporte['total']}  ({', '.join(f'{k}={v}' for k, v in sorted(reporte['codigos'].items()))})")
+    print(f"Con guía:    {reporte['con_guia']}")
+    print(f"Duración:    {reporte['duracion_s']} s")
+    print(f"Throughput:  {reporte['req_s']} req/s")
+    print("Latencia:    " + "  ".join(f"{k}={v} ms" for k, v in lat.items()))
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Replay de webhooks capturados")
+    sub = parser.add_subparsers(dest="cmd", required=True)
+    p_run = sub.add_parser("run", help="reproducir una captura contra una instancia")
+    p_run.add_argument("captura")
+    p_run.add_argument("--url", default="http://127.0.0.1:5000")
+    p_run.add_argument("--speed", type=float, default=1.0, help="1 = ritmo original, 10 = 10x más rápido")
+    p_run.add_argument("--max", action="store_true", help="sin esperas (máxima velocidad)")
+    p_run.add_argument("--concurrency", type=int, default=8)
+    p_run.add_argument("--limit", type=int)
+    p_run.add_argument("--timeout", type=float, default=120.0)
+    p_run.add_argument("--json", action="store_true", help="reporte en JSON")
+    p_run.add_argument("--allow-remote", action="store_true", help="permitir una URL no local")
+    p_stubs = sub.add_parser("stubs", help="Odoo y WS22 falsos para la instancia bajo prueba")
+    p_stubs.add_argument("--port", type=int, default=8098)
+    p_stubs.add_argument("--latency-ms", type=int, default=0, help="latencia simulada por llamada")
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s | %(levelname)s | %(name)s | %(message)s")
+
+    if args.cmd == "stubs":
+        servir_stubs(args.port, args.latency_ms)
+        return 0
+
+    if urlparse(args.url).hostname not in HOSTS_LOCALES and not args.allow_remote:
+        parser.error(f"{args.url} no es local; use --allow-remote si la instancia apunta a stubs o QA")
+    if args.speed <= 0 and not args.max:
+        parser.error("--speed debe ser > 0 (o use --max)")
+
+    registros = list(leer_captura(args.captura, args.limit))
+    if not registros:
+        print("ℹ️ Captura vacía")
+        return 0
+    log.info("▶️ Reproduciendo %s webhooks contra %s", len(registros), args.url)
+    reporte = reproducir(
+        registros,
+        args.url,
+        speed=0 if args.max else args.speed,
+        concurrency=args.concurrency,
+        timeout=args.timeout,
+    )
+    if args.json:
+        print(json.dumps(reporte, indent=2))
+    else:
+        _imprimir(reporte)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,18 +1,41 @@
+import io
 import os
 import sys
+import hmac
+import base64
 import logging
+import threading
+import time
+import contextvars
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
 import requests
-from flask import Flask, request, jsonify
+import settings  # primero: carga el .env antes de que los demás módulos lean el entorno
+import dane
+import dead_letter
+import json_codec
+import label_store
+import profiling
+import soap_archive
+import webhook_capture
+import servientrega_quote
+import servientrega_ws22
+import shared_cache
+import tenants
+import ws22_latency
+from validacion_ws22 import PESO_MIN_PIEZA_KG, validar_envio
+from flask import Flask, request, jsonify, send_file, g
+import odoo_rpc
 from odoo_rpc import safe_read, safe_write, message_post, create
-from dotenv import load_dotenv
 
 from xml.etree.ElementTree import fromstring
 
 # --------------------------------------------------
 # ENV & SWITCHES
 # --------------------------------------------------
-load_dotenv()
-
+# Credenciales y switches de ambiente se leen una vez; timeouts, campos y parámetros del
+# flujo viven en settings.actual() y se recargan en caliente (SIGHUP o cambio del .env)
 PORT = int(os.getenv("PORT", "5000"))
 
 # Switch de Odoo (se importa de odoo_rpc pero aquí lo usamos para logs)
@@ -32,29 +55,13 @@ else:
     SERVI_URL = os.getenv("SERVI_URL_QA")
     SERVI_MSG = "🧪 SERVIENTREGA: PRUEBAS (QA)"
 
-SERVI_TIMEOUT = int(os.getenv("SERVI_TIMEOUT", "35"))
-
 if not SERVI_URL:
     raise RuntimeError("No se pudo determinar SERVI_URL (faltan variables en .env)")
 
+# Dimensión usada cuando el tipo de empaque no la tiene (cm)
+DIMENSION_DEFAULT_CM = 5
 
-# --------------------------------------------------
-# CONFIGURACIÓN DE CAMPOS POR AMBIENTE (QA vs PROD)
-# --------------------------------------------------
-if USE_PRODUCTION:
-    # 🚀 NOMBRES DE CAMPOS EN PRODUCCIÓN (wondertechsas)
-    CAMPOS = {
-        "check_servientrega": "x_studio_servientrega",  # Ajustar si en Prod se llama diferente
-        "contador_paquetes": "x_studio_numero_de_paquetes",  # Ajustar nombre real de Prod
-        "historial_paquetes": "x_studio_paquetes_transferidos",  # Ajustar nombre real de Prod
-    }
-else:
-    # 🧪 NOMBRES DE CAMPOS EN QA (edu-wondertech-juan-pablo2)
-    CAMPOS = {
-        "check_servientrega": "x_studio_servientrega",
-        "contador_paquetes": "packages_count",
-        "historial_paquetes": "package_history_ids",
-    }
+# Nombres de campos por ambiente (QA vs PROD): ahora viven en tenants.py, uno por tenant
 
 
 # --------------------------------------------------
@@ -96,17 +103,190 @@ logger = logging.getLogger("servientrega_webhook")
 # FLASK
 # --------------------------------------------------
 app = Flask(__name__)
+json_codec.instalar_en_flask(app)
 logger.info("🔥 webhook_servientrega_ws22.py CARGADO")
 logger.info("📍 ODOO: %s", "🚀 PRODUCCIÓN" if USE_PRODUCTION else "🧪 PRUEBAS")
 logger.info("📍 %s", SERVI_MSG)
 
+# 🏢 Tenants: "default" (variables de entorno) + los de TENANTS_FILE
+tenants.cargar()
+
+# 🗺️ Tabla DANE: se carga una sola vez al arrancar
+dane.cargar()
+
+# 🔐 Secreto compartido para /labels/*: cada miss es un GenerarGuiaSticker facturado.
+# Vacío = sin token (solo para despliegues donde /labels no sale de la red interna)
+LABELS_TOKEN = os.getenv("LABELS_TOKEN", "")
+LABELS_TOKEN_HEADER = "X-Labels-Token"
+
+# 🗄️ Precalentado opcional de la caché de stickers (en segundo plano, ver iniciar_hilos_de_fondo)
+LABEL_CACHE_WARMUP = int(os.getenv("LABEL_CACHE_WARMUP", "0"))
+
+# 💲 Precálculo opcional de cotizaciones para los destinos más frecuentes
+QUOTE_PRECOMPUTE_TOP = int(os.getenv("QUOTE_PRECOMPUTE_TOP", "0"))
+
+# ⏩ Modo diferido (LABEL_ASYNC): responder con la guía y adjuntar el PDF en segundo plano.
+# El pool se crea al primer uso, así activar el modo con una recarga no requiere reinicio.
+_label_executor = None
+_label_executor_lock = threading.Lock()
+# Estado del sticker por (tenant, guía): pendiente → adjunta | error.
+# Acotado por proceso (LRU); entre workers lo comparten la caché compartida y el campo
+# estado_etiqueta del picking en Odoo (último recurso de /labels/<guia>/status)
+LABEL_STATUS_MAX = int(os.getenv("LABEL_STATUS_MAX", "5000"))
+ESTADO_ETIQUETAS = OrderedDict()
+_estado_etiquetas_lock = threading.Lock()
+
+# 🛡️ Valor del reclamo en la caché compartida ("guia") mientras se llama a CargueMasivoExterno
+GUIA_EN_CURSO = "en_curso"
+
+# ⚡ Fast path (WEBHOOK_FAST_PATH): usar los campos que ya trae el body del webhook de Odoo
+# write_date más reciente visto por (tenant, picking) (para detectar bodies viejos/reordenados)
+_ULTIMO_WRITE_DATE = {}
+
+
+# --------------------------------------------------
+# WARM-UP Y KEEP-ALIVE (ODOO + WS22)
+# --------------------------------------------------
+WARMUP_ENABLED = os.getenv("WARMUP_ENABLED", "true").lower() in ["true", "1", "yes"]
+WARMUP_FIELDS_GET = os.getenv("WARMUP_FIELDS_GET", "true").lower() in ["true", "1", "yes"]
+
+_warmup_listo = threading.Event()
+WARMUP_ESTADO = {}
+_ultima_actividad = time.monotonic()
+
+
+def _ping_ws22() -> bool:
+    """GET del WSDL: abre (o mantiene) la conexión TLS del pool hacia WS22."""
+    ws22 = servientrega_ws22.cliente()
+    try:
+        r = ws22.session.get(ws22.url + "?WSDL", timeout=ws22.timeout)
+        return r.status_code < 500
+    except requests.RequestException as e:
+        logger.warning("⚠️ Ping WS22 fallido: %s", str(e))
+        return False
+
+
+def _ping_odoo() -> bool:
+    ok, resp = odoo_rpc.ping()
+    if not ok:
+        logger.warning("⚠️ Ping Odoo fallido: %s", resp)
+    return ok
+
+
+def calentar_conexiones():
+    inicio = time.monotonic()
+    for tenant in tenants.todos():
+        # El tenant por defecto conserva las claves de siempre; los demás van con prefijo
+        prefijo = "" if tenant.nombre == tenants.DEFAULT_TENANT else f"{tenant.nombre}:"
+        with tenants.activar(tenant):
+            WARMUP_ESTADO[f"{prefijo}odoo"] = _ping_odoo()
+            WARMUP_ESTADO[f"{prefijo}ws22"] = _ping_ws22()
+            if WARMUP_FIELDS_GET:
+                for model in ("stock.picking", "res.partner"):
+                    ok, campos = odoo_rpc.fields_get(model)
+                    WARMUP_ESTADO[f"{prefijo}fields_get:{model}"] = len(campos) if ok else False
+    WARMUP_ESTADO["segundos"] = round(time.monotonic() - inicio, 2)
+    _warmup_listo.set()
+    logger.info("🔥 Warm-up completado: %s", WARMUP_ESTADO)
+
+
+def _loop_keepalive():
+    """Mantiene vivas las conexiones del pool durante periodos sin tráfico (KEEPALIVE_INTERVAL)."""
+    while True:
+        intervalo = settings.actual().keepalive_interval
+        # Con 0 el hilo queda en espera por si una recarga lo vuelve a activar
+        time.sleep(intervalo or 60)
+        if intervalo and time.monotonic() - _ultima_actividad >= intervalo:
+            for tenant in tenants.todos():
+                with tenants.activar(tenant):
+                    _ping_odoo()
+                    _ping_ws22()
+
+
+if not WARMUP_ENABLED:
+    _warmup_listo.set()
+
+_hilos_iniciados = False
+_hilos_lock = threading.Lock()
+
+
+def iniciar_hilos_de_fondo():
+    """
+    Arranca warm-up, keep-alive y precálculos una sola vez por proceso. Se llama desde el
+    entrypoint o con el primer request, nunca al importar: así un import (tests, scripts,
+    gunicorn --preload antes del fork) no abre conexiones ni deja hilos en el proceso padre.
+    """
+    global _hilos_iniciados
+    with _hilos_lock:
+        if _hilos_iniciados:
+            return
+        _hilos_iniciados = True
+
+    if WARMUP_ENABLED:
+        threading.Thread(target=calentar_conexiones, name="warmup", daemon=True).start()
+    threading.Thread(target=_loop_keepalive, name="keepalive", daemon=True).start()
+    if LABEL_CACHE_WARMUP > 0:
+        threading.Thread(
+            target=label_store.precalentar,
+            args=(LABEL_CACHE_WARMUP,),
+            name="label-cache-warmup",
+            daemon=True,
+        ).start()
+    if QUOTE_PRECOMPUTE_TOP > 0:
+        threading.Thread(
+            target=servientrega_quote.precalcular_top,
+            args=(QUOTE_PRECOMPUTE_TOP,),
+            name="quote-precompute",
+            daemon=True,
+        ).start()
+
+
+# 🔧 Recarga de configuración sin reiniciar workers
+settings.instalar_recarga()
+
+
+@app.before_request
+def _arrancar_hilos():
+    # Después del primer request solo cuesta leer un booleano
+    if not _hilos_iniciados:
+        iniciar_hilos_de_fondo()
+
+
+@app.before_request
+def _marcar_actividad():
+    global _ultima_actividad
+    _ultima_actividad = time.monotonic()
+
+
+@app.before_request
+def _activar_tenant():
+    """Tenant del request: segmento /webhook/<tenant> o header X-Tenant (por defecto 'default')."""
+    nombre = (request.view_args or {}).get("tenant") or request.headers.get(tenants.TENANT_HEADER)
+    tenant = tenants.obtener(nombre)
+    if not tenant:
+        return error_response("unknown_tenant", f"Tenant desconocido: {nombre}", 404)
+    g.tenant_tokens = tenants.entrar(tenant)
+
+
+@app.teardown_request
+def _liberar_tenant(exc=None):
+    tokens = g.pop("tenant_tokens", None)
+    if tokens:
+        tenants.salir(tokens)
+
+
+def _tenant():
+    return tenants.actual().nombre
+
 
 # --------------------------------------------------
 # ENDPOINTS BASE
 # --------------------------------------------------
 @app.get("/health")
 def health():
-    return jsonify({"status": "ok"}), 200
+    if not _warmup_listo.is_set():
+        return jsonify({"status": "warming"}), 503
+    return jsonify({"status": "ok", "warmup": WARMUP_ESTADO}), 200
 
 
 @app.get("/ping")
@@ -114,6 +294,12 @@ def ping():
     return "PONG", 200
 
 
+@app.get("/metrics")
+def metrics():
+    # Por proceso: con varios workers cada uno reporta sus propias ventanas y contadores
+    return jsonify({"pid": os.getpid(), "ws22": ws22_latency.metricas()}), 200
+
+
 # --------------------------------------------------
 # HELPERS
 # --------------------------------------------------
@@ -138,10 +324,98 @@ def safe_read_one(model, record_id, fields):
         return None
 
 
+def leer_partner(partner_id, fields):
+    """safe_read_one de res.partner pasando por la caché compartida (SHARED_CACHE_PARTNER_TTL > 0)."""
+    if shared_cache.TTL_PARTNER <= 0:
+        return safe_read_one("res.partner", partner_id, fields)
+    clave = shared_cache.clave(_tenant(), partner_id, ",".join(fields))
+    partner = shared_cache.get("res.partner", clave)
+    if partner is shared_cache.FALTA:
+        partner = safe_read_one("res.partner", partner_id, fields)
+        if partner:
+            shared_cache.set("res.partner", clave, partner, shared_cache.TTL_PARTNER)
+    return partner
+
+
+def _parse_write_date(value):
+    """write_date de Odoo ('YYYY-MM-DD HH:MM:SS[.ffffff]', UTC) → datetime, o None."""
+    if not value or not isinstance(value, str):
+        return None
+    for fmt in ("%Y-%m-%d %H:%M:%S.%f", "%Y-%m-%d %H:%M:%S"):
+        try:
+            return datetime.strptime(value, fmt)
+        except ValueError:
+            continue
+    return None
+
+
+def _utcnow():
+    """Hora UTC naive, comparable con los write_date de Odoo."""
+    return datetime.now(timezone.utc).replace(tzinfo=None)
+
+
+def _recordar_write_date(picking_id, write_date):
+    wd = _parse_write_date(write_date)
+    clave = (_tenant(), picking_id)
+    if wd and (clave not in _ULTIMO_WRITE_DATE or wd > _ULTIMO_WRITE_DATE[clave]):
+        _ULTIMO_WRITE_DATE[clave] = wd
+        # Ancho fijo: el orden de texto es el orden cronológico (set_max compara texto)
+        shared_cache.set_max(
+            "write_date",
+            shared_cache.clave(*clave),
+            wd.strftime("%Y-%m-%d %H:%M:%S.%f"),
+            max(settings.actual().webhook_fast_path_max_age * 2, 60),
+        )
+
+
+def _ultimo_write_date(picking_id):
+    """Último write_date visto por este worker o, vía la caché compartida, por cualquier otro."""
+    clave = (_tenant(), picking_id)
+    visto = _ULTIMO_WRITE_DATE.get(clave)
+    compartido = _parse_write_date(shared_cache.get("write_date", shared_cache.clave(*clave)))
+    if compartido and (not visto or compartido > visto):
+        _ULTIMO_WRITE_DATE[clave] = visto = compartido
+    return visto
+
+
+def picking_desde_payload(payload, picking_id, campos):
+    """
+    Arma el picking con los campos del body del webhook si están todos y son frescos.
+    Retorna None (→ leer de Odoo) si falta algún campo o el write_date está desactualizado.
+    """
+    faltantes = [c for c in campos if c not in payload]
+    if faltantes:
+        logger.info("⚡ Fast path descartado: faltan campos %s", faltantes)
+        return None
+
+    wd = _parse_write_date(payload.get("write_date"))
+    if not wd:
+        logger.info("⚡ Fast path descartado: write_date ausente o inválido")
+        return None
+
+    # Un body con el mismo write_date ya visto es un duplicado (reintento de Odoo): se lee de Odoo
+    visto = _ultimo_write_date(picking_id)
+    if visto and wd <= visto:
+        logger.info("⚡ Fast path descartado: write_date %s no es posterior al visto (%s)", wd, visto)
+        return None
+
+    edad = (_utcnow() - wd).total_seconds()
+    if edad > settings.actual().webhook_fast_path_max_age:
+        logger.info("⚡ Fast path descartado: body con %.0fs de antigüedad", edad)
+        return None
+
+    _recordar_write_date(picking_id, payload["write_date"])
+    picking = {c: payload[c] for c in campos}
+    picking["id"] = picking_id
+    logger.info("⚡ Fast path: picking %s tomado del body (sin read a Odoo)", picking_id)
+    return picking
+
+
 # --------------------------------------------------
 # VALIDACIÓN PICKING
 # --------------------------------------------------
 def validate_picking(picking, shipping_partner_id):
+    """Reglas de negocio del picking. Retorna la lista de errores (vacía si es válido)."""
     logger.info("Validando picking %s", picking.get("name"))
 
     errors = []
@@ -158,8 +432,114 @@ def validate_picking(picking, shipping_partner_id):
     if not picking.get("move_line_ids"):
         errors.append("El picking no tiene líneas de producto")
 
-    if errors:
-        raise ValueError(" | ".join(errors))
+    return errors
+
+
+# --------------------------------------------------
+# CONTENIDO DE LA GUÍA (Des_DiceContener)
+# --------------------------------------------------
+def derivar_contenido(moves):
+    """Nombres cortos de los productos (2 palabras sin el [código]), máx. 50 caracteres."""
+    nombres_cortos = []
+    for m in moves:
+        if m.get("product_id"):
+            full_name = m["product_id"][1]
+
+            # 1. Intentar tomar lo que hay después del ]
+            if "]" in full_name:
+                name_after_bracket = full_name.split("]", 1)[1].strip()
+            else:
+                name_after_bracket = full_name.strip()
+
+            # 2. Tomar las dos primeras palabras
+            words = name_after_bracket.split()
+            short_name = " ".join(words[:2])
+
+            if short_name:
+                nombres_cortos.append(short_name)
+
+    # Unir productos y recortar a 50 caracteres (Límite de la API)
+    contenido = ", ".join(nombres_cortos)[:50]
+
+    if not contenido:
+        contenido = "MERCANCIA GENERAL"
+
+    return contenido
+
+
+# --------------------------------------------------
+# HIDRATACIÓN DE PAQUETES REALES (stock.quant.package)
+# --------------------------------------------------
+def _a_cm(valor):
+    try:
+        v = float(valor or 0)
+    except (TypeError, ValueError):
+        return None
+    if v <= 0:
+        return None
+    return max(1, round(v * settings.actual().factor_a_cm, 1))
+
+
+def hidratar_paquetes(move_line_ids):
+    """
+    Paquetes reales del picking con peso y dimensiones.
+    Número de RPC constante (3 reads) sin importar cuántos paquetes tenga:
+    move lines → paquetes → tipos de empaque.
+    """
+    if not move_line_ids:
+        return []
+
+    ok, resp, _ = safe_read("stock.move.line", list(move_line_ids), ["result_package_id"])
+    if not ok:
+        logger.warning("⚠️ No se pudieron leer las move lines: %s", resp)
+        return []
+
+    package_ids = []
+    for ml in resp.get("result", []):
+        pkg = ml.get("result_package_id")
+        if pkg and pkg[0] not in package_ids:
+            package_ids.append(pkg[0])
+    if not package_ids:
+        return []
+
+    # package_type_id (Odoo >= 16) o packaging_id (versiones anteriores): safe_read descarta el que no exista
+    ok, resp, usados = safe_read(
+        "stock.quant.package",
+        package_ids,
+        ["name", "shipping_weight", "weight", "package_type_id", "packaging_id"],
+    )
+    if not ok:
+        logger.warning("⚠️ No se pudieron leer los paquetes: %s", resp)
+        return []
+    paquetes = resp.get("result", [])
+
+    campo_tipo = "package_type_id" if "package_type_id" in usados else "packaging_id"
+    modelo_tipo = "stock.package.type" if campo_tipo == "package_type_id" else "product.packaging"
+    tipo_ids = sorted({p[campo_tipo][0] for p in paquetes if p.get(campo_tipo)})
+
+    tipos = {}
+    if tipo_ids:
+        ok, resp, _ = safe_read(
+            modelo_tipo, tipo_ids, ["height", "width", "packaging_length", "base_weight"]
+        )
+        if ok:
+            tipos = {t["id"]: t for t in resp.get("result", [])}
+
+    hidratados = []
+    for p in paquetes:
+        tipo = tipos.get(p[campo_tipo][0], {}) if p.get(campo_tipo) else {}
+        peso = float(p.get("shipping_weight") or 0) or float(p.get("weight") or 0)
+        hidratados.append(
+            {
+                "id": p["id"],
+                "name": p.get("name") or str(p["id"]),
+                "peso": round(peso, 2) if peso > 0 else None,
+                "alto": _a_cm(tipo.get("height")),
+                "ancho": _a_cm(tipo.get("width")),
+                "largo": _a_cm(tipo.get("packaging_length")),
+            }
+        )
+    return hidratados
 
 
 # --------------------------------------------------
@@ -186,23 +566,35 @@ def construir_payload_ws22(
 
     num_piezas = len(paquetes_info) if paquetes_info else 1
 
-    # Si hay paquetes, intentamos distribuir el peso o usar el peso individual
+    # 🗺️ Códigos DANE del destino (cacheados por partner; validar_envio ya rechazó los que no resuelven)
+    codigos = dane.resolver_partner(partner)
+    if not codigos:
+        raise ValueError(f"Sin código DANE para la ciudad '{partner.get('city')}'")
+    logger.info(
+        "🗺️ Ciudad '%s' → %s (%s)", partner.get("city"), codigos["ciudad"], codigos["metodo"]
+    )
+
+    # Si hay paquetes, usamos el peso individual y repartimos el resto entre los que no lo tienen
     lista_empaques = []
     if paquetes_info:
+        pesos_reales = [pkg["peso"] for pkg in paquetes_info if pkg.get("peso")]
+        sin_peso = num_piezas - len(pesos_reales)
+        peso_repartido = (
+            round(max(peso_total - sum(pesos_reales), 0) / sin_peso, 2) if sin_peso else 0
+        )
         for idx, pkg in enumerate(paquetes_info):
-            # Dividimos el peso total entre las piezas para que sume exacto.
-            peso_pieza = round(peso_total / num_piezas, 2)
-            if peso_pieza < 0.1:
-                peso_pieza = 0.1  # Mínimo por pieza
+            peso_pieza = pkg.get("peso") or peso_repartido
+            if peso_pieza < PESO_MIN_PIEZA_KG:
+                peso_pieza = PESO_MIN_PIEZA_KG  # Mínimo por pieza (la validación no lo rechaza)
 
             # Usamos el nombre real del paquete de Odoo (ej. PACK001)
             nombre_caja = pkg.get("name", f"{idx+1}")
 
             lista_empaques.append(
                 {
-                    "alto": 5,
-                    "ancho": 5,
-                    "largo": 5,
+                    "alto": pkg.get("alto") or DIMENSION_DEFAULT_CM,
+                    "ancho": pkg.get("ancho") or DIMENSION_DEFAULT_CM,
+                    "largo": pkg.get("largo") or DIMENSION_DEFAULT_CM,
                     "peso": peso_pieza,
                     "dice_contener": contenido,
                     "numero_caja": nombre_caja,
@@ -245,6 +637,8 @@ def construir_payload_ws22(
                     "nombre": partner["name"],
                     "direccion": partner["street"],
                     "ciudad": partner["city"],
+                    "codigo_ciudad": codigos["ciudad"],
+                    "codigo_departamento": codigos["departamento"],
                     "pais": "CO",
                     "telefono": partner.get("phone") or partner.get("mobile") or "",
                     "identificacion": partner.get("vat") or "0000000000",
@@ -260,12 +654,8 @@ def construir_payload_ws22(
 # --------------------------------------------------
 # WS22 SEND SOAP (QA) - CargueMasivoExterno
 # --------------------------------------------------
-def enviar_ws22_test(payload_ws22: dict) -> dict:
-    logger.info("🚀 Enviando WS22 SOAP")
-    logger.info("🌐 URL usada: %s", SERVI_URL)
-
-    envio = payload_ws22["envios"][0]
-
+def construir_envelope_ws22(envio: dict, ws22) -> str:
+    """Envelope SOAP de CargueMasivoExterno para un envío del payload WS22."""
     # --- GENERACIÓN DINÁMICA DE NODOS DE EMPAQUE (BULTOS) ---
     empaques_xml = ""
     for idx, pkg in enumerate(envio["empaques"]):
@@ -295,9 +685,9 @@ def enviar_ws22_test(payload_ws22: dict) -> dict:
     soap_xml = f"""<soap:Envelope xmlns:soap="http://www.w3.org/2003/05/soap-envelope" xmlns:tem="http://tempuri.org/">
    <soap:Header>
       <tem:AuthHeader>
-         <tem:login>{os.getenv("SERVI_LOGIN")}</tem:login>
-         <tem:pwd>{os.getenv("SERVI_PWD_ENC")}</tem:pwd>
-         <tem:Id_CodFacturacion>{os.getenv("SERVI_COD_FACT")}</tem:Id_CodFacturacion>
+         <tem:login>{ws22.login}</tem:login>
+         <tem:pwd>{ws22.pwd_enc}</tem:pwd>
+         <tem:Id_CodFacturacion>{ws22.cod_fact}</tem:Id_CodFacturacion>
          <tem:Nombre_Cargue>Odoo Servientrega</tem:Nombre_Cargue>
       </tem:AuthHeader>
    </soap:Header>
@@ -312,7 +702,7 @@ def enviar_ws22_test(payload_ws22: dict) -> dict:
                      <tem:Num_SobreCajaPorte>0</tem:Num_SobreCajaPorte>
                      <tem:Fec_TiempoEntrega>1</tem:Fec_TiempoEntrega>
                      <tem:Des_TipoTrayecto>1</tem:Des_TipoTrayecto>
-                     <tem:Ide_CodFacturacion>{os.getenv("SERVI_COD_FACT")}</tem:Ide_CodFacturacion>
+                     <tem:Ide_CodFacturacion>{ws22.cod_fact}</tem:Ide_CodFacturacion>
                      <tem:Num_Piezas>{envio["numeroPiezas"]}</tem:Num_Piezas>
                      <tem:Des_FormaPago>2</tem:Des_FormaPago>
                      <tem:Des_MedioTransporte>1</tem:Des_MedioTransporte>
@@ -353,8 +743,8 @@ def enviar_ws22_test(payload_ws22: dict) -> dict:
                      <tem:Num_Descuento>0</tem:Num_Descuento>
                      <tem:Num_ValorDeclaradoSobreTotal>0</tem:Num_ValorDeclaradoSobreTotal>
                      <tem:Des_Telefono>{envio["destinatario"]["telefono"]}</tem:Des_Telefono>
-                     <tem:Des_Ciudad>11001000</tem:Des_Ciudad>
-                     <tem:Des_DepartamentoDestino>11001000</tem:Des_DepartamentoDestino>
+                     <tem:Des_Ciudad>{envio["destinatario"]["codigo_ciudad"]}</tem:Des_Ciudad>
+                     <tem:Des_DepartamentoDestino>{envio["destinatario"]["codigo_departamento"]}</tem:Des_DepartamentoDestino>
                      <tem:Des_Direccion>{envio["destinatario"]["direccion"]}</tem:Des_Direccion>
                      <tem:Nom_Contacto>{envio["destinatario"]["nombre"]}</tem:Nom_Contacto>
                      <tem:Des_DiceContener>{envio["contenido"]}</tem:Des_DiceContener>
@@ -385,28 +775,47 @@ def enviar_ws22_test(payload_ws22: dict) -> dict:
    </soap:Body>
 </soap:Envelope>"""
 
+    return soap_xml
+
+
+def enviar_ws22_test(payload_ws22: dict, picking_id: int = None) -> dict:
+    ws22 = servientrega_ws22.cliente()
+    logger.info("🚀 Enviando WS22 SOAP")
+    logger.info("🌐 URL usada: %s", ws22.url)
+
+    envio = payload_ws22["envios"][0]
+    soap_xml = construir_envelope_ws22(envio, ws22)
+
     headers = {
         "Content-Type": "text/xml; charset=utf-8",
     }
 
-    logger.info(
-        "📤 SOAP XML ENVIADO (Con %s bultos):\n%s", envio["numeroPiezas"], soap_xml
-    )
+    # Cuerpos completos solo en DEBUG: la auditoría queda en soap_archive
+    logger.info("📤 SOAP XML ENVIADO (Con %s bultos)", envio["numeroPiezas"])
+    logger.debug("📤 SOAP XML:\n%s", soap_xml)
 
-    resp = requests.post(
-        SERVI_URL,
-        data=soap_xml.encode("utf-8"),
-        headers=headers,
-        timeout=SERVI_TIMEOUT,
-    )
+    # Solo se mide la latencia: crear guía no es idempotente (timeout fijo, sin hedge)
+    try:
+        resp = ws22_latency.ejecutar(
+            "CargueMasivoExterno",
+            lambda timeout: ws22.session.post(
+                ws22.url, data=soap_xml.encode("utf-8"), headers=headers, timeout=timeout
+            ),
+            ws22.timeout,
+        )
+    except requests.RequestException:
+        # Sin respuesta: el request igual queda archivado (¿llegó a crear la guía?)
+        soap_archive.registrar("CargueMasivoExterno", soap_xml, None, picking_id=picking_id)
+        raise
 
     logger.info("📡 WS22 HTTP %s", resp.status_code)
-    logger.info("📥 WS22 RESPONSE RAW:\n%s", resp.text)
+    logger.debug("📥 WS22 RESPONSE RAW:\n%s", resp.text)
 
+    result = {"raw": resp.text, "request": soap_xml, "status": resp.status_code}
     if resp.status_code != 200:
-        return {"ok": False, "raw": resp.text}
+        return {"ok": False, **result}
 
-    return {"ok": True, "raw": resp.text}
+    return {"ok": True, **result}
 
 
 # --------------------------------------------------
@@ -415,12 +824,19 @@ def enviar_ws22_test(payload_ws22: dict) -> dict:
 def generar_pdf_guia(num_guia: str) -> dict:
     logger.info("📄 Generando PDF para guía %s", num_guia)
 
+    # El PDF de una guía no cambia: si ya está en caché no se llama a Servientrega
+    cached = label_store.leer(num_guia)
+    if cached:
+        logger.info("🗄️ PDF de guía %s servido desde caché", num_guia)
+        return {"ok": True, "pdf_base64": base64.b64encode(cached).decode("ascii")}
+
+    ws22 = servientrega_ws22.cliente()
     soap_xml = f"""<soap:Envelope xmlns:soap="http://www.w3.org/2003/05/soap-envelope" xmlns:tem="http://tempuri.org/">
    <soap:Header>
       <tem:AuthHeader>
-         <tem:login>{os.getenv("SERVI_LOGIN")}</tem:login>
-         <tem:pwd>{os.getenv("SERVI_PWD_ENC")}</tem:pwd>
-         <tem:Id_CodFacturacion>{os.getenv("SERVI_COD_FACT")}</tem:Id_CodFacturacion>
+         <tem:login>{ws22.login}</tem:login>
+         <tem:pwd>{ws22.pwd_enc}</tem:pwd>
+         <tem:Id_CodFacturacion>{ws22.cod_fact}</tem:Id_CodFacturacion>
          <tem:Nombre_Cargue>Odoo Servientrega</tem:Nombre_Cargue>
       </tem:AuthHeader>
    </soap:Header>
@@ -428,7 +844,7 @@ def generar_pdf_guia(num_guia: str) -> dict:
       <tem:GenerarGuiaSticker>
          <tem:num_Guia>{num_guia}</tem:num_Guia>
          <tem:num_GuiaFinal>{num_guia}</tem:num_GuiaFinal>
-         <tem:ide_CodFacturacion>{os.getenv("SERVI_COD_FACT")}</tem:ide_CodFacturacion>
+         <tem:ide_CodFacturacion>{ws22.cod_fact}</tem:ide_CodFacturacion>
          <tem:sFormatoImpresionGuia>1</tem:sFormatoImpresionGuia>
          <tem:interno>false</tem:interno>
       </tem:GenerarGuiaSticker>
@@ -441,14 +857,24 @@ def generar_pdf_guia(num_guia: str) -> dict:
 
     logger.info("📤 Solicitando PDF de guía...")
 
-    resp = requests.post(
-        SERVI_URL,
-        data=soap_xml.encode("utf-8"),
-        headers=headers,
-        timeout=SERVI_TIMEOUT,
-    )
+    # Lectura idempotente: timeout adaptativo y segundo intento si el primero pasa el p95
+    try:
+        resp = ws22_latency.ejecutar(
+            "GenerarGuiaSticker",
+            lambda timeout: ws22.session.post(
+                ws22.url, data=soap_xml.encode("utf-8"), headers=headers, timeout=timeout
+            ),
+            ws22.timeout,
+            aceptar=lambda r: r.status_code == 200,
+        )
+    except requests.RequestException:
+        soap_archive.registrar("GenerarGuiaSticker", soap_xml, None, guia=num_guia)
+        raise
 
     logger.info("📡 PDF HTTP %s", resp.status_code)
+    soap_archive.registrar(
+        "GenerarGuiaSticker", soap_xml, resp.text, guia=num_guia, http_status=resp.status_code
+    )
 
     if resp.status_code != 200:
         logger.error("❌ Error al generar PDF: HTTP %s", resp.status_code)
@@ -462,6 +888,10 @@ def generar_pdf_guia(num_guia: str) -> dict:
 
         if pdf_b64:
             logger.info("✅ PDF generado correctamente")
+            try:
+                label_store.guardar(num_guia, base64.b64decode(pdf_b64))
+            except Exception as e:
+                logger.warning("⚠️ No se pudo guardar el PDF en caché: %s", str(e))
             return {"ok": True, "pdf_base64": pdf_b64}
         else:
             logger.error("❌ No se encontró el PDF en la respuesta")
@@ -508,52 +938,317 @@ def parsear_respuesta_ws22_xml(xml_text: str) -> dict:
 # --------------------------------------------------
 # PERSISTIR RESULTADO EN ODOO
 # --------------------------------------------------
+def obtener_pdf_guia(num_guia: str):
+    """
+    generar_pdf_guia() sin excepciones, para cuando la guía ya existe en Servientrega:
+    un timeout del sticker nunca debe impedir escribir la guía en Odoo.
+    Retorna (pdf_base64 | None, error | None).
+    """
+    try:
+        pdf_result = generar_pdf_guia(num_guia)
+    except Exception as e:
+        logger.error("❌ Sticker de guía %s no disponible: %s", num_guia, str(e))
+        return None, str(e)
+    if pdf_result.get("ok"):
+        return pdf_result["pdf_base64"], None
+    return None, pdf_result.get("error") or "sticker_failed"
+
+
 def persistir_resultado_ws22(
-    picking_id: int, num_guia: str, url_rastreo: str, pdf_base64: str = None
-):
+    picking_id: int,
+    num_guia: str,
+    url_rastreo: str,
+    pdf_base64: str = None,
+    estado_etiqueta: str = None,
+) -> bool:
     logger.info("💾 Persistiendo guía %s en picking ID=%s", num_guia, picking_id)
 
-    ok, resp, _ = safe_write(
-        "stock.picking",
-        [picking_id],
-        {
-            "carrier_tracking_ref": num_guia,
-            "carrier_tracking_url": url_rastreo,
-            "x_studio_servientrega": True,
-            "x_studio_tcc": False,
-        },
-    )
+    vals = {
+        "carrier_tracking_ref": num_guia,
+        "carrier_tracking_url": url_rastreo,
+        "x_studio_servientrega": True,
+        "x_studio_tcc": False,
+    }
+    if estado_etiqueta:
+        vals[tenants.actual().campos["estado_etiqueta"]] = estado_etiqueta
+
+    ok, resp, _ = safe_write("stock.picking", [picking_id], vals)
 
     if ok:
         logger.info("✅ Guía persistida correctamente")
+        # Nuestro write cambió el write_date en Odoo (≤ ahora): cualquier body anterior
+        # (incluido el que disparó este envío, si Odoo lo reintenta) ya no entra por el fast path
+        _recordar_write_date(picking_id, _utcnow().strftime("%Y-%m-%d %H:%M:%S.%f"))
         message_post(
             "stock.picking", picking_id, f"✅ Guía Servientrega generada: {num_guia}"
         )
 
         if pdf_base64:
-            logger.info("📎 Adjuntando PDF...")
-            create(
-                "ir.attachment",
-                {
-                    "name": f"Guia_{num_guia}.pdf",
-                    "type": "binary",
-                    "datas": pdf_base64,
-                    "res_model": "stock.picking",
-                    "res_id": picking_id,
-                    "mimetype": "application/pdf",
-                },
-            )
-            logger.info("✅ PDF adjuntado correctamente")
+            adjuntar_pdf_guia(picking_id, num_guia, pdf_base64)
 
     else:
         logger.error("❌ Error al persistir guía: %s", resp)
 
+    return ok
+
+
+def adjuntar_pdf_guia(picking_id: int, num_guia: str, pdf_base64: str) -> bool:
+    logger.info("📎 Adjuntando PDF...")
+    ok, resp = create(
+        "ir.attachment",
+        {
+            "name": f"Guia_{num_guia}.pdf",
+            "type": "binary",
+            "datas": pdf_base64,
+            "res_model": "stock.picking",
+            "res_id": picking_id,
+            "mimetype": "application/pdf",
+        },
+    )
+    if ok:
+        logger.info("✅ PDF adjuntado correctamente")
+    else:
+        logger.error("❌ Error al adjuntar PDF: %s", resp)
+    return ok
+
+
+# --------------------------------------------------
+# STICKER DIFERIDO (SEGUNDO PLANO CON REINTENTOS)
+# --------------------------------------------------
+def _guardar_estado_etiqueta(num_guia: str, **cambios):
+    clave = (_tenant(), num_guia)
+    with _estado_etiquetas_lock:
+        estado = {**ESTADO_ETIQUETAS.get(clave, {}), **cambios, "actualizado": time.time()}
+        ESTADO_ETIQUETAS[clave] = estado
+        ESTADO_ETIQUETAS.move_to_end(clave)
+        while len(ESTADO_ETIQUETAS) > LABEL_STATUS_MAX:
+            ESTADO_ETIQUETAS.popitem(last=False)
+    shared_cache.set("etiqueta", shared_cache.clave(*clave), estado, shared_cache.TTL_ETIQUETA)
+    return estado
+
+
+def _estado_etiqueta(num_guia: str):
+    """Estado del sticker visto por este worker o, vía la caché compartida, por cualquier otro."""
+    clave = (_tenant(), num_guia)
+    with _estado_etiquetas_lock:
+        estado = ESTADO_ETIQUETAS.get(clave)
+    if estado is None:
+        compartido = shared_cache.get("etiqueta", shared_cache.clave(*clave))
+        estado = None if compartido is shared_cache.FALTA else compartido
+    return estado
+
+
+def _marcar_estado_etiqueta(picking_id: int, num_guia: str, estado: str, error=None):
+    _guardar_estado_etiqueta(num_guia, picking_id=picking_id, estado=estado, error=error)
+    safe_write("stock.picking", [picking_id], {tenants.actual().campos["estado_etiqueta"]: estado})
+
+
+def _tarea_etiqueta(picking_id: int, num_guia: str):
+    cfg = settings.actual()
+    ultimo_error = None
+    for intento in range(1, cfg.label_async_retries + 1):
+        _guardar_estado_etiqueta(num_guia, intentos=intento)
+        try:
+            pdf_result = generar_pdf_guia(num_guia)
+            if pdf_result.get("ok") and adjuntar_pdf_guia(
+                picking_id, num_guia, pdf_result["pdf_base64"]
+            ):
+                _marcar_estado_etiqueta(picking_id, num_guia, "adjunta")
+                dead_letter.resolver_picking(picking_id, _tenant(), dead_letter.ETAPA_STICKER)
+                return
+            ultimo_error = pdf_result.get("error") or "attachment_failed"
+        except Exception as e:
+            ultimo_error = str(e)
+
+        logger.warning(
+            "⚠️ Sticker guía %s: intento %s/%s fallido (%s)",
+            num_guia,
+            intento,
+            cfg.label_async_retries,
+            ultimo_error,
+        )
+        if intento < cfg.label_async_retries:
+            time.sleep(cfg.label_async_backoff * (2 ** (intento - 1)))
+
+    logger.error("❌ Sticker guía %s no se pudo adjuntar: %s", num_guia, ultimo_error)
+    _marcar_estado_etiqueta(picking_id, num_guia, "error", ultimo_error)
+    dead_letter.registrar(
+        picking_id, dead_letter.ETAPA_STICKER, ultimo_error, {"guia": num_guia}, tenant=_tenant()
+    )
+    message_post(
+        "stock.picking",
+        picking_id,
+        f"⚠️ No se pudo adjuntar el sticker PDF de la guía {num_guia}: {ultimo_error}",
+    )
+
+
+def _executor_etiquetas():
+    global _label_executor
+    with _label_executor_lock:
+        if _label_executor is None:
+            _label_executor = ThreadPoolExecutor(
+                max_workers=settings.actual().label_async_workers, thread_name_prefix="label"
+            )
+    return _label_executor
+
+
+def _redimensionar_executor_etiquetas(anterior, nuevo) -> None:
+    """Recarga de LABEL_ASYNC_WORKERS: los stickers nuevos van a un pool del tamaño nuevo."""
+    global _label_executor
+    if anterior.label_async_workers == nuevo.label_async_workers:
+        return
+    with _label_executor_lock:
+        viejo, _label_executor = _label_executor, None
+    if viejo is not None:
+        # Sin cancelar: lo ya encolado en el pool anterior termina en sus propios hilos
+        viejo.shutdown(wait=False)
+        logger.info("🔧 Pool de stickers: %s hilos", nuevo.label_async_workers)
+
+
+settings.suscribir(_redimensionar_executor_etiquetas)
+
+
+def encolar_etiqueta(picking_id: int, num_guia: str):
+    _guardar_estado_etiqueta(
+        num_guia, picking_id=picking_id, estado="pendiente", intentos=0, error=None
+    )
+    # La cola vive en memoria: la dead letter se resuelve al adjuntar y, si el proceso se
+    # reinicia antes, el sticker se recupera con el reproceso de la etapa sticker
+    dead_letter.registrar(
+        picking_id,
+        dead_letter.ETAPA_STICKER,
+        "Sticker diferido en cola",
+        {"guia": num_guia},
+        error_class=dead_letter.CLASE_STICKER_EN_COLA,
+        tenant=_tenant(),
+    )
+    # El hilo hereda el tenant (clientes Odoo/WS22) del request que encoló
+    _executor_etiquetas().submit(contextvars.copy_context().run, _tarea_etiqueta, picking_id, num_guia)
+    logger.info("⏩ Sticker de guía %s encolado", num_guia)
+
+
+# --------------------------------------------------
+# STICKERS (REIMPRESIÓN DESDE CACHÉ LOCAL)
+# --------------------------------------------------
+def _labels_autorizado():
+    if not LABELS_TOKEN:
+        return True
+    return hmac.compare_digest(request.headers.get(LABELS_TOKEN_HEADER, ""), LABELS_TOKEN)
+
+
+@app.get("/labels/<guia>")
+def get_label(guia):
+    if not _labels_autorizado():
+        return error_response("unauthorized", f"Falta o no coincide {LABELS_TOKEN_HEADER}", 401)
+    if not label_store.guia_valida(guia):
+        return error_response("invalid_guia", f"Número de guía inválido: {guia}", 400)
+
+    abierto = label_store.abrir(guia)
+    if not abierto:
+        logger.info("🗄️ Guía %s no está en caché. Solicitando a Servientrega...", guia)
+        pdf_result = generar_pdf_guia(guia)
+        if not pdf_result.get("ok"):
+            return jsonify({"ok": False, "detail": pdf_result}), 502
+        abierto = label_store.abrir(guia)
+        if not abierto:
+            # Desalojado de inmediato (caché llena): se sirve el PDF que ya está en memoria
+            return send_file(
+                io.BytesIO(base64.b64decode(pdf_result["pdf_base64"])),
+                mimetype="application/pdf",
+                download_name=f"Guia_{guia}.pdf",
+            )
+
+    # Se envía el descriptor ya abierto: un desalojo concurrente no rompe la descarga
+    fh, sha = abierto
+    return send_file(
+        fh,
+        mimetype="application/pdf",
+        download_name=f"Guia_{guia}.pdf",
+        conditional=True,
+        etag=sha,
+    )
+
+
+@app.get("/labels/<guia>/status")
+def get_label_status(guia):
+    if not _labels_autorizado():
+        return error_response("unauthorized", f"Falta o no coincide {LABELS_TOKEN_HEADER}", 401)
+    if not label_store.guia_valida(guia):
+        return error_response("invalid_guia", f"Número de guía inválido: {guia}", 400)
+    estado = _estado_etiqueta(guia)
+    if estado:
+        return jsonify({"guia": guia, **estado}), 200
+    if label_store.ruta(guia):
+        return jsonify({"guia": guia, "estado": "adjunta"}), 200
+
+    # Encolada en otro worker sin caché compartida: el estado también queda en el picking
+    campo = tenants.actual().campos["estado_etiqueta"]
+    ok, resp = odoo_rpc.search_read(
+        "stock.picking", [["carrier_tracking_ref", "=", guia]], ["id", campo], limit=1
+    )
+    pickings = resp.get("result") if ok else None
+    if pickings and pickings[0].get(campo):
+        return jsonify({"guia": guia, "picking_id": pickings[0]["id"], "estado": pickings[0][campo]}), 200
+    return error_response("label_status_unknown", f"Sin estado para la guía {guia}", 404)
+
+
+# --------------------------------------------------
+# COTIZACIÓN (LIQUIDACIÓN CACHEADA)
+# --------------------------------------------------
+@app.get("/quote")
+def quote():
+    args = request.args
+    destino = args.get("destino")
+    peso = args.get("peso")
+    valor = args.get("valor", servientrega_quote.QUOTE_VALOR_MIN)
+
+    if args.get("picking_id"):
+        # Cotizar un picking aún no validado: destino y peso salen de Odoo
+        picking = safe_read_one(
+            "stock.picking", args["picking_id"], ["partner_id", "weight", "shipping_weight"]
+        )
+        if not picking or not picking.get("partner_id"):
+            return error_response("picking_not_found", f"picking_id={args['picking_id']}", 404)
+        partner = leer_partner(picking["partner_id"][0], ["city", "state_id"])
+        codigos = dane.resolver_partner(partner) if partner else None
+        if not codigos:
+            return error_response("destino_unresolved", "No se pudo resolver la ciudad del partner", 400)
+        destino = codigos["ciudad"]
+        peso = peso or picking.get("weight") or picking.get("shipping_weight") or 1
+    elif destino and not destino.isdigit():
+        codigos = dane.resolver(destino, args.get("departamento"))
+        if not codigos:
+            return error_response("destino_unresolved", f"Ciudad desconocida: {destino}", 400)
+        destino = codigos["ciudad"]
+    elif destino and not dane.codigo_ws22(destino):
+        return error_response("destino_unresolved", f"Código DANE desconocido: {destino}", 400)
+
+    if not destino:
+        return error_response("missing_destino", "Indique 'destino' o 'picking_id'", 400)
+    if args.get("origen") and not dane.codigo_ws22(args["origen"]):
+        return error_response("origen_unresolved", f"Código DANE desconocido: {args['origen']}", 400)
+    try:
+        peso = float(peso or 1)
+        valor = float(valor)
+    except (TypeError, ValueError):
+        return error_response("invalid_params", "'peso' y 'valor' deben ser numéricos", 400)
+
+    ok, data = servientrega_quote.cotizar(destino, peso, valor, args.get("origen"))
+    if not ok:
+        return jsonify({"ok": False, "detail": data}), 502
+    return jsonify({"ok": True, **data}), 200
+
 
 # --------------------------------------------------
 # WEBHOOK
 # --------------------------------------------------
 @app.post("/webhook")
-def webhook():
+@app.post("/webhook/<tenant>")
+@profiling.perfilar
+def webhook(tenant=None):
+    if webhook_capture.activo():
+        # Solo encola el body crudo; sanitizado y escritura van en el hilo de captura
+        webhook_capture.capturar(request.path, request.get_data(cache=True), dict(request.headers))
     payload = request.get_json(silent=True) or {}
     logger.info("Payload recibido: %s", payload)
 
@@ -588,6 +1283,116 @@ def webhook():
             400,
         )
 
+    return procesar_picking(picking_id, payload)
+
+
+def respuesta_guia_existente(picking_id: int, guia: str):
+    """200 con la guía ya creada, o 409 si otro worker la está creando en este momento."""
+    if guia == GUIA_EN_CURSO:
+        logger.info("⏳ Otro worker está creando la guía del picking %s. Saltando duplicado.", picking_id)
+        return error_response(
+            "guia_en_curso", f"La guía del picking {picking_id} se está generando", 409
+        )
+    url = f"https://www.servientrega.com/rastreo/{guia}"
+    logger.info("⚠️ El picking %s ya tiene guía: %s. Saltando duplicado.", picking_id, guia)
+    return (
+        jsonify(
+            {
+                "ok": True,
+                "guia": guia,
+                "url": url,
+                "message": "Guía ya existente en Odoo. No se generó una nueva.",
+            }
+        ),
+        200,
+    )
+
+
+def _respuesta_persistencia_fallida(picking_id: int, guia: str, url: str, label_async: bool):
+    dead_letter_id = dead_letter.registrar(
+        picking_id,
+        dead_letter.ETAPA_PERSISTENCIA,
+        "No se pudo escribir la guía en Odoo",
+        {"guia": guia, "url": url},
+        tenant=_tenant(),
+    )
+    cuerpo = {
+        "ok": False,
+        "guia": guia,
+        "url": url,
+        "dead_letter_id": dead_letter_id,
+        "detail": {"error": "odoo_persist", "mensaje": "No se pudo escribir la guía en Odoo"},
+    }
+    if label_async:
+        # La guía existe en Servientrega pero no en Odoo: el sticker no se encola
+        _guardar_estado_etiqueta(guia, picking_id=picking_id, estado="error", intentos=0, error="odoo_persist")
+        cuerpo["label_status"] = "error"
+    return jsonify(cuerpo), 502
+
+
+def finalizar_guia(picking_id: int, guia: str):
+    """
+    Escribe en Odoo una guía ya creada en Servientrega, con su sticker en línea o diferido.
+    La clave de idempotencia compartida ("guia") se escribe solo cuando el resultado quedó
+    en Odoo o en dead letters: un reintento de Odoo nunca crea una segunda guía y la que
+    no se pudo escribir siempre tiene con qué recuperarse.
+    """
+    tenant = tenants.actual()
+    cfg = settings.actual()
+    url = f"https://www.servientrega.com/rastreo/{guia}"
+
+    if cfg.label_async:
+        # Responder en cuanto la guía queda persistida; el PDF llega después
+        pdf_base64, error_pdf, estado = None, None, "pendiente"
+    else:
+        # Generar PDF de la guía (si falla, la guía igual se escribe en Odoo)
+        pdf_base64, error_pdf = obtener_pdf_guia(guia)
+        estado = "error" if error_pdf else None
+
+    persistida = persistir_resultado_ws22(picking_id, guia, url, pdf_base64, estado_etiqueta=estado)
+    respuesta = None if persistida else _respuesta_persistencia_fallida(picking_id, guia, url, cfg.label_async)
+    shared_cache.set(
+        "guia", shared_cache.clave(tenant.nombre, picking_id), guia, shared_cache.TTL_IDEMPOTENCIA
+    )
+    if respuesta:
+        return respuesta
+
+    dead_letter.resolver_picking(picking_id, tenant.nombre)
+    if cfg.label_async:
+        encolar_etiqueta(picking_id, guia)
+        return jsonify({"ok": True, "guia": guia, "url": url, "label_status": "pendiente"}), 200
+    if error_pdf:
+        # Guía en Odoo sin PDF: el sticker queda para reproceso (etapa sticker)
+        dead_letter_id = dead_letter.registrar(
+            picking_id, dead_letter.ETAPA_STICKER, error_pdf, {"guia": guia}, tenant=tenant.nombre
+        )
+        _guardar_estado_etiqueta(guia, picking_id=picking_id, estado="error", intentos=1, error=error_pdf)
+        return (
+            jsonify({"ok": True, "guia": guia, "url": url, "label_status": "error", "dead_letter_id": dead_letter_id}),
+            200,
+        )
+    return jsonify({"ok": True, "guia": guia, "url": url}), 200
+
+
+def completar_guia_pendiente(picking_id: int, guia: str):
+    """Reintento de Odoo para una guía que existe en Servientrega pero no se pudo escribir."""
+    actual = safe_read_one("stock.picking", picking_id, ["carrier_tracking_ref"])
+    if actual and actual.get("carrier_tracking_ref"):
+        # Otro worker la escribió entre la lectura del picking y la consulta a la caché
+        return respuesta_guia_existente(picking_id, actual["carrier_tracking_ref"])
+    logger.info("♻️ Guía %s del picking %s no está en Odoo: se reintenta escribirla", guia, picking_id)
+    return finalizar_guia(picking_id, guia)
+
+
+def procesar_picking(picking_id: int, payload: dict):
+    """
+    Flujo completo Odoo → WS22 → Odoo para un picking, con los clientes del tenant activo.
+    Retorna (response, http_code).
+    """
+    tenant = tenants.actual()
+    CAMPOS = tenant.campos
+    # Una sola lectura de la configuración por request: vista consistente aunque haya recarga
+    cfg = settings.actual()
     # 📋 Determinar campos a leer (Evita error si x_studio_servientrega no existe en Prod)
     fields_to_read = [
         "id",
@@ -600,13 +1405,48 @@ def webhook():
         "weight",
         "move_ids",
         "carrier_id",
+        "write_date",
         CAMPOS["historial_paquetes"],
         CAMPOS["contador_paquetes"],
     ]
-    if not USE_PRODUCTION or CAMPOS["check_servientrega"]:
+    if not tenant.odoo_produccion or CAMPOS["check_servientrega"]:
         fields_to_read.append(CAMPOS["check_servientrega"])
 
-    picking = safe_read_one("stock.picking", picking_id, fields_to_read)
+    picking = None
+    if cfg.webhook_fast_path:
+        # Campos imprescindibles en el body; los opcionales (Studio, historial) se toleran ausentes
+        campos_fast = [
+            "name",
+            "state",
+            "carrier_tracking_ref",
+            "move_line_ids",
+            "partner_id",
+            "weight",
+            "move_ids",
+            "carrier_id",
+            CAMPOS["contador_paquetes"],
+        ]
+        picking = picking_desde_payload(payload, picking_id, campos_fast)
+        if picking:
+            for campo in fields_to_read:
+                if campo in payload and campo not in picking:
+                    picking[campo] = payload[campo]
+            # El body nunca decide la idempotencia ni la aplicabilidad: la guía (y el check
+            # de QA) se releen de Odoo justo antes de llamar a CargueMasivoExterno
+            campos_frescos = ["carrier_tracking_ref", "write_date"]
+            if CAMPOS["check_servientrega"] in fields_to_read:
+                campos_frescos.append(CAMPOS["check_servientrega"])
+            frescos = safe_read_one("stock.picking", picking_id, campos_frescos)
+            if frescos:
+                picking.update({c: frescos.get(c) for c in campos_frescos})
+                _recordar_write_date(picking_id, frescos.get("write_date"))
+            else:
+                picking = None
+
+    if not picking:
+        picking = safe_read_one("stock.picking", picking_id, fields_to_read)
+        if picking:
+            _recordar_write_date(picking_id, picking.get("write_date"))
 
     if not picking:
         return error_response(
@@ -617,23 +1457,17 @@ def webhook():
 
     # 🛡️ VALIDACIÓN DE IDEMPOTENCIA (Solo en Producción para evitar cobros dobles)
     # Si ya tiene guía, devolvemos la existente y no llamamos a Servientrega
-    if SERVI_USE_PRODUCTION and picking.get("carrier_tracking_ref"):
-        guia = picking["carrier_tracking_ref"]
-        url = f"https://www.servientrega.com/rastreo/{guia}"
-        logger.info(
-            "⚠️ El picking %s ya tiene guía: %s. Saltando duplicado.", picking_id, guia
-        )
-        return (
-            jsonify(
-                {
-                    "ok": True,
-                    "guia": guia,
-                    "url": url,
-                    "message": "Guía ya existente en Odoo. No se generó una nueva.",
-                }
-            ),
-            200,
-        )
+    clave_guia = shared_cache.clave(tenant.nombre, picking_id)
+    guia_existente = picking.get("carrier_tracking_ref")
+    if tenant.servi_produccion and not guia_existente:
+        # Cubre la ventana en que otro worker ya creó (o está creando) la guía y aún no quedó en Odoo
+        emitida = shared_cache.get("guia", clave_guia)
+        guia_existente = None if emitida is shared_cache.FALTA else emitida
+    if tenant.servi_produccion and guia_existente:
+        if not picking.get("carrier_tracking_ref") and guia_existente != GUIA_EN_CURSO:
+            # Guía creada en Servientrega que no quedó en Odoo: el reintento la completa
+            return completar_guia_pendiente(picking_id, guia_existente)
+        return respuesta_guia_existente(picking_id, guia_existente)
 
     # 🏁 VALIDACIÓN: ¿Es Servientrega?
     # En producción solo usamos carrier_id. En pruebas usamos carrier_id O el check.
@@ -644,8 +1478,8 @@ def webhook():
             es_carrier = True
 
     es_check = False
-    if not USE_PRODUCTION:
-        es_check = picking.get("x_studio_servientrega")
+    if not tenant.odoo_produccion:
+        es_check = picking.get(CAMPOS["check_servientrega"])
 
     if not (es_carrier or es_check):
         logger.info(
@@ -655,10 +1489,9 @@ def webhook():
         )
         return jsonify({"ok": True, "skipped": True}), 200
 
-    partner = safe_read_one(
-        "res.partner",
+    partner = leer_partner(
         picking["partner_id"][0],
-        ["name", "street", "city", "phone", "mobile", "vat"],
+        ["name", "street", "city", "state_id", "phone", "mobile", "vat"],
     )
 
     if not partner:
@@ -687,41 +1520,24 @@ def webhook():
         [m["product_id"][1] for m in moves if m.get("product_id")],
     )
 
-    nombres_cortos = []
-    for m in moves:
-        if m.get("product_id"):
-            full_name = m["product_id"][1]
-
-            # 1. Intentar tomar lo que hay después del ]
-            if "]" in full_name:
-                name_after_bracket = full_name.split("]", 1)[1].strip()
-            else:
-                name_after_bracket = full_name.strip()
-
-            # 2. Tomar las dos primeras palabras
-            words = name_after_bracket.split()
-            short_name = " ".join(words[:2])
-
-            if short_name:
-                nombres_cortos.append(short_name)
-
-    # Unir productos y recortar a 50 caracteres (Límite de la API)
-    contenido = ", ".join(nombres_cortos)[:50]
-
-    if not contenido:
-        contenido = "MERCANCIA GENERAL"
+    contenido = derivar_contenido(moves)
 
     logger.info("📦 Contenido final para la guía: %s", contenido)
 
-    # 📦 DETECCIÓN DE PAQUETES (Múltiples bultos) - USANDO packages_count
-    # Como el JSON no puede traer los IDs de paquetes de otros modelos,
-    # usamos el contador para generar bultos virtuales.
+    # 📦 DETECCIÓN DE PAQUETES (Múltiples bultos)
+    # 1. Paquetes reales (stock.quant.package) con peso y dimensiones, en lote
+    paquetes_info = hidratar_paquetes(picking.get("move_line_ids"))
+    if paquetes_info:
+        logger.info(
+            "📦 %s paquetes reales: %s",
+            len(paquetes_info),
+            [(p["name"], p["peso"], p["alto"], p["ancho"], p["largo"]) for p in paquetes_info],
+        )
 
-    # 1. Obtener el número de paquetes del JSON o consultarlo a Odoo
-    # 1. Obtener el número de paquetes del JSON o consultarlo a Odoo
+    # 2. Si no hay paquetes reales, usamos el contador para generar bultos virtuales
     num_paquetes = int(picking.get(CAMPOS["contador_paquetes"]) or 0)
 
-    if num_paquetes == 0:
+    if num_paquetes == 0 and not paquetes_info:
         # Si el JSON no trae el contador, consultamos a Odoo directamente
         logger.info(
             "🔍 %s=0 en JSON. Consultando Odoo directamente...",
@@ -734,16 +1550,27 @@ def webhook():
             num_paquetes = int(fresh_picking.get(CAMPOS["contador_paquetes"]) or 0)
             logger.info("📊 %s en Odoo: %s", CAMPOS["contador_paquetes"], num_paquetes)
 
-    # 2. Generar paquetes virtuales si hay bultos
-    paquetes_info = []
-    if num_paquetes > 0:
+    if not paquetes_info and num_paquetes > 0:
         logger.info("📦 Generando %s bultos virtuales", num_paquetes)
         for i in range(1, num_paquetes + 1):
             paquetes_info.append({"name": f"Caja {i}", "id": i})
         logger.info("📦 Bultos generados: %s", [p["name"] for p in paquetes_info])
-    else:
+    elif not paquetes_info:
         logger.warning("⚠️ packages_count=0. Se enviará como 1 sola pieza.")
 
+    # 🛂 PRE-VALIDACIÓN: todos los errores en una pasada, antes del round trip SOAP
+    errores = validate_picking(picking, partner.get("id"))
+    errores += validar_envio(
+        picking,
+        partner,
+        contenido,
+        paquetes_info,
+        valor_total,
+        num_paquetes=num_paquetes,
+    )
+    if errores:
+        return error_response("validation_failed", errores, 400)
+
     ws22_payload = construir_payload_ws22(
         picking,
         partner,
@@ -751,24 +1578,163 @@ def webhook():
         contenido=contenido,
         paquetes_info=paquetes_info,
     )
-    envio = enviar_ws22_test(ws22_payload)
+    # Reclamo atómico del picking justo antes de crear la guía: de dos requests duplicados
+    # concurrentes solo uno llama a CargueMasivoExterno
+    if tenant.servi_produccion and not shared_cache.reclamar(
+        "guia", clave_guia, GUIA_EN_CURSO, shared_cache.TTL_RECLAMO
+    ):
+        emitida = shared_cache.get("guia", clave_guia)
+        return respuesta_guia_existente(
+            picking_id, GUIA_EN_CURSO if emitida is shared_cache.FALTA else emitida
+        )
 
-    resultado = parsear_respuesta_ws22_xml(envio["raw"])
+    try:
+        envio = enviar_ws22_test(ws22_payload, picking_id)
+    except requests.RequestException as e:
+        # Resultado desconocido (la guía pudo quedar creada): el reclamo se deja vencer
+        logger.error("❌ Error HTTP hacia WS22: %s", str(e))
+        dead_letter.registrar(
+            picking_id,
+            dead_letter.ETAPA_WS22_HTTP,
+            str(e),
+            {"payload": payload},
+            tenant=tenant.nombre,
+        )
+        return jsonify({"ok": False, "detail": {"error": "ws22_http", "mensaje": str(e)}}), 502
+
+    legible = True
+    try:
+        resultado = parsear_respuesta_ws22_xml(envio["raw"])
+    except Exception as e:
+        # Respuesta ilegible (HTML de error, XML truncado): se archiva y va a dead letters
+        logger.error("❌ Respuesta WS22 ilegible (HTTP %s): %s", envio["status"], str(e))
+        resultado = {"ok": False, "mensaje": f"Respuesta WS22 ilegible (HTTP {envio['status']}): {e}"}
+        legible = False
+    soap_archive.registrar(
+        "CargueMasivoExterno",
+        envio["request"],
+        envio["raw"],
+        picking_id=picking_id,
+        guia=resultado.get("guia"),
+        http_status=envio["status"],
+    )
 
     if resultado.get("ok"):
-        guia = resultado["guia"]
-        url = f"https://www.servientrega.com/rastreo/{guia}"
+        return finalizar_guia(picking_id, resultado["guia"])
+
+    if tenant.servi_produccion and legible:
+        # WS22 rechazó el envío (no hay guía): se libera el reclamo para poder reintentar
+        shared_cache.delete("guia", clave_guia)
+    dead_letter.registrar(
+        picking_id,
+        dead_letter.ETAPA_WS22,
+        resultado.get("mensaje"),
+        {"payload": payload},
+        tenant=tenant.nombre,
+    )
+    return jsonify({"ok": False, "detail": resultado}), 502
 
-        # Generar PDF de la guía
+
+# --------------------------------------------------
+# DEAD LETTERS (REPROCESO MASIVO)
+# --------------------------------------------------
+def _reprocesar_entrada(entrada: dict):
+    """Reprocesa una dead letter con los clientes de su tenant. Retorna (ok, detalle)."""
+    tenant = tenants.obtener(entrada.get("tenant"))
+    if not tenant:
+        return False, {"error": "unknown_tenant", "detail": entrada.get("tenant")}
+    with tenants.activar(tenant):
+        return _reprocesar_etapa(entrada)
+
+
+def _reprocesar_etapa(entrada: dict):
+    picking_id = entrada["picking_id"]
+    inputs = entrada.get("inputs") or {}
+    etapa = entrada["etapa"]
+
+    if etapa == dead_letter.ETAPA_PERSISTENCIA:
+        # La guía ya existe en Servientrega: solo se reintenta escribirla en Odoo
+        guia, url = inputs["guia"], inputs["url"]
+        pdf_base64, error_pdf = obtener_pdf_guia(guia)
+        ok = persistir_resultado_ws22(
+            picking_id, guia, url, pdf_base64, estado_etiqueta="error" if error_pdf else None
+        )
+        if ok and error_pdf:
+            dead_letter.registrar(
+                picking_id, dead_letter.ETAPA_STICKER, error_pdf, {"guia": guia}, tenant=_tenant()
+            )
+        return ok, {"guia": guia}
+
+    if etapa == dead_letter.ETAPA_STICKER:
+        guia = inputs["guia"]
         pdf_result = generar_pdf_guia(guia)
-        pdf_base64 = pdf_result.get("pdf_base64") if pdf_result.get("ok") else None
+        if not pdf_result.get("ok"):
+            return False, pdf_result
+        ok = adjuntar_pdf_guia(picking_id, guia, pdf_result["pdf_base64"])
+        if ok:
+            _marcar_estado_etiqueta(picking_id, guia, "adjunta")
+        return ok, {"guia": guia}
+
+    with app.app_context():
+        resp, code = procesar_picking(picking_id, inputs.get("payload") or {"id": picking_id})
+    return code == 200, resp.get_json()
+
+
+def reprocesar_dead_letters(
+    ids=None,
+    error_class=None,
+    etapa=None,
+    limit=500,
+    concurrencia=dead_letter.DEAD_LETTER_CONCURRENCY,
+    por_segundo=dead_letter.DEAD_LETTER_RATE,
+    tenant=None,
+):
+    entradas = dead_letter.listar("pendiente", error_class, etapa, ids, limit, tenant=tenant)
+    logger.info("📮 Reprocesando %s dead letters", len(entradas))
+    return dead_letter.reprocesar(entradas, _reprocesar_entrada, concurrencia, por_segundo)
+
 
-        persistir_resultado_ws22(picking_id, guia, url, pdf_base64)
+@app.get("/dead-letter")
+def get_dead_letters():
+    return (
+        jsonify(
+            {
+                "summary": dead_letter.resumen(),
+                "entries": dead_letter.listar(
+                    request.args.get("estado", "pendiente") or None,
+                    request.args.get("error_class"),
+                    request.args.get("etapa"),
+                    limit=int(request.args.get("limit", "100")),
+                    tenant=request.args.get("tenant"),
+                ),
+            }
+        ),
+        200,
+    )
 
-        return jsonify({"ok": True, "guia": guia, "url": url}), 200
 
-    return jsonify({"ok": False, "detail": resultado}), 502
+@app.post("/dead-letter/replay")
+def replay_dead_letters():
+    body = request.get_json(silent=True) or {}
+    if not (body.get("ids") or body.get("error_class") or body.get("etapa")):
+        return error_response(
+            "missing_filter", "Indique 'ids', 'error_class' o 'etapa' para reprocesar", 400
+        )
+    try:
+        out = reprocesar_dead_letters(
+            ids=body.get("ids"),
+            error_class=body.get("error_class"),
+            etapa=body.get("etapa"),
+            limit=int(body.get("limit", 500)),
+            tenant=body.get("tenant"),
+            concurrencia=int(body.get("concurrency", dead_letter.DEAD_LETTER_CONCURRENCY)),
+            por_segundo=float(body.get("rate", dead_letter.DEAD_LETTER_RATE)),
+        )
+    except (TypeError, ValueError) as e:
+        return error_response("invalid_replay_params", str(e), 400)
+    return jsonify(out), 200
 
 
 if __name__ == "__main__":
+    iniciar_hilos_de_fondo()
     app.run(host="0.0.0.0", port=PORT, debug=False, use_reloader=False)
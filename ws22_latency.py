@@ -0,0 +1,196 @@
+import os
+import time
+import logging
+import threading
+import contextvars
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from typing import Any, Callable, Deque, Dict, Optional
+
+import requests
+
+import settings
+
+log = logging.getLogger("ws22_latency")
+
+# Latencia por operación WS22 (ventana móvil por proceso) → timeouts adaptativos y hedging.
+# Factor, mínimo y hedging salen de settings.actual() (recargables); la ventana define el
+# tamaño de las colas de muestras y requiere reinicio.
+WS22_LATENCY_WINDOW = int(os.getenv("WS22_LATENCY_WINDOW", "200"))  # muestras por operación
+
+# Solo operaciones de lectura: repetirlas no crea nada en Servientrega.
+# CargueMasivoExterno (crear guía) NUNCA va aquí: un segundo intento crea otra guía.
+IDEMPOTENTES = {"GenerarGuiaSticker"}
+
+
+class Operacion:
+    """Ventana de latencias y contadores de una operación WS22."""
+
+    def __init__(self, nombre: str):
+        self.nombre = nombre
+        self.muestras: Deque[float] = deque(maxlen=WS22_LATENCY_WINDOW)
+        self.lock = threading.Lock()
+        self.llamadas = 0
+        self.errores = 0
+        self.hedges = 0
+        self.hedges_ganados = 0
+
+    def registrar(self, segundos: float) -> None:
+        with self.lock:
+            self.muestras.append(segundos)
+
+    def percentil(self, p: float) -> Optional[float]:
+        with self.lock:
+            if len(self.muestras) < settings.actual().ws22_latency_min_samples:
+                return None
+            ordenadas = sorted(self.muestras)
+        return ordenadas[min(len(ordenadas) - 1, int(p / 100.0 * len(ordenadas)))]
+
+    def timeout(self, base: float) -> float:
+        """p95 x WS22_TIMEOUT_FACTOR, acotado a [WS22_TIMEOUT_MIN, base]. Sin datos: base."""
+        p95 = self.percentil(95)
+        if p95 is None or self.nombre not in IDEMPOTENTES:
+            return base
+        cfg = settings.actual()
+        return min(base, max(cfg.ws22_timeout_min, p95 * cfg.ws22_timeout_factor))
+
+    def puede_hedge(self) -> bool:
+        with self.lock:
+            return self.hedges < settings.actual().ws22_hedge_max_ratio * max(self.llamadas, 1)
+
+
+_OPERACIONES: Dict[str, Operacion] = {}
+_ops_lock = threading.Lock()
+_pool: Optional[ThreadPoolExecutor] = None
+
+
+def operacion(nombre: str) -> Operacion:
+    op = _OPERACIONES.get(nombre)
+    if op is None:
+        with _ops_lock:
+            op = _OPERACIONES.setdefault(nombre, Operacion(nombre))
+    return op
+
+
+def _executor() -> ThreadPoolExecutor:
+    global _pool
+    if _pool is None:
+        with _ops_lock:
+            if _pool is None:
+                _pool = ThreadPoolExecutor(
+                    max_workers=settings.actual().ws22_hedge_workers, thread_name_prefix="ws22-hedge"
+                )
+    return _pool
+
+
+def _redimensionar_executor(anterior, nuevo) -> None:
+    """Recarga de WS22_HEDGE_WORKERS: los intentos nuevos van a un pool del tamaño nuevo."""
+    global _pool
+    if anterior.ws22_hedge_workers == nuevo.ws22_hedge_workers:
+        return
+    with _ops_lock:
+        viejo, _pool = _pool, None
+    if viejo is not None:
+        # Sin cancelar: los intentos en curso terminan en el pool anterior
+        viejo.shutdown(wait=False)
+        log.info("🔧 Pool de hedging WS22: %s hilos", nuevo.ws22_hedge_workers)
+
+
+settings.suscribir(_redimensionar_executor)
+
+
+def _medido(op: Operacion, fn: Callable[[float], Any], timeout: float) -> Any:
+    inicio = time.monotonic()
+    try:
+        resultado = fn(timeout)
+    except requests.Timeout:
+        # Se registra el tiempo agotado: si WS22 se vuelve lento, el p95 (y el timeout) sube
+        op.registrar(time.monotonic() - inicio)
+        raise
+    op.registrar(time.monotonic() - inicio)
+    return resultado
+
+
+def ejecutar(
+    nombre: str,
+    fn: Callable[[float], Any],
+    base_timeout: float,
+    aceptar: Optional[Callable[[Any], bool]] = None,
+) -> Any:
+    """
+    Ejecuta fn(timeout) midiendo su latencia. En operaciones IDEMPOTENTES el timeout es
+    adaptativo y, si el primer intento supera el p95 observado, se lanza un segundo intento:
+    gana el primero que responde (y que `aceptar` da por bueno). Las demás operaciones solo
+    se miden: un intento, timeout fijo, en el hilo que llama.
+    """
+    op = operacion(nombre)
+    with op.lock:
+        op.llamadas += 1
+    timeout = op.timeout(base_timeout)
+    p95 = op.percentil(95)
+
+    if nombre not in IDEMPOTENTES or not settings.actual().ws22_hedge_enabled or p95 is None:
+        try:
+            return _medido(op, fn, timeout)
+        except Exception:
+            with op.lock:
+                op.errores += 1
+            raise
+
+    pool = _executor()
+    # Un contexto por intento: el cliente WS22 del tenant viaja en contextvars
+    primero = pool.submit(contextvars.copy_context().run, _medido, op, fn, timeout)
+    intentos = [primero]
+    hechos, _ = wait(intentos, timeout=p95)
+    if not hechos and op.puede_hedge():
+        with op.lock:
+            op.hedges += 1
+        log.info("🔀 %s lleva más de %.1fs (p95): segundo intento en paralelo", nombre, p95)
+        intentos.append(pool.submit(contextvars.copy_context().run, _medido, op, fn, timeout))
+
+    pendientes = set(intentos)
+    ultimo_resultado, ultimo_error = None, None
+    while pendientes:
+        hechos, pendientes = wait(pendientes, timeout=timeout + p95 + 1, return_when=FIRST_COMPLETED)
+        if not hechos:
+            break
+        for f in hechos:
+            try:
+                resultado = f.result()
+            except Exception as e:
+                ultimo_error = e
+                continue
+            if aceptar is None or aceptar(resultado):
+                if f is not primero:
+                    with op.lock:
+                        op.hedges_ganados += 1
+                return resultado
+            ultimo_resultado = resultado
+
+    with op.lock:
+        op.errores += 1
+    if ultimo_resultado is not None:
+        return ultimo_resultado
+    raise ultimo_error or requests.Timeout(f"{nombre}: sin respuesta en {timeout:.1f}s")
+
+
+def metricas() -> Dict[str, Dict[str, Any]]:
+    out = {}
+    for nombre, op in sorted(_OPERACIONES.items()):
+        p50, p95 = op.percentil(50), op.percentil(95)
+        with op.lock:
+            llamadas, hedges, ganados, errores = op.llamadas, op.hedges, op.hedges_ganados, op.errores
+            muestras = len(op.muestras)
+        out[nombre] = {
+            "llamadas": llamadas,
+            "errores": errores,
+            "muestras": muestras,
+            "p50_ms": round(p50 * 1000, 1) if p50 is not None else None,
+            "p95_ms": round(p95 * 1000, 1) if p95 is not None else None,
+            "hedge": nombre in IDEMPOTENTES and settings.actual().ws22_hedge_enabled,
+            "hedges": hedges,
+            "hedge_rate": round(hedges / llamadas, 4) if llamadas else 0.0,
+            "hedges_ganados": ganados,
+            "hedge_win_rate": round(ganados / hedges, 4) if hedges else 0.0,
+        }
+    return out